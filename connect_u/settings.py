@@ -36,6 +36,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     # Наши приложения
     'connect_u_app.apps.ConnectUAppConfig',
@@ -148,15 +149,86 @@ DJOSER = {
     'LOGIN_FIELD': 'email',
 }
 
+REDIS_HOST = os.environ.get('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.environ.get('REDIS_PORT', 6379))
+
 CHANNEL_LAYERS = {
     'default': {
         'BACKEND': 'channels_redis.core.RedisChannelLayer',
         'CONFIG': {
-            "hosts": [('redis', 6379)],
+            "hosts": [(REDIS_HOST, REDIS_PORT)],
         },
     },
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/1',
+    },
+    # HTML карточек анкет (connect_u_app/fragments.py): отдельная база, чтобы вытеснение не трогало колоды и сессии.
+    # FRAGMENT_CACHE_BACKEND=locmem - кэш в памяти процесса (тесты, запуск без Redis)
+    'fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'card-fragments',
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    } if os.environ.get('FRAGMENT_CACHE_BACKEND') == 'locmem' else {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': f'redis://{REDIS_HOST}:{REDIS_PORT}/2',
+    },
+}
+
+# Кэш HTML карточек анкет (connect_u_app/fragments.py)
+FRAGMENT_CACHE_ALIAS = 'fragments'
+FRAGMENT_CACHE_TTL = 60 * 60 * 6  # секунд, не больше суток: в карточке показывается возраст
+# Колода кандидатов для ленты (connect_u_app/deck.py)
+DECK_TTL = 60 * 30  # секунд
+DECK_SIZE = 500
+FEED_PAGE_SIZE = 9
+# Буфер следующих карточек для лайк/дизлайк (connect_u_app/recommendations.py)
+NEXT_BUFFER_SIZE = 20
+NEXT_BUFFER_TTL = 60 * 10  # секунд
+# Фильтр Блума "уже оценены" для ленты и буфера (connect_u_app/bloom.py)
+SEEN_FILTER_CAPACITY = 2000  # свайпов; у активных пользователей фильтр пересобирается больше
+SEEN_FILTER_FP_RATE = 0.01
+SEEN_FILTER_TTL = 60 * 60 * 24  # секунд
+# Максимум свайпов в одном запросе POST /api/v1/interactions/batch/
+SWIPE_BATCH_MAX = 100
+# Страница GET /api/v1/profiles/ (по умолчанию и максимум для ?limit=)
+PROFILES_PAGE_SIZE = 50
+PROFILES_MAX_PAGE_SIZE = 200
+# Поиск пользователей (connect_u_app/search.py)
+SEARCH_CONFIG = 'russian'  # после смены выполнить manage.py rebuild_search_vectors
+SEARCH_PAGE_SIZE = 20
+SEARCH_SUGGEST_LIMIT = 8
+SEARCH_SUGGEST_TIMEOUT_MS = 150  # бюджет запроса подсказок
+# Коллаборативная модель (connect_u_app/collaborative.py), обучается manage.py train_recommender
+RECOMMENDER_MODEL_DIR = BASE_DIR / 'recommender'
+RECOMMENDER_FACTORS = 32
+# История чата (connect_u_app/chat.py)
+CHAT_PAGE_SIZE = 30
+# Отложенная запись сообщений: рассылка сразу, INSERT пачкой раз в интервал или по набору пачки
+CHAT_WRITE_BEHIND = os.environ.get('CHAT_WRITE_BEHIND', '') == '1'
+CHAT_FLUSH_INTERVAL_MS = 20
+CHAT_FLUSH_BATCH = 200
+CHAT_FLUSH_MAX_ATTEMPTS = 5  # попыток записи сообщения при ошибках базы, потом оно отбрасывается
+CHAT_FLUSH_RETRY_DELAY = 1  # секунд, умножается на номер попытки
+# Статус онлайн (connect_u_app/presence.py) и индикатор набора текста
+PRESENCE_TTL = 60  # секунд без heartbeat до офлайна
+PRESENCE_HEARTBEAT = 25  # как часто клиент шлет heartbeat
+TYPING_THROTTLE = 3  # секунд между событиями typing от одного сокета
+# Фоновая обработка фотографий (connect_u_app/images.py)
+IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))  # 0 - обрабатывать прямо в запросе
+PHOTO_MAX_SIZE = 1024
+PHOTO_VARIANTS = {'card': 512, 'tile': 256, 'avatar': 96}
+# Загрузки: всегда во временный файл, а не в память; лимит пикселей проверяется по заголовку
+FILE_UPLOAD_HANDLERS = ['django.core.files.uploadhandler.TemporaryFileUploadHandler']
+PHOTO_MAX_PIXELS = 40_000_000
+# Загрузка по частям (connect_u_app/uploads.py); часть должна пролезать в client_max_body_size nginx
+CHUNKED_UPLOAD_DIR = BASE_DIR / 'uploads_tmp'
+CHUNKED_UPLOAD_MAX_CHUNK = 5 * 1024 * 1024
+PHOTO_UPLOAD_MAX_SIZE = 30 * 1024 * 1024
+
 if DEBUG:
     CORS_ALLOW_ALL_ORIGINS = True
 else:
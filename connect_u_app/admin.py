@@ -1,6 +1,6 @@
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin
-from .models import User, UserProfile, Photo, Interest, Like, Dislike, Match, Message
+from .models import User, UserProfile, Photo, Interest, Interaction, Like, Dislike, Match, Message, UserStats
 
 class CustomUserAdmin(UserAdmin):
     model = User
@@ -22,6 +22,25 @@ class MatchAdmin(admin.ModelAdmin):
     list_display = ('user1', 'user2', 'created_at')
     search_fields = ('user1__username', 'user2__username')
 
+class InteractionAdmin(admin.ModelAdmin):
+    list_display = ('from_user', 'to_user', 'reaction', 'created_at')
+    list_filter = ('reaction',)
+    search_fields = ('from_user__username', 'to_user__username')
+
+class ReactionAdmin(InteractionAdmin):
+    # Like/Dislike - представления над Interaction только для чтения
+    list_filter = ()
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+class UserStatsAdmin(admin.ModelAdmin):
+    list_display = ('user', 'likes_given', 'likes_received', 'dislikes_given', 'matches_count')
+    search_fields = ('user__email',)
+
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('match', 'sender', 'timestamp')
     list_filter = ('match',)
@@ -34,5 +53,7 @@ admin.site.register(Photo, PhotoAdmin)
 admin.site.register(Interest, InterestAdmin)
 admin.site.register(Match, MatchAdmin)
 admin.site.register(Message, MessageAdmin)
-admin.site.register(Like)
-admin.site.register(Dislike)
+admin.site.register(UserStats, UserStatsAdmin)
+admin.site.register(Interaction, InteractionAdmin)
+admin.site.register(Like, ReactionAdmin)
+admin.site.register(Dislike, ReactionAdmin)
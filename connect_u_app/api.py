@@ -1,18 +1,26 @@
 # connect_u_app/api.py
 
 from django.db import models
+from django.db.models import F
+from django.http import Http404
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 
-from .models import User, UserProfile, Photo, Interaction, Match
+from .models import User, UserProfile, Photo, PhotoUpload, Interaction, Match
 from .serializers import (
     UserProfileSerializer,
     UserSerializer,
     PhotoSerializer,
+    PhotoUploadSerializer,
     InteractionSerializer,
     MatchSerializer,
+    MessageSerializer,
+    SwipeSerializer,
+    SwipeBatchSerializer,
+    ProfileSerializer,
 )
+from . import chat, swipes, deck, uploads
 
 class UserProfileViewSet(viewsets.ModelViewSet):
     queryset = UserProfile.objects.all()
@@ -37,7 +45,70 @@ class PhotoViewSet(viewsets.ModelViewSet):
     def perform_create(self, serializer):
         serializer.save(user=self.request.user)
 
-class InteractionViewSet(viewsets.ModelViewSet):
+class PhotoUploadViewSet(viewsets.GenericViewSet):
+    """
+    Загрузка фото по частям с докачкой:
+    POST {filename, size} -> id; PUT /<id>/ с Content-Range и телом части -> offset;
+    GET /<id>/ -> offset после обрыва; POST /<id>/complete/ -> созданное фото.
+    """
+    serializer_class = PhotoUploadSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return PhotoUpload.objects.filter(user=self.request.user)
+
+    @staticmethod
+    def _error(exc):
+        # offset известен - клиенту нужно продолжить с него
+        if exc.offset is not None:
+            return Response({'detail': str(exc), 'offset': exc.offset}, status=status.HTTP_409_CONFLICT)
+        return Response({'detail': str(exc)}, status=status.HTTP_400_BAD_REQUEST)
+
+    def create(self, request):
+        serializer = self.get_serializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        try:
+            upload = uploads.start_upload(request.user, **serializer.validated_data)
+        except uploads.UploadError as exc:
+            return self._error(exc)
+        data = self.get_serializer(upload).data
+        data['chunk_size'] = uploads.CHUNKED_UPLOAD_MAX_CHUNK
+        return Response(data, status=status.HTTP_201_CREATED)
+
+    def retrieve(self, request, pk=None):
+        return Response(self.get_serializer(self.get_object()).data)
+
+    def update(self, request, pk=None):
+        try:
+            # Тело читаем из потока кусками, request.data не трогаем
+            upload = uploads.append_chunk(pk, request.user, request.META.get('HTTP_CONTENT_RANGE'), request.stream)
+        except PhotoUpload.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            return self._error(exc)
+        return Response({'id': upload.pk, 'offset': upload.offset, 'size': upload.size})
+
+    def destroy(self, request, pk=None):
+        upload = self.get_object()
+        uploads.cancel_upload(upload)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    @action(detail=True, methods=['post'])
+    def complete(self, request, pk=None):
+        try:
+            photo = uploads.complete_upload(pk, request.user)
+        except PhotoUpload.DoesNotExist:
+            raise Http404
+        except uploads.UploadError as exc:
+            return self._error(exc)
+        return Response(PhotoSerializer(photo, context={'request': request}).data, status=status.HTTP_201_CREATED)
+
+
+class InteractionViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    Свои реакции - только чтение. Записываются они только действиями swipe и batch
+    через swipes.py: блокировка пары, мэтч, счетчики UserStats и фильтр просмотренных.
+    """
     queryset = Interaction.objects.all()
     serializer_class = InteractionSerializer
     permission_classes = [permissions.IsAuthenticated]
@@ -45,8 +116,48 @@ class InteractionViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         return Interaction.objects.filter(from_user=self.request.user) # Исправлено на from_user
 
-    def perform_create(self, serializer):
-        serializer.save(from_user=self.request.user) # Исправлено на from_user
+    @action(detail=False, methods=['post'])
+    def swipe(self, request):
+        """Лайк/дизлайк с проверкой мэтча в одной транзакции (тот же сервис, что и у HTMX-вьюх)."""
+        serializer = SwipeSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = swipes.swipe(
+            request.user.id,
+            serializer.validated_data['to_user_id'],
+            serializer.validated_data['reaction'],
+        )
+        if not result.recorded:
+            return Response({'detail': 'Пользователь не найден.'}, status=status.HTTP_404_NOT_FOUND)
+
+        return Response({
+            'is_match': result.is_match,
+            'match_id': result.match_id,
+            'match_created': result.match_created,
+        })
+
+    @action(detail=False, methods=['post'])
+    def batch(self, request):
+        """
+        Пачка свайпов за один запрос. Возвращает только новые мэтчи и
+        следующую страницу кандидатов из колоды (cursor - из прошлого ответа).
+        """
+        serializer = SwipeBatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+
+        result = swipes.swipe_batch(request.user.id, serializer.validated_data['swipes'])
+
+        new_matches = Match.objects.filter(id__in=result.new_match_ids).select_related('user1', 'user2')
+        page = deck.get_page(request.user, cursor=serializer.validated_data.get('cursor'))
+        # Интересы уже загружены вместе с карточками колоды
+        profiles = [card.profile for card in page]
+
+        return Response({
+            'recorded': len(result.recorded_ids),
+            'new_matches': MatchSerializer(new_matches, many=True).data,
+            'candidates': ProfileSerializer(profiles, many=True).data,
+            'next_cursor': page.next_cursor,
+        })
 
 class MatchViewSet(viewsets.ReadOnlyModelViewSet):
     queryset = Match.objects.all()
@@ -55,4 +166,35 @@ class MatchViewSet(viewsets.ReadOnlyModelViewSet):
 
     def get_queryset(self):
         user = self.request.user
-        return Match.objects.filter(models.Q(user1=user) | models.Q(user2=user))
\ No newline at end of file
+        # Один проход по индексу членства вместо OR по user1/user2; непрочитанные и
+        # время активности берутся из той же строки членства
+        return Match.objects.filter(memberships__user=user).select_related(
+            'user1', 'user2'
+        ).annotate(
+            unread_count=F('memberships__unread_count'),
+            last_activity_at=F('memberships__last_activity_at'),
+        ).order_by('-last_activity_at', '-pk')
+    @action(detail=True, methods=['get'])
+    def messages(self, request, pk=None):
+        """
+        История чата по курсорам: без параметров - последние сообщения,
+        ?before= - более старые, ?since= - новые с момента последней синхронизации.
+        """
+        match = self.get_object()
+        try:
+            limit = int(request.query_params.get('limit', chat.CHAT_PAGE_SIZE))
+        except ValueError:
+            limit = chat.CHAT_PAGE_SIZE
+
+        page = chat.message_history(
+            match,
+            before=request.query_params.get('before'),
+            since=request.query_params.get('since'),
+            limit=limit,
+        )
+        return Response({
+            'results': MessageSerializer(page.object_list, many=True).data,
+            'before': page.before,
+            'since': page.since,
+            'has_newer': page.has_newer,
+        })
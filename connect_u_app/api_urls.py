@@ -1,10 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from . import api_views
+from . import api_views, api
 
 
 router = DefaultRouter()
 router.register(r'profiles', api_views.ProfileViewSet, basename='profile')
+router.register(r'interactions', api.InteractionViewSet, basename='interaction')
+router.register(r'matches', api.MatchViewSet, basename='match')
+router.register(r'photos', api.PhotoViewSet, basename='photo')
+router.register(r'photo-uploads', api.PhotoUploadViewSet, basename='photo-upload')
 
 urlpatterns = [
     path('', include(router.urls)),
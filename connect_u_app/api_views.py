@@ -1,17 +1,134 @@
+import hashlib
+
+from django.conf import settings
+from django.db.models import prefetch_related_objects
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
 from rest_framework import viewsets, permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
 from .models import UserProfile
 from .serializers import ProfileSerializer
 
 
+class ProfileCursorPagination(CursorPagination):
+    """
+    Страницы по курсору в порядке user_id: запрос идет по частичному индексу
+    profile_searchable_user_idx (WHERE user_id > курсор LIMIT n), без OFFSET и
+    COUNT, поэтому стоимость страницы не растет вместе с числом анкет.
+    """
+    ordering = 'user_id'
+    page_size = getattr(settings, 'PROFILES_PAGE_SIZE', 50)
+    page_size_query_param = 'limit'
+    max_page_size = getattr(settings, 'PROFILES_MAX_PAGE_SIZE', 200)
+
+
+def not_modified(request, etag, last_modified=None):
+    """304 (или 412), если у клиента актуальная версия по If-None-Match / If-Modified-Since; иначе None."""
+    response = get_conditional_response(
+        request, etag=etag, last_modified=int(last_modified.timestamp()) if last_modified else None,
+    )
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
+
+
+def set_validators(response, etag, last_modified=None):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified.timestamp())
+    # Ответ зависит от пользователя (JWT), а клиент должен перепроверять его каждый раз
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
 class ProfileViewSet(viewsets.ReadOnlyModelViewSet):
     """
     API эндпоинт, который позволяет просматривать профили пользователей.
     Доступно только чтение (GET-запросы).
-    """
-    queryset = UserProfile.objects.filter(
-        searchable=True,
-        user__is_active=True
-    ).select_related('user').prefetch_related('interests')
 
+    Список - по курсору (ProfileCursorPagination, ?limit=). ?fields=user,full_name
+    оставляет в ответе только эти поля, а ненужные связи (user, interests) не загружаются.
+    Ответы с ETag, деталь еще и с Last-Modified, по UserProfile.updated_at: при
+    совпадении - 304 без сериализации и без загрузки интересов.
+    """
     serializer_class = ProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = ProfileCursorPagination
+    sparse_fields = None  # из ?fields=, заполняется в initial()
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.sparse_fields = self._parse_fields(request.query_params.get('fields'))
+
+    @staticmethod
+    def _parse_fields(value):
+        """Поля из ?fields=a,b в порядке сериализатора; None - все поля."""
+        if not value:
+            return None
+        requested = {name.strip() for name in value.split(',') if name.strip()}
+        unknown = requested - set(ProfileSerializer.Meta.fields)
+        if unknown:
+            raise ValidationError({'fields': f'Unknown fields: {", ".join(sorted(unknown))}'})
+        return [name for name in ProfileSerializer.Meta.fields if name in requested]
+
+    def _wants(self, field):
+        return self.sparse_fields is None or field in self.sparse_fields
+
+    def get_queryset(self):
+        # Служебные колонки в ответ не попадают, а search_vector бывает объемным
+        queryset = UserProfile.objects.filter(
+            searchable=True,
+            user__is_active=True
+        ).defer('search_vector', 'interest_mask')
+        if self._wants('user'):
+            queryset = queryset.select_related('user')
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.sparse_fields)
+        return super().get_serializer(*args, **kwargs)
+
+    def _prefetch(self, profiles):
+        # Интересы - только для ответа с телом: для 304 они не нужны
+        if self._wants('interests'):
+            prefetch_related_objects(profiles, 'interests')
+
+    def _etag(self, profiles, *extra):
+        # Возраст во вложенном user меняется в день рождения без сохранения профиля - отсюда дата
+        parts = [
+            self.request.accepted_renderer.format,
+            ','.join(self.sparse_fields or ()),
+            timezone.now().date().isoformat(),
+            *map(str, extra),
+            *(f'{profile.pk}:{profile.updated_at.timestamp()}' for profile in profiles),
+        ]
+        return quote_etag(hashlib.md5('|'.join(parts).encode()).hexdigest())
+
+    def list(self, request, *args, **kwargs):
+        # Только ETag: анкета, убранная из поиска, пропадает со страницы, не меняя
+        # updated_at оставшихся, и If-Modified-Since вернул бы 304 по ошибке
+        profiles = self.paginate_queryset(self.filter_queryset(self.get_queryset()))
+        etag = self._etag(profiles, self.paginator.has_next, self.paginator.has_previous)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        self._prefetch(profiles)
+        response = self.get_paginated_response(self.get_serializer(profiles, many=True).data)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        profile = self.get_object()
+        etag = self._etag([profile])
+        midnight = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        last_modified = max(profile.updated_at, midnight)
+        response = not_modified(request, etag, last_modified)
+        if response is not None:
+            return response
+
+        self._prefetch([profile])
+        return set_validators(Response(self.get_serializer(profile).data), etag, last_modified)
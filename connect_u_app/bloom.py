@@ -0,0 +1,104 @@
+# connect_u_app/bloom.py
+"""
+Фильтр Блума для целых ID.
+
+Размер считается по ожидаемому числу элементов n и доле ложных срабатываний p:
+m = -n ln p / (ln 2)^2 бит и k = m / n * ln 2 хешей. Позиции битов - двойное
+хеширование h1 + i * h2 поверх splitmix64, одинаковое для одного ID (in) и для
+массива ID в NumPy (add_many, contains_many), поэтому сборка фильтра по
+истории свайпов и проверка пула кандидатов идут векторно, без цикла по Python.
+
+Ложных отрицаний нет: добавленный ID всегда найдется. Ложное срабатывание с
+вероятностью около p - кандидат, которого пользователь не видел, считается
+просмотренным и пропускается.
+"""
+import math
+
+import numpy as np
+
+_MASK = (1 << 64) - 1
+
+
+def _splitmix64(value):
+    value = (value + 0x9E3779B97F4A7C15) & _MASK
+    value = ((value ^ (value >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    value = ((value ^ (value >> 27)) * 0x94D049BB133111EB) & _MASK
+    return value ^ (value >> 31)
+
+
+def _splitmix64_array(values):
+    with np.errstate(over='ignore'):
+        values = values + np.uint64(0x9E3779B97F4A7C15)
+        values = (values ^ (values >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        values = (values ^ (values >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        return values ^ (values >> np.uint64(31))
+
+
+class BloomFilter:
+    def __init__(self, capacity, fp_rate, bits=None, count=0):
+        self.capacity = max(int(capacity), 1)
+        self.fp_rate = fp_rate
+        size = math.ceil(-self.capacity * math.log(fp_rate) / math.log(2) ** 2)
+        self.size = max(8, (size + 7) // 8 * 8)
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.bits = bytearray(bits) if bits is not None else bytearray(self.size // 8)
+        self.count = count
+
+    @classmethod
+    def from_state(cls, state):
+        capacity, fp_rate, count, bits = state
+        return cls(capacity, fp_rate, bits=bits, count=count)
+
+    def state(self):
+        """Компактное представление для кэша."""
+        return self.capacity, self.fp_rate, self.count, bytes(self.bits)
+
+    def _positions(self, value):
+        first = _splitmix64(value & _MASK)
+        step = _splitmix64(first) | 1
+        return [((first + i * step) & _MASK) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for position in self._positions(value):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def update(self, values):
+        for value in values:
+            self.add(value)
+
+    def __contains__(self, value):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(value))
+
+    def _positions_many(self, values):
+        # Матрица позиций (len(values), k), те же, что _positions для каждого ID
+        values = np.asarray(values, dtype=np.int64).astype(np.uint64)
+        first = _splitmix64_array(values)
+        step = _splitmix64_array(first) | np.uint64(1)
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over='ignore'):
+            return (first[:, None] + steps * step[:, None]) % np.uint64(self.size)
+
+    def add_many(self, values):
+        """Добавляет массив ID разом, без цикла по Python (пара к contains_many)."""
+        positions = self._positions_many(values).ravel()
+        if not len(positions):
+            return
+        # Представление поверх self.bits: bitwise_or.at пишет прямо в фильтр, в том числе повторные позиции
+        bits = np.frombuffer(self.bits, dtype=np.uint8)
+        masks = (np.uint64(1) << (positions & np.uint64(7))).astype(np.uint8)
+        np.bitwise_or.at(bits, (positions >> np.uint64(3)).astype(np.intp), masks)
+        self.count += len(values)
+
+    def contains_many(self, values):
+        """Массив bool: для каждого ID - есть ли он (возможно, ложно) в фильтре."""
+        positions = self._positions_many(values)
+        if not len(positions):
+            return np.zeros(0, dtype=bool)
+        bits = np.frombuffer(bytes(self.bits), dtype=np.uint8)
+        found = (bits[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1
+        return found.all(axis=1)
+
+    @property
+    def nbytes(self):
+        return len(self.bits)
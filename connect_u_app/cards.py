@@ -0,0 +1,62 @@
+# connect_u_app/cards.py
+"""
+Карточки анкет для ленты и лайк/дизлайк.
+
+Шаблоны получают готовые Card вместо User: все, что показывает карточка, уже
+загружено - пользователь с профилем одним JOIN и интересы всех карточек одним
+prefetch-запросом. Поэтому страница ленты и ответ на свайп стоят фиксированного
+числа запросов, сколько бы карточек ни было.
+"""
+from dataclasses import dataclass, field
+
+from django.db.models import Exists, OuterRef, Prefetch, prefetch_related_objects
+
+from .models import Interaction, Interest, User
+
+
+@dataclass
+class Card:
+    id: int
+    profile: object  # UserProfile: нужен avatar_picture и сериализаторам API
+    full_name: str
+    age: int = None  # None, если пользователь скрыл возраст
+    city: str = ''  # пусто, если город скрыт
+    interests: list = field(default_factory=list)  # названия интересов
+    html: str = ''  # готовый фрагмент карточки, см. fragments.render_cards
+
+
+def _interests_prefetch():
+    return Prefetch('profile__interests', queryset=Interest.objects.order_by('name'))
+
+
+def build_cards(users):
+    """Card для уже загруженных пользователей (с select_related('profile')); интересы - одним запросом."""
+    users = [user for user in users if hasattr(user, 'profile')]
+    prefetch_related_objects(users, _interests_prefetch())
+    return [
+        Card(
+            id=user.id,
+            profile=user.profile,
+            full_name=user.profile.full_name,
+            age=user.age if user.profile.show_age else None,
+            city=user.profile.city if user.profile.show_city else '',
+            interests=[interest.name for interest in user.profile.interests.all()],
+        )
+        for user in users
+    ]
+
+
+def load_cards(user_ids, viewer_id=None):
+    """
+    Card в порядке user_ids; неактивные и скрытые из поиска пропускаются, а с
+    viewer_id - и уже оцененные им (точная проверка в том же запросе).
+    """
+    users = User.objects.filter(
+        id__in=user_ids,
+        is_active=True,
+        profile__searchable=True,
+    ).select_related('profile')
+    if viewer_id is not None:
+        users = users.exclude(Exists(Interaction.objects.filter(from_user_id=viewer_id, to_user=OuterRef('pk'))))
+    users_by_id = {user.id: user for user in users}
+    return build_cards([users_by_id[user_id] for user_id in user_ids if user_id in users_by_id])
@@ -0,0 +1,327 @@
+# connect_u_app/chat.py
+"""
+История сообщений чата.
+
+Сообщения читаются страницами по ключу (timestamp, id) через индекс
+message_match_timestamp_idx, без OFFSET. Условие курсора записано как
+timestamp <= X AND (timestamp < X OR id < Y): так граница по timestamp
+попадает в условие индекса, и Postgres читает его по порядку до LIMIT.
+
+Страница чата показывает последние CHAT_PAGE_SIZE сообщений, более старые
+догружаются при прокрутке вверх по курсору before. Мобильный клиент
+синхронизирует историю курсором since: получает только сообщения новее
+последнего, которое у него уже есть.
+
+Новые сообщения пишутся через insert_messages: тот же запрос обновляет сводку
+мэтча (последнее сообщение) и строки членства (время активности, непрочитанные),
+поэтому список мэтчей читается без запросов на каждый мэтч. В режиме
+CHAT_WRITE_BEHIND ChatConsumer не пишет каждое сообщение отдельно: сообщение
+сразу рассылается участникам, а в базу попадает пачкой из MessageBuffer.
+"""
+import asyncio
+import atexit
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core import signing
+from django.db import DatabaseError, DataError, IntegrityError, connection, transaction
+from django.db.models import Count, Q, Subquery
+from django.db.models.functions import Coalesce
+
+logger = logging.getLogger(__name__)
+
+CHAT_PAGE_SIZE = getattr(settings, 'CHAT_PAGE_SIZE', 30)
+CHAT_PAGE_MAX = 100
+_CURSOR_SALT = 'connect_u_app.chat'
+
+CHAT_WRITE_BEHIND = getattr(settings, 'CHAT_WRITE_BEHIND', False)
+CHAT_FLUSH_INTERVAL_MS = getattr(settings, 'CHAT_FLUSH_INTERVAL_MS', 20)
+CHAT_FLUSH_BATCH = getattr(settings, 'CHAT_FLUSH_BATCH', 200)
+# Сколько раз пробуем записать сообщение при ошибках базы и пауза перед n-й попыткой (n * задержка)
+CHAT_FLUSH_MAX_ATTEMPTS = getattr(settings, 'CHAT_FLUSH_MAX_ATTEMPTS', 5)
+CHAT_FLUSH_RETRY_DELAY = getattr(settings, 'CHAT_FLUSH_RETRY_DELAY', 1)
+
+# clock_timestamp(), а не now(): у сообщений одной пачки время идет в порядке id
+INSERT_MESSAGES_SQL = """
+WITH incoming AS (
+    SELECT * FROM unnest(%(match_ids)s::bigint[], %(sender_ids)s::bigint[], %(contents)s::text[], %(client_ids)s::uuid[])
+        WITH ORDINALITY AS t(match_id, sender_id, content, client_id, position)
+),
+inserted AS (
+    INSERT INTO {message} (match_id, sender_id, content, timestamp, client_id)
+    SELECT match_id, sender_id, content, clock_timestamp(), client_id FROM incoming ORDER BY position
+    ON CONFLICT (match_id, client_id) DO NOTHING
+    RETURNING id, match_id, sender_id, content, timestamp
+),
+latest AS (
+    SELECT DISTINCT ON (match_id) id, match_id, content, timestamp FROM inserted ORDER BY match_id, id DESC
+),
+summary AS (
+    UPDATE {match} AS m
+    SET last_message_id = l.id, last_message_text = left(l.content, %(preview)s), last_message_at = l.timestamp
+    FROM latest AS l
+    WHERE m.id = l.match_id AND (m.last_message_id IS NULL OR m.last_message_id < l.id)
+),
+activity AS (
+    UPDATE {membership} AS ms
+    SET last_activity_at = GREATEST(ms.last_activity_at, l.timestamp),
+        unread_count = ms.unread_count + (
+            SELECT count(*) FROM inserted AS i WHERE i.match_id = ms.match_id AND i.sender_id <> ms.user_id
+        )
+    FROM latest AS l
+    WHERE ms.match_id = l.match_id
+)
+SELECT id FROM inserted ORDER BY id
+"""
+
+
+@dataclass
+class MessagePage:
+    """Страница истории; object_list всегда по возрастанию времени."""
+    object_list: list
+    before: str = None  # курсор для более старых сообщений, если они есть
+    since: str = None  # курсор последнего сообщения страницы
+    has_newer: bool = False  # при чтении по since вернулись не все новые сообщения
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_older(self):
+        return self.before is not None
+
+
+def encode_cursor(message):
+    return signing.dumps([message.timestamp.isoformat(), message.pk], salt=_CURSOR_SALT)
+
+
+def decode_cursor(cursor):
+    """(timestamp, id) или None для подделанного/битого курсора."""
+    try:
+        timestamp, pk = signing.loads(cursor, salt=_CURSOR_SALT)
+        return datetime.fromisoformat(timestamp), int(pk)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+def message_history(match, before=None, since=None, limit=CHAT_PAGE_SIZE):
+    """
+    Страница сообщений мэтча: последние limit (без курсоров), более старые,
+    чем before, или более новые, чем since (since важнее, если переданы оба).
+    """
+    limit = max(1, min(limit, CHAT_PAGE_MAX))
+    # sender_id хватает, чтобы отличить свои сообщения от чужих, JOIN не нужен
+    messages = match.messages.all()
+
+    after = decode_cursor(since) if since else None
+    if after is not None:
+        timestamp, pk = after
+        rows = list(messages.filter(
+            Q(timestamp__gte=timestamp) & (Q(timestamp__gt=timestamp) | Q(pk__gt=pk))
+        ).order_by('timestamp', 'pk')[:limit + 1])
+        page = MessagePage(object_list=rows[:limit], has_newer=len(rows) > limit)
+        # Пустая страница: клиент продолжает с того же места
+        page.since = encode_cursor(page.object_list[-1]) if page.object_list else since
+        return page
+
+    older = decode_cursor(before) if before else None
+    if older is not None:
+        timestamp, pk = older
+        messages = messages.filter(Q(timestamp__lte=timestamp) & (Q(timestamp__lt=timestamp) | Q(pk__lt=pk)))
+    rows = list(messages.order_by('-timestamp', '-pk')[:limit + 1])
+    object_list = rows[:limit][::-1]
+
+    page = MessagePage(object_list=object_list)
+    if len(rows) > limit:
+        page.before = encode_cursor(object_list[0])
+    if object_list:
+        page.since = encode_cursor(object_list[-1])
+    return page
+
+
+def mark_read(match_id, user_id, message_id=None):
+    """
+    Двигает квитанцию участника вперед до message_id (или до последнего
+    сообщения мэтча, если id не передан). Возвращает новый last_read_message_id
+    или None, если квитанция не изменилась.
+    """
+    from .models import MatchMembership, Message
+
+    # id берется из самого мэтча: чужой или несуществующий id сведется к последнему сообщению до него
+    messages = Message.objects.filter(match_id=match_id)
+    if message_id is not None:
+        messages = messages.filter(pk__lte=message_id)
+    last_id = messages.order_by('-timestamp', '-pk').values_list('pk', flat=True).first()
+    if last_id is None:
+        return None
+
+    # Непрочитанными остаются только сообщения собеседника новее квитанции
+    unread = messages.model.objects.filter(match_id=match_id, pk__gt=last_id).exclude(sender_id=user_id).order_by(
+    ).values('match_id').annotate(total=Count('pk')).values('total')
+    updated = MatchMembership.objects.filter(match_id=match_id, user_id=user_id).filter(
+        Q(last_read_message_id__isnull=True) | Q(last_read_message_id__lt=last_id)
+    ).update(last_read_message_id=last_id, unread_count=Coalesce(Subquery(unread), 0))
+    return last_id if updated else None
+
+
+# --- ОТЛОЖЕННАЯ ЗАПИСЬ (WRITE-BEHIND) ---
+
+def insert_messages(messages):
+    """
+    Пишет сообщения (несохраненные Message) одним запросом вместе со сводкой
+    мэтча и счетчиками участников. Сообщения с уже записанным (match, client_id)
+    пропускаются, поэтому повторная запись безопасна. Возвращает id записанных.
+    """
+    from .models import Match, MatchMembership, Message
+
+    sql = INSERT_MESSAGES_SQL.format(
+        message=Message._meta.db_table,
+        match=Match._meta.db_table,
+        membership=MatchMembership._meta.db_table,
+    )
+    params = {
+        'match_ids': [message.match_id for message in messages],
+        'sender_ids': [message.sender_id for message in messages],
+        'contents': [message.content for message in messages],
+        'client_ids': [str(message.client_id) if message.client_id else None for message in messages],
+        'preview': Match._meta.get_field('last_message_text').max_length,
+    }
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def insert_messages_each(messages):
+    """
+    Запасной путь, если пачка не записалась целиком: по одному сообщению.
+    Сообщения, которые не запишутся никогда (NUL в тексте, мэтч уже удален),
+    пропускаются с записью в лог, чтобы не блокировать остальные. Возвращает
+    сообщения, не записанные из-за ошибки самой базы, - их можно повторить.
+    """
+    connection.close_if_unusable_or_obsolete()
+    retry = []
+    for message in messages:
+        try:
+            # Отдельная транзакция: внешний ключ на мэтч проверяется отложенно, при коммите
+            with transaction.atomic():
+                insert_messages([message])
+        except (ValueError, DataError, IntegrityError):
+            logger.exception('Dropping chat message %s in match %s: it cannot be written',
+                             message.client_id, message.match_id)
+        except DatabaseError:
+            retry.append(message)
+    return retry
+
+
+class MessageBuffer:
+    """
+    Буфер сообщений процесса. Сбрасывается в базу через interval секунд после
+    первого сообщения в буфере или сразу, как только набралось batch_size.
+    Ключ (match_id, client_id) отсекает повтор, пока сообщение в буфере или
+    пишется в базу; после записи повтор отсекает уникальный индекс
+    unique_message_client_id.
+
+    Если пачка не записалась, сообщения пишутся по одному: неисправимые
+    отбрасываются, а при ошибке базы сообщение возвращается в буфер не больше
+    max_attempts раз с растущей паузой, так что буфер не растет без предела.
+    """
+
+    def __init__(self, interval, batch_size, max_attempts=CHAT_FLUSH_MAX_ATTEMPTS, retry_delay=CHAT_FLUSH_RETRY_DELAY):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.pending = {}
+        self.flushing = set()  # ключи пачки, которая сейчас пишется в базу
+        self.attempts = {}  # ключ -> число неудачных попыток записи
+        self._timer = None
+        self._tasks = set()
+
+    def add(self, message):
+        """Ставит сообщение в очередь. False - такое сообщение уже ждет записи."""
+        key = (message.match_id, message.client_id)
+        if key in self.pending or key in self.flushing:
+            return False
+        self.pending[key] = message
+
+        if len(self.pending) >= self.batch_size:
+            self._spawn(self.flush())
+        elif self._timer is None:
+            self._timer = self._spawn(self._flush_later())
+        return True
+
+    def _spawn(self, coroutine):
+        # Держим ссылку на задачу, иначе сборщик мусора может снять ее до завершения
+        task = asyncio.get_running_loop().create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _flush_later(self, delay=None):
+        await asyncio.sleep(self.interval if delay is None else delay)
+        self._timer = None
+        await self.flush()
+
+    async def flush(self):
+        """Записывает все, что накопилось. Вызывается и при отключении сокета."""
+        if not self.pending:
+            return
+        batch = self.pending
+        self.pending = {}
+        self.flushing.update(batch)
+        try:
+            try:
+                # Один переход в поток и один INSERT на пачку вместо одного на сообщение
+                await sync_to_async(insert_messages)(list(batch.values()))
+                retry = []
+            except Exception:
+                logger.exception('Could not write %s chat messages in one batch, writing them one by one', len(batch))
+                retry = await sync_to_async(insert_messages_each)(list(batch.values()))
+            self._requeue(batch, retry)
+        finally:
+            # Вернувшиеся в буфер ключи уже снова в pending
+            self.flushing.difference_update(batch)
+
+    def _requeue(self, batch, retry):
+        requeued = {}
+        for message in retry:
+            key = (message.match_id, message.client_id)
+            attempts = self.attempts.get(key, 0) + 1
+            if attempts >= self.max_attempts:
+                logger.error('Dropping chat message %s in match %s after %s failed attempts',
+                             message.client_id, message.match_id, attempts)
+                continue
+            self.attempts[key] = attempts
+            requeued[key] = message
+        for key in batch.keys() - requeued.keys():
+            self.attempts.pop(key, None)
+        if not requeued:
+            return
+
+        # Возвращаем в буфер перед новыми сообщениями и пробуем позже
+        self.pending = {**requeued, **self.pending}
+        if self._timer is None:
+            delay = self.retry_delay * max(self.attempts[key] for key in requeued)
+            self._timer = self._spawn(self._flush_later(delay))
+
+    def flush_sync(self):
+        """Запись остатка при остановке процесса, когда event loop уже не работает."""
+        if self.pending:
+            batch, self.pending = list(self.pending.values()), {}
+            try:
+                insert_messages(batch)
+            except Exception:
+                logger.exception('Could not write %s chat messages in one batch, writing them one by one', len(batch))
+                lost = insert_messages_each(batch)
+                if lost:
+                    logger.error('Lost %s chat messages at shutdown', len(lost))
+
+
+message_buffer = MessageBuffer(CHAT_FLUSH_INTERVAL_MS / 1000, CHAT_FLUSH_BATCH)
+atexit.register(message_buffer.flush_sync)
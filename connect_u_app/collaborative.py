@@ -0,0 +1,196 @@
+# connect_u_app/collaborative.py
+"""
+Коллаборативная фильтрация по графу лайков.
+
+Лайки из Interaction собираются в разреженную матрицу SciPy (кто -> кого),
+нормируются по активности и популярности (D_u^-1/2 R D_i^-1/2) и раскладываются
+усеченным SVD на факторы: user_factors[u] . item_factors[j] - насколько u
+понравится j, как он понравился похожим на u пользователям.
+
+Для знакомств важна взаимность, поэтому оценка кандидата j для u учитывает и
+обратное направление: forward(u -> j) + RECIPROCAL_WEIGHT * forward(j -> u).
+Такие кандидаты чаще дают Match, а не лайк без ответа.
+
+Модель обучается командой train_recommender и пишется в RECOMMENDER_MODEL_DIR
+версиями: каталог с ids.npy, user_factors.npy, item_factors.npy и симлинк
+current на последний, который переключается атомарно. Процессы Daphne и воркеры
+precompute_candidates открывают файлы через np.load(mmap_mode='r'): страницы
+общие в кэше ОС, модель не копируется в память каждого процесса.
+
+Модели Django здесь импортируются внутри функций: модуль загружается в
+процессах пула precompute_candidates.
+"""
+import logging
+import os
+import shutil
+import tempfile
+import time
+from dataclasses import dataclass
+
+import numpy as np
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+RECOMMENDER_MODEL_DIR = str(getattr(settings, 'RECOMMENDER_MODEL_DIR', os.path.join(settings.BASE_DIR, 'recommender')))
+RECOMMENDER_FACTORS = getattr(settings, 'RECOMMENDER_FACTORS', 32)
+RECIPROCAL_WEIGHT = getattr(settings, 'RECIPROCAL_WEIGHT', 0.5)
+# Как часто процесс проверяет, не появилась ли новая версия модели
+RECOMMENDER_RELOAD_INTERVAL = getattr(settings, 'RECOMMENDER_RELOAD_INTERVAL', 60)
+
+CURRENT = 'current'
+MODEL_FILES = ('ids', 'user_factors', 'item_factors')
+
+
+@dataclass
+class Model:
+    ids: np.ndarray  # отсортированные ID пользователей, строки факторов в том же порядке
+    user_factors: np.ndarray
+    item_factors: np.ndarray
+    path: str = ''
+
+    def rows(self, user_ids):
+        """Строки модели для user_ids; -1 - пользователя нет в модели (нет лайков ни от него, ни ему)."""
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        if not len(self.ids):
+            return np.full(len(user_ids), -1)
+        positions = np.minimum(np.searchsorted(self.ids, user_ids), len(self.ids) - 1)
+        return np.where(self.ids[positions] == user_ids, positions, -1)
+
+    def match_scores(self, user_id, candidate_ids=None, rows=None):
+        """
+        Оценки взаимного интереса user_id и кандидатов; неизвестные модели - 0.
+        rows - уже найденные строки кандидатов (self.rows), чтобы не искать их для каждого user_id.
+        """
+        if rows is None:
+            rows = self.rows(candidate_ids)
+        scores = np.zeros(len(rows), dtype=np.float32)
+        row = self.rows([user_id])[0]
+        known = rows >= 0
+        if row < 0 or not known.any():
+            return scores
+        forward = self.item_factors[rows[known]] @ self.user_factors[row]
+        backward = self.user_factors[rows[known]] @ self.item_factors[row]
+        scores[known] = forward + RECIPROCAL_WEIGHT * backward
+        return scores
+
+
+# --- ОБУЧЕНИЕ ---
+
+def like_matrix():
+    """(ids, CSR-матрица лайков) по всем Interaction с reaction=like."""
+    from scipy import sparse
+
+    from .models import Interaction
+
+    likes = Interaction.objects.filter(reaction=Interaction.LIKE).values_list('from_user_id', 'to_user_id')
+    pairs = np.array(list(likes.iterator(chunk_size=10000)), dtype=np.int64).reshape(-1, 2)
+    ids = np.unique(pairs)
+    rows = np.searchsorted(ids, pairs[:, 0])
+    cols = np.searchsorted(ids, pairs[:, 1])
+    matrix = sparse.csr_matrix((np.ones(len(pairs), dtype=np.float32), (rows, cols)), shape=(len(ids), len(ids)))
+    return ids, matrix
+
+
+def train(factors=RECOMMENDER_FACTORS):
+    """Обучает модель по текущим лайкам. None - лайков слишком мало для разложения."""
+    from scipy import sparse
+    from scipy.sparse.linalg import svds
+
+    ids, matrix = like_matrix()
+    factors = min(factors, min(matrix.shape) - 1)
+    if factors < 1 or not matrix.nnz:
+        return None
+
+    # Активные лайкеры и популярные анкеты не должны перетягивать все факторы на себя
+    activity = np.asarray(matrix.sum(axis=1)).ravel()
+    popularity = np.asarray(matrix.sum(axis=0)).ravel()
+    scale_rows = sparse.diags(1 / np.sqrt(np.maximum(activity, 1)))
+    scale_cols = sparse.diags(1 / np.sqrt(np.maximum(popularity, 1)))
+    normalized = (scale_rows @ matrix @ scale_cols).astype(np.float32)
+
+    u, s, vt = svds(normalized, k=factors)
+    root = np.sqrt(s).astype(np.float32)
+    return Model(
+        ids=ids,
+        user_factors=np.ascontiguousarray(u * root, dtype=np.float32),
+        item_factors=np.ascontiguousarray(vt.T * root, dtype=np.float32),
+    )
+
+
+def save(model, model_dir=RECOMMENDER_MODEL_DIR, keep=2):
+    """Пишет новую версию и переключает на нее current. Старые версии сверх keep удаляются."""
+    os.makedirs(model_dir, exist_ok=True)
+    # Имя начинается со времени: по нему же сортируются версии при очистке
+    version = tempfile.mkdtemp(prefix=time.strftime('%Y%m%d%H%M%S-'), dir=model_dir)
+    os.chmod(version, 0o755)
+    for name in MODEL_FILES:
+        np.save(os.path.join(version, f'{name}.npy'), getattr(model, name))
+
+    # Симлинк подменяется rename: читатели видят либо старую версию, либо новую целиком
+    link = os.path.join(model_dir, CURRENT)
+    tmp_link = f'{link}.tmp'
+    if os.path.lexists(tmp_link):
+        os.unlink(tmp_link)
+    os.symlink(os.path.basename(version), tmp_link)
+    os.replace(tmp_link, link)
+
+    # Открытые mmap старых версий продолжают работать и после удаления файлов
+    versions = sorted(entry for entry in os.listdir(model_dir) if os.path.isdir(os.path.join(model_dir, entry))
+                      and not os.path.islink(os.path.join(model_dir, entry)))
+    for stale in versions[:-keep]:
+        shutil.rmtree(os.path.join(model_dir, stale), ignore_errors=True)
+    model.path = version
+    return version
+
+
+# --- ЧТЕНИЕ ---
+
+def current_path(model_dir=RECOMMENDER_MODEL_DIR):
+    link = os.path.join(model_dir, CURRENT)
+    return os.path.realpath(link) if os.path.lexists(link) else None
+
+
+def load(path):
+    arrays = {name: np.load(os.path.join(path, f'{name}.npy'), mmap_mode='r') for name in MODEL_FILES}
+    return Model(path=path, **arrays)
+
+
+_model = None
+_checked_at = None
+
+
+def get_model():
+    """Модель текущего процесса (mmap), перечитывается при смене версии; None - модели нет."""
+    global _model, _checked_at
+    now = time.monotonic()
+    if _checked_at is not None and now - _checked_at < RECOMMENDER_RELOAD_INTERVAL:
+        return _model
+    _checked_at = now
+
+    path = current_path()
+    if path is None:
+        _model = None
+    elif _model is None or _model.path != path:
+        try:
+            _model = load(path)
+        except (OSError, ValueError):
+            logger.exception('Could not load recommender model from %s', path)
+            _model = None
+    return _model
+
+
+def match_scores(user_id, candidate_ids):
+    """
+    Оценки взаимного интереса по текущей модели, отнормированные в [-1, 1]
+    (чтобы складывать с другими оценками); без модели - нули.
+    """
+    model = get_model()
+    if model is None:
+        return np.zeros(len(candidate_ids), dtype=np.float32)
+    return scaled(model.match_scores(user_id, candidate_ids))
+
+
+def scaled(scores):
+    peak = np.abs(scores).max(initial=0)
+    return scores / peak if peak > 0 else scores
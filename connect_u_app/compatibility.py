@@ -0,0 +1,110 @@
+# connect_u_app/compatibility.py
+"""
+Ранжирование кандидатов по общим интересам.
+
+Интересы профиля хранятся еще и битовой маской UserProfile.interest_mask
+(INTEREST_MASK_BITS бит, бит интереса - id % INTEREST_MASK_BITS). Маска
+пересчитывается сигналами при изменении интересов (signals.py), поэтому для
+ранжирования не нужны JOIN по M2M: кандидаты читаются одним запросом вместе с
+масками, а близость считается в NumPy сразу для всех - AND масок, popcount и
+коэффициент Жаккара |A & B| / |A | B| по 64-битным словам.
+
+Пока id интересов меньше INTEREST_MASK_BITS, оценка точная; дальше разные
+интересы могут попасть в один бит, и оценка становится приближенной.
+
+Модели импортируются внутри функций: расчет масок нужен и в процессах пула
+precompute_candidates, где Django не инициализирован.
+"""
+import numpy as np
+
+# Ширина маски UserProfile.interest_mask; после изменения выполнить manage.py rebuild_interest_masks
+INTEREST_MASK_BITS = 256
+INTEREST_MASK_BYTES = INTEREST_MASK_BITS // 8
+
+# popcount байта - для NumPy без bitwise_count (до 2.0)
+_POPCOUNT = np.array([bin(value).count('1') for value in range(256)], dtype=np.uint8)
+
+
+def interest_mask(interest_ids):
+    mask = bytearray(INTEREST_MASK_BYTES)
+    for interest_id in interest_ids:
+        bit = interest_id % INTEREST_MASK_BITS
+        mask[bit // 8] |= 1 << (bit % 8)
+    return bytes(mask)
+
+
+def update_interest_masks(profile_ids):
+    """Пересчитывает interest_mask профилей. Через bulk_update, поэтому сигналы не срабатывают."""
+    from django.utils import timezone
+
+    from .models import UserProfile
+
+    if not profile_ids:
+        return 0
+    interest_ids = {profile_id: [] for profile_id in profile_ids}
+    relations = UserProfile.interests.through.objects.filter(userprofile_id__in=profile_ids)
+    for profile_id, interest_id in relations.values_list('userprofile_id', 'interest_id'):
+        interest_ids[profile_id].append(interest_id)
+
+    # updated_at - вход инкрементального precompute_candidates: bulk_update не трогает auto_now сам
+    now = timezone.now()
+    profiles = [
+        UserProfile(pk=profile_id, interest_mask=interest_mask(ids), updated_at=now)
+        for profile_id, ids in interest_ids.items()
+    ]
+    return UserProfile.objects.bulk_update(profiles, ['interest_mask', 'updated_at'], batch_size=1000)
+
+
+def _normalize(mask):
+    # Маски другой длины (например, после смены INTEREST_MASK_BITS до rebuild_interest_masks) выравниваем
+    mask = bytes(mask)
+    if len(mask) != INTEREST_MASK_BYTES:
+        mask = mask.ljust(INTEREST_MASK_BYTES, b'\0')[:INTEREST_MASK_BYTES]
+    return mask
+
+
+def mask_matrix(masks):
+    """Список масок (bytes) в массив uint64 формы (n, INTEREST_MASK_BYTES // 8): слово на 64 интереса."""
+    raw = b''.join(masks)
+    if len(raw) != len(masks) * INTEREST_MASK_BYTES:
+        raw = b''.join(map(_normalize, masks))
+    return np.frombuffer(raw, dtype=np.uint64).reshape(-1, INTEREST_MASK_BYTES // 8)
+
+
+def _popcount(matrix):
+    if hasattr(np, 'bitwise_count'):
+        counts = np.bitwise_count(matrix)
+    else:
+        counts = _POPCOUNT[matrix.view(np.uint8)]
+    return counts.sum(axis=1, dtype=np.uint16)
+
+
+def jaccard_scores(viewer_mask, matrix):
+    """Коэффициент Жаккара маски зрителя с каждой строкой matrix; без интересов у обоих - 0."""
+    viewer = mask_matrix([viewer_mask])
+    shared = _popcount(matrix & viewer)
+    union = _popcount(matrix | viewer)
+    return np.divide(shared, union, out=np.zeros(len(matrix), dtype=np.float32), where=union > 0)
+
+
+def top_candidates(viewer_mask, candidates, limit, boost=None):
+    """
+    candidates - пары (user_id, interest_mask). Возвращает до limit ID, лучшие
+    по общим интересам первыми. Порядок равных оценок сохраняется из candidates,
+    поэтому случайная выборка перемешивает кандидатов с одинаковой оценкой.
+    boost - необязательные добавки к оценке, по одной на кандидата (collaborative.py).
+    """
+    if not candidates:
+        return []
+    ids = np.fromiter((user_id for user_id, _ in candidates), dtype=np.int64, count=len(candidates))
+    scores = jaccard_scores(viewer_mask, mask_matrix([mask for _, mask in candidates]))
+    if boost is not None:
+        scores = scores + boost
+    if limit < len(scores):
+        # argpartition - O(n): полная сортировка нужна только отобранным
+        top = np.argpartition(-scores, limit - 1)[:limit]
+    else:
+        top = np.arange(len(scores))
+    top = top[np.lexsort((top, -scores[top]))]
+    return ids[top].tolist()
+
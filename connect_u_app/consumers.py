@@ -1,20 +1,51 @@
 import json
+import logging
+import time
+import uuid
 from channels.generic.websocket import AsyncWebsocketConsumer
 from django.contrib.auth import get_user_model
 from asgiref.sync import sync_to_async
 
+from django.conf import settings
+from django.db import DataError, IntegrityError
+
+from . import chat, notifications, presence
+
+logger = logging.getLogger(__name__)
+
+# Индикатор набора текста уходит собеседнику не чаще раза в столько секунд
+TYPING_THROTTLE = getattr(settings, 'TYPING_THROTTLE', 3)
+
 # Мы убрали отсюда импорты моделей и вызов get_user_model(),
 # чтобы избежать ошибки AppRegistryNotReady
 
+def participant_payload(user):
+    """Имя и аватар участника для событий чата."""
+    from .thumbnails import avatar_thumbnail_url
+
+    profile = getattr(user, 'profile', None)
+    if profile is None:
+        return {'sender_name': user.get_username(), 'sender_avatar_url': ''}
+    return {'sender_name': profile.full_name, 'sender_avatar_url': avatar_thumbnail_url(profile, 96)}
+
+
 class ChatConsumer(AsyncWebsocketConsumer):
+    """
+    Чат мэтча. Кадры от клиента различаются полем type:
+    message (по умолчанию) - сообщение, typing - набирает текст,
+    read - квитанция о прочтении, heartbeat - продление статуса онлайн.
+    """
+
     async def connect(self):
-        self.match_id = self.scope['url_route']['kwargs']['match_id']
+        self.match_id = int(self.scope['url_route']['kwargs']['match_id'])
         self.room_group_name = f'chat_{self.match_id}'
         self.user = self.scope['user']
+        self.typing_sent_at = 0
 
-        # Проверяем, что пользователь аутентифицирован и является участником чата
-        is_participant = await self.is_user_participant()
-        if not self.user.is_authenticated or not is_participant:
+        # Мэтч, участники и их имена/аватары читаются один раз на соединение:
+        # дальше каждое сообщение стоит одного запроса к базе
+        self.match = await self.load_chat()
+        if self.match is None:
             await self.close()
             return
 
@@ -25,57 +56,222 @@ class ChatConsumer(AsyncWebsocketConsumer):
         )
         await self.accept()
 
+        # Начальное состояние собеседника: онлайн ли он и что уже прочитал
+        other_online = await sync_to_async(presence.is_online, thread_sensitive=False)(self.other_user_id)
+        await self.send_json({'type': 'presence', 'user_id': self.other_user_id, 'online': other_online})
+        if self.other_last_read_id:
+            await self.send_json({'type': 'read', 'user_id': self.other_user_id, 'message_id': self.other_last_read_id})
+
+        if await sync_to_async(presence.connect, thread_sensitive=False)(self.user.id, self.channel_name):
+            await self.broadcast_presence(True)
+
     async def disconnect(self, close_code):
+        if getattr(self, 'match', None) is None:
+            return  # соединение отклонено в connect
         # Отключаемся от группы WebSocket
         await self.channel_layer.group_discard(
             self.room_group_name,
             self.channel_name
         )
+        if await sync_to_async(presence.disconnect, thread_sensitive=False)(self.user.id, self.channel_name):
+            await self.broadcast_presence(False)
+        # Сообщения этого сокета не должны остаться только в памяти
+        if chat.CHAT_WRITE_BEHIND:
+            await chat.message_buffer.flush()
 
-    # Получение сообщения от клиента (WebSocket)
+    # Получение кадра от клиента (WebSocket)
     async def receive(self, text_data):
-        text_data_json = json.loads(text_data)
-        message_content = text_data_json['message']
+        try:
+            data = json.loads(text_data)
+            frame_type = data.get('type', 'message')
+        except (ValueError, AttributeError):
+            return
 
-        # Сохраняем сообщение в БД
-        new_message = await self.save_message(message_content)
+        if frame_type == 'message':
+            await self.receive_message(data)
+        elif frame_type == 'typing':
+            await self.receive_typing()
+        elif frame_type == 'read':
+            await self.receive_read(data.get('message_id'))
+        elif frame_type == 'heartbeat':
+            await self.receive_heartbeat()
+
+    async def receive_message(self, data):
+        message_content = data.get('message')
+        if not isinstance(message_content, str):
+            return
+        # NUL не пропускает Postgres (psycopg2 бросает ValueError) - вырезаем его до записи
+        message_content = message_content.replace('\x00', '')
+        if not message_content.strip():
+            return
+        # client_id генерирует клиент; при повторной отправке он тот же
+        try:
+            client_id = uuid.UUID(str(data.get('client_id')))
+        except ValueError:
+            client_id = uuid.uuid4()
+
+        message_id = None
+        if chat.CHAT_WRITE_BEHIND:
+            # Рассылаем сразу, в базу сообщение попадет со следующей пачкой (id пока нет)
+            if not chat.message_buffer.add(self.build_message(message_content, client_id)):
+                return
+        else:
+            message_id = await self.save_message(message_content, client_id)
+            if message_id is None:
+                return
+        # Новое сообщение отменяет индикатор набора
+        self.typing_sent_at = 0
 
         # Отправляем сообщение всем участникам группы
         await self.channel_layer.group_send(
             self.room_group_name,
             {
                 'type': 'chat_message', # это вызовет метод chat_message
-                'message': new_message.content,
+                'message': message_content,
+                'message_id': message_id,
+                'client_id': str(client_id),
                 'sender_id': self.user.id,
-                'sender_name': self.user.profile.full_name,
-                'sender_avatar_url': self.user.profile.get_avatar_url()
+                **self.participants[self.user.id],
             }
         )
+        # Собеседник узнает о сообщении, даже если чат у него не открыт
+        await notifications.anotify(self.other_user_id, notifications.MESSAGE, notifications.message_data(
+            self.match_id, message_id, message_content, self.user.id, **self.participants[self.user.id]
+        ))
+
+    async def receive_typing(self):
+        # Клиент шлет typing на каждое нажатие; дальше группы уходит не чаще раза в TYPING_THROTTLE
+        now = time.monotonic()
+        if now - self.typing_sent_at < TYPING_THROTTLE:
+            return
+        self.typing_sent_at = now
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'chat_typing', 'user_id': self.user.id},
+        )
+
+    async def receive_read(self, message_id):
+        if message_id is not None and not isinstance(message_id, int):
+            return
+        if chat.CHAT_WRITE_BEHIND:
+            # Сообщения из буфера тоже должны стать прочитанными
+            await chat.message_buffer.flush()
+        last_read_id = await sync_to_async(chat.mark_read)(self.match_id, self.user.id, message_id)
+        if last_read_id is None:
+            return  # квитанция не сдвинулась, собеседнику нечего сообщать
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'chat_read', 'user_id': self.user.id, 'message_id': last_read_id},
+        )
+
+    async def receive_heartbeat(self):
+        if await sync_to_async(presence.heartbeat, thread_sensitive=False)(self.user.id, self.channel_name):
+            await self.broadcast_presence(True)
+        # В ответ - статус собеседника: так клиент узнает и о статусе, истекшем по TTL
+        other_online = await sync_to_async(presence.is_online, thread_sensitive=False)(self.other_user_id)
+        await self.send_json({'type': 'presence', 'user_id': self.other_user_id, 'online': other_online})
+
+    async def broadcast_presence(self, online):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {'type': 'chat_presence', 'user_id': self.user.id, 'online': online},
+        )
+
+    async def send_json(self, content):
+        await self.send(text_data=json.dumps(content))
 
     # Получение сообщения от группы и отправка его клиенту (WebSocket)
     async def chat_message(self, event):
         # Отправляем данные обратно клиенту в формате JSON
-        await self.send(text_data=json.dumps({
+        await self.send_json({
+            'type': 'message',
             'message': event['message'],
+            'message_id': event['message_id'],
+            'client_id': event['client_id'],
             'sender_id': event['sender_id'],
             'sender_name': event['sender_name'],
             'sender_avatar_url': event['sender_avatar_url']
-        }))
+        })
 
-    @sync_to_async
-    def save_message(self, content):
+    async def chat_typing(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send_json({'type': 'typing', 'user_id': event['user_id']})
+
+    async def chat_read(self, event):
+        await self.send_json({'type': 'read', 'user_id': event['user_id'], 'message_id': event['message_id']})
+
+    async def chat_presence(self, event):
+        if event['user_id'] != self.user.id:
+            await self.send_json({'type': 'presence', 'user_id': event['user_id'], 'online': event['online']})
+
+    def build_message(self, content, client_id):
         # Импортируем модели здесь, чтобы избежать ошибки при запуске
-        from .models import Match, Message
-        match = Match.objects.get(id=self.match_id)
-        # self.user уже доступен благодаря AuthMiddlewareStack
-        return Message.objects.create(match=match, sender=self.user, content=content)
+        from .models import Message
+        # Участие проверено в connect, мэтч и отправитель подставляются по id
+        return Message(match_id=self.match_id, sender_id=self.user.id, content=content, client_id=client_id)
 
     @sync_to_async
-    def is_user_participant(self):
-        # Импортируем модели здесь, чтобы избежать ошибки при запуске
-        from .models import Match
+    def save_message(self, content, client_id):
+        """
+        Один запрос (сообщение + сводка мэтча). Возвращает id или None,
+        если сообщение с таким client_id уже записано (повтор).
+        """
         try:
-            match = Match.objects.get(id=self.match_id)
-            return self.user == match.user1 or self.user == match.user2
-        except Match.DoesNotExist:
-            return False
+            ids = chat.insert_messages([self.build_message(content, client_id)])
+        except (ValueError, DataError, IntegrityError):
+            # Например, мэтч удалили, пока чат был открыт: сообщение не записать и не разослать
+            logger.exception('Could not save chat message in match %s', self.match_id)
+            return None
+        return ids[0] if ids else None
+
+    @sync_to_async
+    def load_chat(self):
+        """
+        Мэтч и данные обоих участников одним запросом по строкам членства.
+        None, если пользователь не аутентифицирован или не участник чата.
+        """
+        # Импортируем модели здесь, чтобы избежать ошибки при запуске
+        from .models import MatchMembership
+        if not self.user.is_authenticated:
+            return None
+        memberships = {
+            membership.user_id: membership
+            for membership in MatchMembership.objects.filter(
+                match_id=self.match_id
+            ).select_related('match', 'user__profile')
+        }
+        own = memberships.get(self.user.id)
+        if own is None:
+            return None
+        other = memberships[own.other_user_id]
+
+        self.other_user_id = other.user_id
+        self.other_last_read_id = other.last_read_message_id
+        self.participants = {
+            own.user_id: participant_payload(own.user),
+            other.user_id: participant_payload(other.user),
+        }
+        return own.match
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """
+    Поток уведомлений пользователя (группа user_<id>): новые мэтчи, сообщения
+    и обработанные фото. Клиент только слушает, кадры от него игнорируются.
+    """
+
+    async def connect(self):
+        self.user = self.scope['user']
+        if not self.user.is_authenticated:
+            await self.close()
+            return
+        self.group_name = notifications.user_group(self.user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notification(self, event):
+        await self.send(text_data=json.dumps({'type': event['kind'], **event['data']}))
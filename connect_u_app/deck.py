@@ -0,0 +1,113 @@
+# connect_u_app/deck.py
+"""
+Колода кандидатов для ленты.
+
+Колода — список ID кандидатов, ранжированный по общим интересам, который собирается один раз для пары
+(пользователь, набор фильтров) и хранится в кэше с TTL. Страницы ленты читают
+колоду по курсору, поэтому вторая страница не перемешивается заново, а
+пользователи, которым уже поставили лайк/дизлайк, отбрасываются при чтении.
+"""
+import hashlib
+import json
+import secrets
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+
+from .cards import load_cards
+from .recommendations import precomputed_candidate_ids, ranked_candidate_ids, get_seen
+
+DECK_TTL = getattr(settings, 'DECK_TTL', 60 * 30)
+DECK_SIZE = getattr(settings, 'DECK_SIZE', 500)
+FEED_PAGE_SIZE = getattr(settings, 'FEED_PAGE_SIZE', 9)
+
+
+@dataclass
+class DeckPage:
+    """Страница ленты, прочитанная из колоды."""
+    object_list: list
+    next_cursor: str = None
+    is_first: bool = True
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def _active_filters(filters):
+    # Пустые значения фильтров не должны давать отдельную колоду
+    return {key: value for key, value in (filters or {}).items() if value not in (None, '')}
+
+
+def _filters_hash(filters):
+    raw = json.dumps(_active_filters(filters), sort_keys=True, default=str)
+    return hashlib.md5(raw.encode()).hexdigest()[:12]
+
+
+def _deck_key(user_id, filters):
+    return f'deck:{user_id}:{_filters_hash(filters)}'
+
+
+def build_deck(user, filters=None):
+    """Собирает новую колоду и кладет ее в кэш."""
+    # Без фильтров - заранее посчитанный слейт; с фильтрами или без слейта - лучшие по общим
+    # интересам из случайной выборки (равные по оценке остаются в случайном порядке)
+    ids = None if _active_filters(filters) else precomputed_candidate_ids(user, DECK_SIZE)
+    if ids is None:
+        ids = ranked_candidate_ids(user, DECK_SIZE, filters)
+    deck = {'token': secrets.token_hex(4), 'ids': ids}
+    cache.set(_deck_key(user.id, filters), deck, DECK_TTL)
+    return deck
+
+
+def get_deck(user, filters=None, reshuffle=False):
+    deck = None if reshuffle else cache.get(_deck_key(user.id, filters))
+    if deck is None:
+        deck = build_deck(user, filters)
+    return deck
+
+
+def _parse_cursor(cursor, token):
+    # Курсор имеет вид "<token>.<позиция>"; курсор от старой колоды начинает сначала
+    try:
+        cursor_token, position = cursor.split('.', 1)
+        position = int(position)
+    except (AttributeError, ValueError):
+        return 0
+    if cursor_token != token or position < 0:
+        return 0
+    return position
+
+
+def get_page(user, filters=None, cursor=None, reshuffle=False, page_size=FEED_PAGE_SIZE):
+    """Возвращает страницу ленты, начиная с позиции курсора в колоде."""
+    deck = get_deck(user, filters, reshuffle=reshuffle)
+    ids = deck['ids']
+    start = _parse_cursor(cursor, deck['token'])
+    seen = get_seen(user.id)
+
+    # Карточки целиком (профиль, интересы) за два запроса на порцию; фильтр get_seen
+    # может отстать от свайпа, поэтому оцененных отсеивает еще и запрос карточек.
+    # Если отсеялось, дочитываем колоду, чтобы страница не вышла пустой при живом курсоре
+    cards = []
+    position = start
+    while position < len(ids) and len(cards) < page_size:
+        page_ids = []
+        while position < len(ids) and len(cards) + len(page_ids) < page_size:
+            if ids[position] not in seen:
+                page_ids.append(ids[position])
+            position += 1
+        cards += load_cards(page_ids, viewer_id=user.id)
+
+    return DeckPage(
+        object_list=cards,
+        next_cursor=f"{deck['token']}.{position}" if position < len(ids) else None,
+        is_first=start == 0,
+    )
@@ -0,0 +1,123 @@
+# connect_u_app/fragments.py
+"""
+Кэш HTML карточек анкет.
+
+Карточка в ленте и в лайк/дизлайк зависит только от самой анкеты (имя, возраст,
+город, аватар, интересы), а не от того, кто ее смотрит. Поэтому ее HTML
+рендерится один раз и берется из кэша по ключу (шаблон, user_id, версия).
+Кнопки с URL свайпа и CSRF остаются в шаблоне страницы, вне фрагмента.
+
+Версия анкеты - счетчик card_version:<user_id>. Сигналы (signals.py, models.py)
+увеличивают его при сохранении профиля, смене аватара и интересов, после чего
+старые фрагменты просто перестают читаться и истекают по FRAGMENT_CACHE_TTL.
+Новый счетчик начинается с time_ns(), а не с 1: если счетчик вытеснен из кэша,
+он не совпадет с версией уже закэшированных фрагментов.
+
+Кэш - алиас FRAGMENT_CACHE_ALIAS (Redis в продакшене); если такого алиаса нет в
+CACHES (тесты, локальный запуск), используется default. Попадания и промахи
+считаются в том же кэше, см. manage.py card_fragment_stats.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+FRAGMENT_CACHE_ALIAS = getattr(settings, 'FRAGMENT_CACHE_ALIAS', 'fragments')
+# Не больше суток: возраст в карточке меняется в день рождения без сохранения профиля
+FRAGMENT_CACHE_TTL = getattr(settings, 'FRAGMENT_CACHE_TTL', 60 * 60 * 6)
+
+FEED_CARD = 'partials/feed_card.html'
+NEXT_CARD = 'partials/user_card_body.html'
+
+HITS_KEY = 'card_fragments:hits'
+MISSES_KEY = 'card_fragments:misses'
+
+
+def get_cache():
+    alias = FRAGMENT_CACHE_ALIAS if FRAGMENT_CACHE_ALIAS in settings.CACHES else 'default'
+    return caches[alias]
+
+
+def _version_key(user_id):
+    return f'card_version:{user_id}'
+
+
+def get_versions(user_ids):
+    """{user_id: версия} одним запросом к кэшу; недостающие счетчики создаются."""
+    cache = get_cache()
+    keys = {_version_key(user_id): user_id for user_id in user_ids}
+    versions = {keys[key]: version for key, version in cache.get_many(keys).items()}
+    for key, user_id in keys.items():
+        if user_id not in versions:
+            version = time.time_ns()
+            # add не перетирает счетчик, который успел создать соседний запрос
+            if not cache.add(key, version, timeout=None):
+                version = cache.get(key, version)
+            versions[user_id] = version
+    return versions
+
+
+def bump_versions(user_ids):
+    """Делает устаревшими все фрагменты анкет user_ids."""
+    cache = get_cache()
+    for user_id in set(user_ids):
+        key = _version_key(user_id)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), timeout=None)
+
+
+def _fragment_key(template_name, card, version):
+    # Возраст в ключе: после дня рождения карточка рендерится заново
+    return f'card:{template_name}:{card.id}:{version}:{card.age}'
+
+
+def _count(key, value):
+    if not value:
+        return
+    cache = get_cache()
+    try:
+        cache.incr(key, value)
+    except ValueError:
+        if not cache.add(key, value, timeout=None):
+            cache.incr(key, value)
+
+
+def render_cards(cards, template_name):
+    """
+    Заполняет card.html для карточек (cards.Card): из кэша или рендером шаблона
+    template_name с переменной card. Версии и фрагменты читаются одним get_many
+    на всю страницу, а не по запросу на карточку.
+    """
+    if not cards:
+        return cards
+    cache = get_cache()
+    versions = get_versions([card.id for card in cards])
+    keys = {card.id: _fragment_key(template_name, card, versions[card.id]) for card in cards}
+    cached = cache.get_many(list(keys.values()))
+
+    rendered = {}
+    for card in cards:
+        html = cached.get(keys[card.id])
+        if html is None:
+            html = render_to_string(template_name, {'card': card})
+            rendered[keys[card.id]] = html
+        card.html = mark_safe(html)
+
+    if rendered:
+        cache.set_many(rendered, FRAGMENT_CACHE_TTL)
+    _count(HITS_KEY, len(cards) - len(rendered))
+    _count(MISSES_KEY, len(rendered))
+    return cards
+
+
+def stats(reset=False):
+    """(попадания, промахи) с последнего сброса."""
+    cache = get_cache()
+    counters = cache.get_many([HITS_KEY, MISSES_KEY])
+    if reset:
+        cache.delete_many([HITS_KEY, MISSES_KEY])
+    return counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
@@ -0,0 +1,218 @@
+# connect_u_app/images.py
+"""
+Фоновая обработка загруженных фотографий.
+
+Photo.save только сохраняет оригинал и ставит статус processing. После коммита
+фото уходит в пул процессов: воркер получает пути к файлам (без ORM), делает
+основное изображение PHOTO_MAX_SIZE и превью для карточки, плитки мэтча и
+аватара в чате, каждое в JPEG и WebP. Результат записывается в Photo.variants,
+а владельцу отправляется уведомление photo (notifications.py).
+
+Модели здесь импортируются внутри функций: модуль загружается в процессах пула,
+где Django не инициализирован.
+"""
+import logging
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, ImageOps
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+PHOTO_MAX_SIZE = getattr(settings, 'PHOTO_MAX_SIZE', 1024)
+# Имя превью -> размер по длинной стороне
+PHOTO_VARIANTS = getattr(settings, 'PHOTO_VARIANTS', {'card': 512, 'tile': 256, 'avatar': 96})
+# 0 - обрабатывать прямо в запросе (разработка, shell)
+IMAGE_WORKERS = getattr(settings, 'IMAGE_WORKERS', 2)
+
+# Больше - отклоняем по заголовку, не декодируя (40 Мп - с запасом для камер телефонов)
+PHOTO_MAX_PIXELS = getattr(settings, 'PHOTO_MAX_PIXELS', 40_000_000)
+PHOTO_ALLOWED_FORMATS = ('JPEG', 'PNG', 'WEBP', 'GIF')
+
+VARIANT_FORMATS = (('jpeg', 'JPEG', 'jpg'), ('webp', 'WEBP', 'webp'))
+
+_executor = None
+
+
+# --- ПРОВЕРКА ЗАГРУЗКИ ---
+
+def check_image_header(file):
+    """
+    Проверяет формат и размер в пикселях по заголовку файла, без декодирования.
+    Возвращает (width, height) или бросает ValueError.
+    """
+    position = file.tell() if hasattr(file, 'tell') else None
+    try:
+        with Image.open(file) as image:
+            if image.format not in PHOTO_ALLOWED_FORMATS:
+                raise ValueError('Поддерживаются только JPEG, PNG, WebP и GIF.')
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        raise ValueError('Файл не является изображением.')
+    finally:
+        if position is not None:
+            file.seek(position)
+
+    if width * height > PHOTO_MAX_PIXELS:
+        raise ValueError(f'Слишком большое изображение: {width}x{height}, максимум {PHOTO_MAX_PIXELS // 1_000_000} Мп.')
+    return width, height
+
+
+def validate_image_pixels(value):
+    """Валидатор поля Photo.image: формат и число пикселей до полного декодирования."""
+    from django.core.exceptions import ValidationError
+
+    try:
+        check_image_header(value.file if hasattr(value, 'file') else value)
+    except ValueError as exc:
+        raise ValidationError(str(exc))
+
+
+# --- ВОРКЕР (ПРОЦЕСС ПУЛА) ---
+
+def write_image(image, media_root, name, image_format, quality):
+    # Пишем во временный файл и переименовываем, чтобы nginx не отдал недописанный,
+    # а два процесса, пишущие один и тот же файл, не испортили его
+    path = os.path.join(media_root, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as tmp_file:
+            image.save(tmp_file, format=image_format, quality=quality, optimize=True)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return name
+
+
+def render_photo(media_root, name, max_size, variants):
+    """
+    Делает основное изображение и превью для файла `name` в `media_root`.
+    Возвращает имена созданных файлов относительно MEDIA_ROOT.
+    """
+    stem, _ = os.path.splitext(name)
+    result = {'original': name}
+
+    with Image.open(os.path.join(media_root, name)) as source:
+        if source.width * source.height > PHOTO_MAX_PIXELS:
+            raise ValueError(f'{name}: {source.width}x{source.height} exceeds PHOTO_MAX_PIXELS')
+        # JPEG декодируется сразу в уменьшенном масштабе (1/2..1/8), не поднимая в память весь кадр.
+        # Вызывать до exif_transpose: он загружает изображение. Поворот делаем на месте, без второй копии кадра
+        source.draft('RGB', (max_size, max_size))
+        ImageOps.exif_transpose(source, in_place=True)
+        image = source if source.mode == 'RGB' else source.convert('RGB')
+        image.thumbnail((max_size, max_size), Image.Resampling.LANCZOS)
+        result['main'] = write_image(image, media_root, f'{stem}_{max_size}.jpg', 'JPEG', 90)
+
+        # Превью уменьшаем из основного изображения, а не из оригинала
+        result['widths'] = {}
+        for variant, size in variants.items():
+            thumb = image.copy()
+            thumb.thumbnail((size, size), Image.Resampling.LANCZOS)
+            # Настоящая ширина для дескрипторов srcset (size - по длинной стороне)
+            result['widths'][variant] = thumb.width
+            result[variant] = {
+                key: write_image(thumb, media_root, f'{stem}_{size}.{extension}', image_format, 85)
+                for key, image_format, extension in VARIANT_FORMATS
+            }
+    return result
+
+
+# --- ПРОЦЕСС DJANGO ---
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        # spawn, а не fork: форк процесса Daphne с потоками и event loop небезопасен
+        _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return _executor
+
+
+def process_photo(photo_id):
+    """Ставит фото в обработку. Вызывается после коммита транзакции, в которой фото создано."""
+    from .models import Photo
+
+    name = Photo.objects.filter(pk=photo_id).values_list('image', flat=True).first()
+    if not name:
+        return
+
+    args = (str(settings.MEDIA_ROOT), name, PHOTO_MAX_SIZE, PHOTO_VARIANTS)
+    if IMAGE_WORKERS <= 0:
+        try:
+            result = render_photo(*args)
+        except Exception:
+            logger.exception('Photo %s processing failed', photo_id)
+            result = None
+        finish_photo(photo_id, result)
+        return
+
+    future = _get_executor().submit(render_photo, *args)
+    future.add_done_callback(lambda done: _on_done(photo_id, done))
+
+
+def _on_done(photo_id, future):
+    # Колбэк выполняется в служебном потоке пула, у которого свое соединение с БД
+    from django.db import connections
+
+    try:
+        result = future.result()
+    except Exception:
+        logger.exception('Photo %s processing failed', photo_id)
+        result = None
+    try:
+        finish_photo(photo_id, result)
+    finally:
+        connections.close_all()
+
+
+def finish_photo(photo_id, result):
+    """Сохраняет результат обработки (None - ошибка) и уведомляет владельца."""
+    from django.utils import timezone
+
+    from .models import Photo, UserProfile
+
+    photo = Photo.objects.filter(pk=photo_id).only('user_id', 'image').first()
+    if photo is None:
+        return  # фото удалили, пока оно обрабатывалось
+
+    if result is None:
+        Photo.objects.filter(pk=photo_id).update(status=Photo.FAILED)
+        publish_photo(photo.user_id, photo_id, Photo.FAILED)
+        return
+
+    Photo.objects.filter(pk=photo_id).update(status=Photo.READY, image=result['main'], variants=result)
+    # Если фото уже стало аватаром, переводим аватар на обработанную версию (и сбрасываем кэш карточки)
+    if UserProfile.objects.filter(user_id=photo.user_id, avatar=result['original']).update(
+        avatar=result['main'], avatar_variants=result, updated_at=timezone.now(),
+    ):
+        from .fragments import bump_versions
+
+        bump_versions([photo.user_id])
+    publish_photo(photo.user_id, photo_id, Photo.READY, result)
+
+
+def variant_urls(variants):
+    """Photo.variants с URL вместо имен файлов."""
+    from django.core.files.storage import default_storage
+
+    urls = {}
+    for key, value in variants.items():
+        if key == 'widths':
+            urls[key] = value  # ширины превью в пикселях, не файлы
+        elif isinstance(value, dict):
+            urls[key] = {image_format: default_storage.url(name) for image_format, name in value.items()}
+        else:
+            urls[key] = default_storage.url(value)
+    return urls
+
+
+def publish_photo(user_id, photo_id, status, variants=None):
+    # Недоступный Redis не ломает обработку: статус уже в базе, notify только пишет в лог
+    from .notifications import PHOTO, notify
+
+    notify(user_id, PHOTO, {'photo_id': photo_id, 'status': status, 'variants': variant_urls(variants or {})})
@@ -0,0 +1,65 @@
+# /app/connect_u_app/management/commands/benchmark_compatibility.py
+
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Q
+
+from ...compatibility import interest_mask, jaccard_scores, mask_matrix, top_candidates
+from ...models import User
+from ...recommendations import candidate_queryset, ranked_candidate_ids
+
+
+class Command(BaseCommand):
+    help = ('Compares interest-overlap ranking: NumPy bitmask scoring on synthetic candidates and, on the '
+            'current database, the bitmask ranking against an ORM Count(interests) annotation')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--candidates', type=int, default=100_000, help='Synthetic candidates to score')
+        parser.add_argument('--interests', type=int, default=200, help='Distinct interests in synthetic profiles')
+        parser.add_argument('--top', type=int, default=500, help='Candidates to keep (K)')
+        parser.add_argument('--repeat', type=int, default=20, help='Runs per measurement')
+        parser.add_argument('--user', type=int, help='Viewer for the database comparison (default: first active user)')
+
+    def handle(self, *args, **options):
+        repeat, top = options['repeat'], options['top']
+
+        # Синтетика: у каждого кандидата 1-8 случайных интересов
+        interest_ids = range(1, options['interests'] + 1)
+        masks = [interest_mask(random.sample(interest_ids, random.randint(1, 8))) for _ in range(options['candidates'])]
+        candidates = list(enumerate(masks, start=1))
+        viewer = interest_mask(random.sample(interest_ids, 5))
+        matrix = mask_matrix(masks)
+
+        self.stdout.write(f'Synthetic: {len(candidates)} candidates, top {top}')
+        self._report('jaccard_scores (matrix ready)', lambda: jaccard_scores(viewer, matrix), repeat)
+        self._report('top_candidates (from rows)', lambda: top_candidates(viewer, candidates, top), repeat)
+
+        user = User.objects.filter(pk=options['user']) if options['user'] else User.objects.filter(is_active=True)
+        user = user.select_related('profile').order_by('pk').first()
+        if user is None:
+            raise CommandError('No users in the database, run seed_db first.')
+        queryset = candidate_queryset(user)
+        viewer_interests = list(user.profile.interests.values_list('pk', flat=True))
+
+        def orm_ranking():
+            # Наивный вариант: JOIN по M2M и GROUP BY по каждому кандидату
+            return list(queryset.annotate(
+                shared=Count('profile__interests', filter=Q(profile__interests__in=viewer_interests)),
+            ).order_by('-shared').values_list('pk', flat=True)[:top])
+
+        self.stdout.write(f'Database: viewer {user.pk}, {queryset.count()} candidates, top {top}')
+        self._report('ORM Count(interests) annotation', orm_ranking, repeat)
+        self._report('ranked_candidate_ids (bitmask)', lambda: ranked_candidate_ids(user, top), repeat)
+
+    def _report(self, label, func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f'  {label:<34} median {statistics.median(timings) * 1000:8.2f} ms, best {min(timings) * 1000:8.2f} ms'
+        )
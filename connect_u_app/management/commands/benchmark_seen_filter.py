@@ -0,0 +1,39 @@
+# /app/connect_u_app/management/commands/benchmark_seen_filter.py
+
+import pickle
+import random
+import time
+
+from django.core.management.base import BaseCommand
+
+from ...bloom import BloomFilter
+from ...recommendations import SEEN_FILTER_CAPACITY, SEEN_FILTER_FP_RATE
+
+
+class Command(BaseCommand):
+    help = 'Measures size, false positive rate and lookup time of the "already swiped" Bloom filter'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--swipes', type=int, default=SEEN_FILTER_CAPACITY, help='IDs added to the filter')
+        parser.add_argument('--probes', type=int, default=100000, help='IDs not in the filter to probe')
+        parser.add_argument('--fp-rate', type=float, default=SEEN_FILTER_FP_RATE, help='Target false positive rate')
+
+    def handle(self, *args, **options):
+        swipes, probes = options['swipes'], options['probes']
+        ids = random.sample(range(1, 10 * (swipes + probes)), swipes + probes)
+        swiped, others = ids[:swipes], ids[swipes:]
+
+        seen = BloomFilter(swipes, options['fp_rate'])
+        seen.add_many(swiped)
+        as_set = pickle.dumps(set(swiped), protocol=pickle.HIGHEST_PROTOCOL)
+        as_filter = pickle.dumps(seen.state(), protocol=pickle.HIGHEST_PROTOCOL)
+        self.stdout.write(f'{swipes} IDs, k={seen.hashes}: filter {len(as_filter)} bytes in cache, set {len(as_set)} bytes')
+
+        if not seen.contains_many(swiped).all():
+            self.stderr.write(self.style.ERROR('False negative: an added ID was not found'))
+        started = time.perf_counter()
+        found = seen.contains_many(others)
+        elapsed = (time.perf_counter() - started) * 1000
+        rate = found.sum() / probes * 100
+        self.stdout.write(f'False positives: {rate:.2f}% of {probes} (target {options["fp_rate"] * 100:.2f}%), '
+                          f'contains_many {elapsed:.2f} ms')
@@ -0,0 +1,20 @@
+# /app/connect_u_app/management/commands/card_fragment_stats.py
+
+from django.core.management.base import BaseCommand
+
+from ... import fragments
+
+
+class Command(BaseCommand):
+    help = 'Shows hit rate of the profile card fragment cache since the last reset'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them')
+
+    def handle(self, *args, **options):
+        hits, misses = fragments.stats(reset=options['reset'])
+        total = hits + misses
+        rate = hits / total * 100 if total else 0
+        self.stdout.write(f'{total} cards rendered: {hits} hits, {misses} misses, hit rate {rate:.1f}%')
+        if options['reset']:
+            self.stdout.write(self.style.SUCCESS('Counters reset.'))
@@ -0,0 +1,123 @@
+# /app/connect_u_app/management/commands/chat_load_test.py
+
+import asyncio
+import json
+import statistics
+import time
+import uuid
+
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import chat
+from ...models import Match, MatchMembership, Message, User
+from ...routing import websocket_urlpatterns
+
+
+class Command(BaseCommand):
+    help = ('Opens many concurrent chat WebSockets against ChatConsumer (in process, with the configured '
+            'database and channel layer) and reports per-message latency')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sockets', type=int, default=200, help='Concurrent connections')
+        parser.add_argument('--messages', type=int, default=10, help='Messages sent by each connection')
+        parser.add_argument('--timeout', type=float, default=30, help='Seconds to wait for a message to come back')
+        parser.add_argument('--write-behind', action='store_true', help='Force CHAT_WRITE_BEHIND on for this run')
+        parser.add_argument('--keep', action='store_true',
+                            help='Do not delete the users, matches and messages created by the test')
+
+    def handle(self, *args, **options):
+        if options['sockets'] < 1:
+            raise CommandError('--sockets must be at least 1.')
+        if options['write_behind']:
+            chat.CHAT_WRITE_BEHIND = True
+
+        # Свои одноразовые пользователи и мэтчи: сводка мэтчей и счетчики непрочитанного
+        # реальных пользователей не трогаются, а после теста все удаляется каскадом
+        run = uuid.uuid4().hex[:8]
+        marker = f'[load-test {run}]'
+        user_ids, match_ids = self._create_chats(run, options['sockets'])
+        try:
+            # По сокету на каждого участника мэтча, оба пишут в одну группу
+            clients = list(MatchMembership.objects.filter(match_id__in=match_ids).select_related('user')
+                           .order_by('match_id', 'user_id')[:options['sockets']])
+            latencies, elapsed = asyncio.run(self._run(clients, options['messages'], options['timeout'], marker))
+            stored = Message.objects.filter(match_id__in=match_ids).count()
+        finally:
+            if options['keep']:
+                self.stdout.write(f'Kept users loadtest-{run}-* and their {len(match_ids)} matches')
+            else:
+                User.objects.filter(pk__in=user_ids).delete()
+
+        # Задержка - от отправки до получения своего сообщения обратно через группу
+        latencies.sort()
+        self.stdout.write(self.style.SUCCESS(
+            f'{len(clients)} sockets, {len(latencies)} messages in {elapsed:.2f}s '
+            f'({len(latencies) / elapsed:.0f} msg/s), {stored} stored'
+            f'{" (write-behind)" if chat.CHAT_WRITE_BEHIND else ""}'
+        ))
+        for label, value in (
+            ('mean', statistics.mean(latencies)),
+            ('p50', latencies[len(latencies) // 2]),
+            ('p95', latencies[int(len(latencies) * 0.95)]),
+            ('p99', latencies[int(len(latencies) * 0.99)]),
+            ('max', latencies[-1]),
+        ):
+            self.stdout.write(f'  {label:>4}: {value * 1000:.1f} ms')
+
+    @staticmethod
+    def _create_chats(run, sockets):
+        """Пары пользователей с мэтчем на каждые два сокета. Возвращает (ID пользователей, ID мэтчей)."""
+        users = []
+        for index in range(sockets + sockets % 2):
+            user = User(username=f'loadtest-{run}-{index}', email=f'loadtest-{run}-{index}@example.invalid',
+                        is_active=False)  # не попадают в ленту и поиск, пока идет тест
+            user.set_unusable_password()
+            users.append(user)
+        users = User.objects.bulk_create(users)
+        matches = Match.objects.bulk_create(
+            Match(user1=first, user2=second) for first, second in zip(users[::2], users[1::2])
+        )
+        MatchMembership.objects.bulk_create(
+            membership for match in matches for membership in MatchMembership.for_match(match)
+        )
+        return [user.pk for user in users], [match.pk for match in matches]
+
+    async def _run(self, clients, messages, timeout, marker):
+        application = URLRouter(websocket_urlpatterns)
+        communicators = []
+        for membership in clients:
+            communicator = WebsocketCommunicator(application, f'/ws/chat/{membership.match_id}/')
+            # Вместо AuthMiddlewareStack пользователь кладется в scope напрямую
+            communicator.scope['user'] = membership.user
+            communicators.append(communicator)
+
+        results = await asyncio.gather(*(communicator.connect(timeout=timeout) for communicator in communicators))
+        if not all(connected for connected, _ in results):
+            raise CommandError('Some sockets were rejected by ChatConsumer.')
+
+        started = time.perf_counter()
+        try:
+            per_client = await asyncio.gather(*(
+                self._client(communicator, membership.user_id, f'{marker} {number}', messages, timeout)
+                for number, (communicator, membership) in enumerate(zip(communicators, clients))
+            ))
+        finally:
+            await asyncio.gather(*(communicator.disconnect() for communicator in communicators))
+        return [latency for latencies in per_client for latency in latencies], time.perf_counter() - started
+
+    @staticmethod
+    async def _client(communicator, user_id, prefix, messages, timeout):
+        latencies = []
+        for index in range(messages):
+            content = f'{prefix} #{index}'
+            sent_at = time.perf_counter()
+            await communicator.send_to(text_data=json.dumps({'message': content, 'client_id': str(uuid.uuid4())}))
+            # В ту же группу пишут и другие сокеты этого мэтча, плюс события статуса: ждем именно свое сообщение
+            while True:
+                event = json.loads(await communicator.receive_from(timeout=timeout))
+                if event['type'] == 'message' and event['sender_id'] == user_id and event['message'] == content:
+                    break
+            latencies.append(time.perf_counter() - sent_at)
+        return latencies
@@ -0,0 +1,42 @@
+# /app/connect_u_app/management/commands/precompute_candidates.py
+
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from ...precompute import CANDIDATE_SLATE_SIZE, precompute
+
+
+class Command(BaseCommand):
+    help = ('Precomputes the ranked top-K candidates of every user whose swipes or profile changed since the '
+            'last run (or whose list is older than --max-age) into CandidateSlate')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=2, help='Worker processes (0 - compute in this process)')
+        parser.add_argument('--chunk-size', type=int, default=500, help='Users per worker task')
+        parser.add_argument('--top', type=int, default=CANDIDATE_SLATE_SIZE, help='Candidates kept per user')
+        parser.add_argument('--max-age', type=float, default=24, help='Hours after which a list is recomputed anyway')
+        parser.add_argument('--full', action='store_true', help='Recompute every user, not only changed ones')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(done, total):
+            self.stdout.write(f'  {done}/{total} users')
+
+        updated, candidates = precompute(
+            workers=options['workers'],
+            chunk_size=options['chunk_size'],
+            limit=options['top'],
+            max_age=timedelta(hours=options['max_age']),
+            full=options['full'],
+            progress=progress if options['verbosity'] > 1 else None,
+        )
+        if not updated:
+            self.stdout.write(self.style.SUCCESS('All candidate lists are up to date.'))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f'Recomputed candidates for {updated} users against {candidates} candidates '
+            f'in {time.perf_counter() - started:.1f}s.'
+        ))
@@ -0,0 +1,43 @@
+# /app/connect_u_app/management/commands/process_pending_photos.py
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from ...images import PHOTO_MAX_SIZE, PHOTO_VARIANTS, finish_photo, render_photo
+from ...models import Photo
+from ...uploads import clear_stale_uploads
+
+
+class Command(BaseCommand):
+    help = ('Processes photos stuck in "processing" (e.g. after a worker restart) or failed ones with --failed, '
+            'and removes chunked uploads abandoned for more than a day')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=10, help='Minutes since upload')
+        parser.add_argument('--failed', action='store_true', help='Retry failed photos as well')
+
+    def handle(self, *args, **options):
+        statuses = [Photo.PROCESSING] + ([Photo.FAILED] if options['failed'] else [])
+        cutoff = timezone.now() - timedelta(minutes=options['older_than'])
+        pending = Photo.objects.filter(status__in=statuses, uploaded_at__lt=cutoff).values_list('pk', 'image')
+
+        done = failed = 0
+        for photo_id, name in pending.iterator():
+            try:
+                result = render_photo(str(settings.MEDIA_ROOT), name, PHOTO_MAX_SIZE, PHOTO_VARIANTS)
+            except Exception as exc:
+                self.stderr.write(f'Photo {photo_id}: {exc}')
+                result = None
+            finish_photo(photo_id, result)
+            if result is None:
+                failed += 1
+            else:
+                done += 1
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {done} photos, {failed} failed.'))
+
+        cleared = clear_stale_uploads()
+        self.stdout.write(self.style.SUCCESS(f'Removed {cleared} abandoned chunked uploads.'))
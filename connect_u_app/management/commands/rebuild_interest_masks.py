@@ -0,0 +1,23 @@
+# /app/connect_u_app/management/commands/rebuild_interest_masks.py
+
+from django.core.management.base import BaseCommand
+
+from ...compatibility import update_interest_masks
+from ...models import UserProfile
+
+
+class Command(BaseCommand):
+    help = 'Recomputes UserProfile.interest_mask (e.g. after bulk-loading interests)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Profiles per batch')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(UserProfile.objects.order_by('pk').values_list('pk', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_interest_masks(ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt interest masks for {updated} profiles.'))
@@ -0,0 +1,23 @@
+# /app/connect_u_app/management/commands/rebuild_search_vectors.py
+
+from django.core.management.base import BaseCommand
+
+from ...models import UserProfile
+from ...search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = 'Recomputes UserProfile.search_vector (e.g. after changing SEARCH_CONFIG)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000, help='Profiles per UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        ids = list(UserProfile.objects.order_by('pk').values_list('pk', flat=True))
+
+        updated = 0
+        for start in range(0, len(ids), batch_size):
+            updated += update_search_vectors(ids[start:start + batch_size])
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt search vectors for {updated} profiles.'))
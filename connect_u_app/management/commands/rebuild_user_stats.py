@@ -0,0 +1,61 @@
+# /app/connect_u_app/management/commands/rebuild_user_stats.py
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count, Q
+
+from ...models import User, Interaction, MatchMembership, UserStats
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds denormalized UserStats counters from Interaction and Match'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help='Rows per bulk upsert')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+
+        self.stdout.write(self.style.WARNING('Aggregating interactions and matches...'))
+        # Каждая цифра считается одним GROUP BY по всей таблице, а не запросом на пользователя
+        given = {
+            row['from_user']: row
+            for row in Interaction.objects.values('from_user').annotate(
+                likes=Count('id', filter=Q(reaction=Interaction.LIKE)),
+                dislikes=Count('id', filter=Q(reaction=Interaction.DISLIKE)),
+            )
+        }
+        received = dict(
+            Interaction.objects.likes().values('to_user').annotate(total=Count('id')).values_list('to_user', 'total')
+        )
+        matches = dict(
+            MatchMembership.objects.values('user').annotate(total=Count('id')).values_list('user', 'total')
+        )
+
+        self.stdout.write(self.style.SUCCESS('Writing UserStats...'))
+        stats = []
+        written = 0
+        for user_id in User.objects.values_list('id', flat=True).iterator(chunk_size=batch_size):
+            row = given.get(user_id, {})
+            stats.append(UserStats(
+                user_id=user_id,
+                likes_given=row.get('likes', 0),
+                dislikes_given=row.get('dislikes', 0),
+                likes_received=received.get(user_id, 0),
+                matches_count=matches.get(user_id, 0),
+            ))
+            if len(stats) >= batch_size:
+                written += self._flush(stats)
+                stats = []
+        written += self._flush(stats)
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt stats for {written} users.'))
+
+    @staticmethod
+    def _flush(stats):
+        UserStats.objects.bulk_create(
+            stats,
+            update_conflicts=True,
+            unique_fields=['user'],
+            update_fields=['likes_given', 'likes_received', 'dislikes_given', 'matches_count'],
+        )
+        return len(stats)
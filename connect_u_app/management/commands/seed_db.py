@@ -1,6 +1,7 @@
 # /app/connect_u_app/management/commands/seed_db.py
 
 import random
+from django.core.management import call_command
 from django.core.management.base import BaseCommand
 from django.db import transaction
 from django.contrib.auth.hashers import make_password
@@ -112,7 +113,16 @@ class Command(BaseCommand):
                 )
                 interactions_to_create.append(interaction)
 
+        # Одна строка на реакцию: INSERT ... ON CONFLICT DO UPDATE, как и в обычном свайпе
         Interaction.objects.bulk_create(interactions_to_create,
-                                        ignore_conflicts=True)  # Игнорируем, если реакция уже есть
+                                        update_conflicts=True,
+                                        unique_fields=['from_user', 'to_user'],
+                                        update_fields=['reaction'])
+
+        # bulk_create обходит сервис свайпов, поэтому счетчики пересобираем целиком
+        call_command('rebuild_user_stats', stdout=self.stdout)
+        # Профили и интересы созданы через bulk_create, сигналы поиска не срабатывали
+        call_command('rebuild_search_vectors', stdout=self.stdout)
+        call_command('rebuild_interest_masks', stdout=self.stdout)
 
         self.stdout.write(self.style.SUCCESS(f'Database has been seeded successfully with {count} users!'))
@@ -0,0 +1,27 @@
+# /app/connect_u_app/management/commands/train_recommender.py
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from ... import collaborative
+
+
+class Command(BaseCommand):
+    help = ('Trains the collaborative-filtering model on all likes and publishes it to RECOMMENDER_MODEL_DIR '
+            'for memory-mapped use by the web workers and precompute_candidates')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--factors', type=int, default=collaborative.RECOMMENDER_FACTORS, help='Latent factors')
+        parser.add_argument('--keep', type=int, default=2, help='Model versions to keep on disk')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        model = collaborative.train(factors=options['factors'])
+        if model is None:
+            raise CommandError('Not enough likes to train the model.')
+        path = collaborative.save(model, keep=options['keep'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Trained {model.user_factors.shape[1]} factors for {len(model.ids)} users '
+            f'in {time.perf_counter() - started:.1f}s, saved to {path}.'
+        ))
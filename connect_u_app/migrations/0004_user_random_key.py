@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:57
+
+import connect_u_app.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0003_userprofile_searchable_userprofile_show_age_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='random_key',
+            field=models.FloatField(db_index=True, default=connect_u_app.models.generate_random_key, editable=False),
+        ),
+        # AddField вычисляет default один раз, поэтому раздаем существующим пользователям свои ключи
+        migrations.RunSQL(
+            'UPDATE connect_u_app_user SET random_key = random();',
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
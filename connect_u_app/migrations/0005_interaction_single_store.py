@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:58
+
+import connect_u_app.models
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0004_user_random_key'),
+    ]
+
+    operations = [
+        # Переносим лайки/дизлайки в Interaction; при конфликте побеждает более поздняя реакция
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO connect_u_app_interaction (from_user_id, to_user_id, reaction, created_at)
+                SELECT DISTINCT ON (from_user_id, to_user_id) from_user_id, to_user_id, reaction, created_at
+                FROM (
+                    SELECT from_user_id, to_user_id, 'like' AS reaction, created_at FROM connect_u_app_like
+                    UNION ALL
+                    SELECT from_user_id, to_user_id, 'dislike' AS reaction, created_at FROM connect_u_app_dislike
+                ) AS reactions
+                ORDER BY from_user_id, to_user_id, created_at DESC
+                ON CONFLICT (from_user_id, to_user_id) DO UPDATE
+                SET reaction = EXCLUDED.reaction, created_at = EXCLUDED.created_at
+                WHERE connect_u_app_interaction.created_at < EXCLUDED.created_at;
+            """,
+            reverse_sql="""
+                INSERT INTO connect_u_app_like (from_user_id, to_user_id, created_at)
+                SELECT from_user_id, to_user_id, created_at FROM connect_u_app_interaction WHERE reaction = 'like';
+                INSERT INTO connect_u_app_dislike (from_user_id, to_user_id, created_at)
+                SELECT from_user_id, to_user_id, created_at FROM connect_u_app_interaction WHERE reaction = 'dislike';
+            """,
+        ),
+        migrations.DeleteModel(
+            name='Dislike',
+        ),
+        migrations.DeleteModel(
+            name='Like',
+        ),
+        migrations.CreateModel(
+            name='Dislike',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=(connect_u_app.models.ReadOnlyReactionMixin, 'connect_u_app.interaction'),
+        ),
+        migrations.CreateModel(
+            name='Like',
+            fields=[
+            ],
+            options={
+                'proxy': True,
+                'indexes': [],
+                'constraints': [],
+            },
+            bases=(connect_u_app.models.ReadOnlyReactionMixin, 'connect_u_app.interaction'),
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0005_interaction_single_store'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('likes_given', models.IntegerField(default=0)),
+                ('likes_received', models.IntegerField(default=0)),
+                ('dislikes_given', models.IntegerField(default=0)),
+                ('matches_count', models.IntegerField(default=0)),
+            ],
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO connect_u_app_userstats (user_id, likes_given, likes_received, dislikes_given, matches_count)
+                SELECT
+                    u.id,
+                    (SELECT count(*) FROM connect_u_app_interaction i WHERE i.from_user_id = u.id AND i.reaction = 'like'),
+                    (SELECT count(*) FROM connect_u_app_interaction i WHERE i.to_user_id = u.id AND i.reaction = 'like'),
+                    (SELECT count(*) FROM connect_u_app_interaction i WHERE i.from_user_id = u.id AND i.reaction = 'dislike'),
+                    (SELECT count(*) FROM connect_u_app_match m WHERE m.user1_id = u.id OR m.user2_id = u.id)
+                FROM connect_u_app_user u;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
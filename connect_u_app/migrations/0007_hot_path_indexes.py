@@ -0,0 +1,58 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+import django.contrib.postgres.indexes
+from django.contrib.postgres.operations import TrigramExtension
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('connect_u_app', '0006_userstats'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(condition=models.Q(('reaction', 'like')), fields=['to_user', 'from_user'], name='interaction_like_to_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='interaction',
+            index=models.Index(fields=['from_user', '-created_at'], name='interaction_from_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['user1', '-created_at'], name='match_user1_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['user2', '-created_at'], name='match_user2_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['match', 'timestamp', 'id'], name='message_match_timestamp_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='photo',
+            index=models.Index(fields=['user', '-uploaded_at'], name='photo_user_uploaded_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(condition=models.Q(('is_active', True), ('is_superuser', False)), fields=['random_key'], name='user_feed_random_key_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(condition=models.Q(('searchable', True)), fields=['user'], name='profile_searchable_user_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('full_name'), name='gin_trgm_ops'), name='profile_full_name_trgm'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=django.contrib.postgres.indexes.GinIndex(django.contrib.postgres.indexes.OpClass(django.db.models.functions.text.Upper('city'), name='gin_trgm_ops'), name='profile_city_trgm'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0007_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MatchMembership',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('match', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='memberships', to='connect_u_app.match')),
+                ('other_user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='match_memberships', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['user', '-created_at'], name='membership_user_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'other_user'), name='unique_match_membership'), models.UniqueConstraint(fields=('match', 'user'), name='unique_match_member')],
+            },
+        ),
+        migrations.RunSQL(
+            sql="""
+                INSERT INTO connect_u_app_matchmembership (user_id, match_id, other_user_id, created_at)
+                SELECT user1_id, id, user2_id, created_at FROM connect_u_app_match
+                UNION ALL
+                SELECT user2_id, id, user1_id, created_at FROM connect_u_app_match
+                ON CONFLICT DO NOTHING;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:10
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0008_match_membership'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=django.contrib.postgres.indexes.GinIndex(fields=['search_vector'], name='profile_search_vector_idx'),
+        ),
+        # Начальное заполнение; та же формула, что в search.search_vector_expression()
+        migrations.RunSQL(
+            sql="""
+                UPDATE connect_u_app_userprofile AS p SET search_vector =
+                    setweight(to_tsvector('russian', coalesce(p.full_name, '')), 'A') ||
+                    setweight(to_tsvector('russian', coalesce(p.city, '')), 'B') ||
+                    setweight(to_tsvector('russian', coalesce((
+                        SELECT string_agg(i.name, ' ')
+                        FROM connect_u_app_userprofile_interests AS pi
+                        JOIN connect_u_app_interest AS i ON i.id = pi.interest_id
+                        WHERE pi.userprofile_id = p.id
+                    ), '')), 'B') ||
+                    setweight(to_tsvector('russian', coalesce(p.bio, '')), 'C');
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0009_profile_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='photo',
+            name='status',
+            field=models.CharField(choices=[('processing', 'Обрабатывается'), ('ready', 'Готово'), ('failed', 'Ошибка обработки')], default='ready', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='photo',
+            name='variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:28
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0012_message_client_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='matchmembership',
+            name='last_read_message_id',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
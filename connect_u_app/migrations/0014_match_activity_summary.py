@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:33
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0013_membership_last_read'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='matchmembership',
+            name='membership_user_created_idx',
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_id',
+            field=models.BigIntegerField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='last_message_text',
+            field=models.CharField(blank=True, db_default='', default='', editable=False, max_length=100),
+        ),
+        migrations.AddField(
+            model_name='matchmembership',
+            name='last_activity_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.AddField(
+            model_name='matchmembership',
+            name='unread_count',
+            field=models.PositiveIntegerField(db_default=0, default=0),
+        ),
+        # Сводка по последнему сообщению, время активности и непрочитанные для уже существующих мэтчей
+        migrations.RunSQL(
+            sql="""
+                UPDATE connect_u_app_match AS m
+                SET last_message_id = last.id,
+                    last_message_text = left(last.content, 100),
+                    last_message_at = last.timestamp
+                FROM (
+                    SELECT DISTINCT ON (match_id) match_id, id, content, timestamp
+                    FROM connect_u_app_message
+                    ORDER BY match_id, timestamp DESC, id DESC
+                ) AS last
+                WHERE m.id = last.match_id;
+
+                UPDATE connect_u_app_matchmembership AS ms
+                SET last_activity_at = COALESCE(m.last_message_at, ms.created_at),
+                    unread_count = (
+                        SELECT count(*) FROM connect_u_app_message AS msg
+                        WHERE msg.match_id = ms.match_id
+                          AND msg.sender_id <> ms.user_id
+                          AND msg.id > COALESCE(ms.last_read_message_id, 0)
+                    )
+                FROM connect_u_app_match AS m
+                WHERE m.id = ms.match_id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+        migrations.AlterField(
+            model_name='matchmembership',
+            name='last_activity_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='matchmembership',
+            index=models.Index(fields=['user', '-last_activity_at'], name='membership_user_activity_idx'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0014_match_activity_summary'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='interest_mask',
+            field=models.BinaryField(default=b'\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00\x00'),
+        ),
+        # Маски для уже существующих профилей: байт n - OR битов интересов с (id % 256) / 8 = n
+        migrations.RunSQL(
+            sql="""
+                UPDATE connect_u_app_userprofile AS p
+                SET interest_mask = masks.mask
+                FROM (
+                    SELECT profiles.id,
+                           decode(string_agg(lpad(to_hex(COALESCE(bytes.value, 0)), 2, '0'), '' ORDER BY positions.n),
+                                  'hex') AS mask
+                    FROM (SELECT DISTINCT userprofile_id AS id FROM connect_u_app_userprofile_interests) AS profiles
+                    CROSS JOIN generate_series(0, 31) AS positions(n)
+                    LEFT JOIN (
+                        SELECT userprofile_id, (interest_id % 256) / 8 AS n, bit_or(1 << (interest_id % 8)::int) AS value
+                        FROM connect_u_app_userprofile_interests
+                        GROUP BY 1, 2
+                    ) AS bytes ON bytes.userprofile_id = profiles.id AND bytes.n = positions.n
+                    GROUP BY profiles.id
+                ) AS masks
+                WHERE p.id = masks.id;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
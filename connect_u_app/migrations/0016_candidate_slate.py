@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:43
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0015_profile_interest_mask'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CandidateSlate',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='slate', serialize=False, to=settings.AUTH_USER_MODEL)),
+                ('candidate_ids', django.contrib.postgres.fields.ArrayField(base_field=models.BigIntegerField(), default=list, size=None)),
+                ('computed_at', models.DateTimeField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0016_candidate_slate'),
+    ]
+
+    operations = [
+        # Пересчет профилей со скрытым городом без города; та же формула, что в search.search_vector_expression()
+        migrations.RunSQL(
+            sql="""
+                UPDATE connect_u_app_userprofile AS p SET search_vector =
+                    setweight(to_tsvector('russian', coalesce(p.full_name, '')), 'A') ||
+                    setweight(to_tsvector('russian', ''), 'B') ||
+                    setweight(to_tsvector('russian', coalesce((
+                        SELECT string_agg(i.name, ' ')
+                        FROM connect_u_app_userprofile_interests AS pi
+                        JOIN connect_u_app_interest AS i ON i.id = pi.interest_id
+                        WHERE pi.userprofile_id = p.id
+                    ), '')), 'B') ||
+                    setweight(to_tsvector('russian', coalesce(p.bio, '')), 'C')
+                WHERE NOT p.show_city;
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0017_search_vector_hidden_city'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='avatar_variants',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        # Варианты уже обработанных главных фото, из которых сделаны аватары
+        migrations.RunSQL(
+            sql="""
+                UPDATE connect_u_app_userprofile AS p SET avatar_variants = ph.variants
+                FROM connect_u_app_photo AS ph
+                WHERE ph.user_id = p.user_id AND ph.is_main AND ph.image = p.avatar AND ph.status = 'ready';
+            """,
+            reverse_sql=migrations.RunSQL.noop,
+        ),
+    ]
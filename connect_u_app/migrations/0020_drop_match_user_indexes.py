@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('connect_u_app', '0019_photo_user_index'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_user1_created_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='match',
+            name='match_user2_created_idx',
+        ),
+        migrations.AlterField(
+            model_name='matchmembership',
+            name='user',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='match_memberships', to=settings.AUTH_USER_MODEL),
+        ),
+    ]
@@ -1,14 +1,20 @@
+import random
+import uuid
+
 from django.conf import settings
 from django.contrib.auth.models import AbstractUser, BaseUserManager
-from django.db import models
+from django.db import models, transaction
 from django.db.models import Q, F, CheckConstraint
-from django.db.models.signals import post_save, post_delete
+from django.db.models.functions import Upper
+from django.contrib.postgres.fields import ArrayField
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models.signals import post_save
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
-from django.core.files import File
-from PIL import Image
-from io import BytesIO
+
+from . import compatibility, fragments, images
 
 
 # --- МЕНЕДЖЕР ДЛЯ ПРОДВИНУТОЙ МОДЕЛИ USER ---
@@ -35,15 +41,27 @@ class CustomUserManager(BaseUserManager):
 
 
 # --- ПРОДВИНУТАЯ МОДЕЛЬ USER ---
+def generate_random_key(): return random.random()
+
+
 class User(AbstractUser):
     GENDER_CHOICES = (('M', 'Мужчина'), ('F', 'Женщина'))
     email = models.EmailField(_('email address'), unique=True)
     gender = models.CharField(max_length=1, choices=GENDER_CHOICES)
     birth_date = models.DateField(null=True, blank=True)
+    # Случайный ключ для выборки кандидатов без ORDER BY RANDOM()
+    random_key = models.FloatField(default=generate_random_key, db_index=True, editable=False)
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
     objects = CustomUserManager()
 
+    class Meta(AbstractUser.Meta):
+        indexes = [
+            # Выборка кандидатов по random_key (recommendations.sample_candidate_ids)
+            models.Index(fields=['random_key'], condition=Q(is_active=True, is_superuser=False),
+                         name='user_feed_random_key_idx'),
+        ]
+
     def __str__(self):
         return self.email
 
@@ -57,7 +75,8 @@ class User(AbstractUser):
 
     @property
     def likes_received_count(self):
-        return self.likes_received.count()
+        # Денормализованный счетчик вместо COUNT по Interaction
+        return self.stats.likes_received
 
 
 # --- МОДЕЛЬ ИНТЕРЕСОВ ---
@@ -83,6 +102,24 @@ class UserProfile(models.Model):
     show_age = models.BooleanField(default=True, verbose_name="Показывать возраст в профиле")
     show_city = models.BooleanField(default=True, verbose_name="Показывать город в профиле")
     searchable = models.BooleanField(default=True, verbose_name="Разрешить находить мой профиль в поиске")
+    # Поддерживается сервисом search.py: имя, город, интересы и био с весами A/B/B/C
+    search_vector = SearchVectorField(null=True, editable=False)
+    # Интересы битовой маской для ранжирования кандидатов; поддерживается сигналами (compatibility.py)
+    interest_mask = models.BinaryField(default=bytes(compatibility.INTEREST_MASK_BYTES), editable=False)
+    # Вход инкрементального пересчета кандидатов (manage.py precompute_candidates)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Photo.variants главного фото, из которого сделан аватар: превью для srcset (thumbnails.py)
+    avatar_variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [
+            # Лента и API берут только профили, доступные для поиска
+            models.Index(fields=['user'], condition=Q(searchable=True), name='profile_searchable_user_idx'),
+            # icontains в Postgres - это UPPER(col) LIKE UPPER(%s), поэтому триграммы строим по UPPER()
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='profile_full_name_trgm'),
+            GinIndex(OpClass(Upper('city'), name='gin_trgm_ops'), name='profile_city_trgm'),
+            GinIndex(fields=['search_vector'], name='profile_search_vector_idx'),
+        ]
 
     def __str__(self): return self.full_name or self.user.email
 
@@ -97,42 +134,43 @@ def user_photos_path(instance, filename): return f'user_{instance.user.id}/{file
 
 
 class Photo(models.Model):
-    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos')
-    image = models.ImageField(upload_to=user_photos_path)
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = ((PROCESSING, 'Обрабатывается'), (READY, 'Готово'), (FAILED, 'Ошибка обработки'))
+    # Отдельный индекс по user не нужен: его заменяет photo_user_uploaded_idx, а с ним
+    # планировщик выбирал индекс FK и сортировку вместо готового порядка
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photos', db_index=False)
+    image = models.ImageField(upload_to=user_photos_path, validators=[images.validate_image_pixels])
     is_main = models.BooleanField(default=False, verbose_name="Главное фото")
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=READY)
+    # Имена файлов, созданных images.render_photo: original, main и превью {jpeg, webp}
+    variants = models.JSONField(default=dict, blank=True, editable=False)
+
+    class Meta:
+        indexes = [models.Index(fields=['user', '-uploaded_at'], name='photo_user_uploaded_idx')]
 
     def save(self, *args, **kwargs):
-        if self.image:
-            pil_img = Image.open(self.image)
-            max_width, max_height = 1024, 1024
-            if pil_img.width > max_width or pil_img.height > max_height:
-                pil_img.thumbnail((max_width, max_height), Image.Resampling.LANCZOS)
-                in_mem_file = BytesIO()
-                if pil_img.mode in ("RGBA", "P"): pil_img = pil_img.convert("RGB")
-                pil_img.save(in_mem_file, format='JPEG', quality=90)
-                in_mem_file.seek(0)
-                original_name, _ = self.image.name.rsplit('.', 1)
-                new_name = f"{original_name}.jpg"
-                self.image = File(in_mem_file, name=new_name)
+        # Сам файл обрабатывается в фоне (connect_u_app/images.py) после коммита
+        if self._state.adding and self.image:
+            self.status = self.PROCESSING
         super().save(*args, **kwargs)
 
 
-# --- ЛАЙКИ И ДИЗЛАЙКИ ---
-class Like(models.Model):
-    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes_given')
-    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='likes_received')
-    created_at = models.DateTimeField(auto_now_add=True)
-
-    class Meta: unique_together = ('from_user', 'to_user')
-
-
-class Dislike(models.Model):
-    from_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dislikes_given')
-    to_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='dislikes_received')
+class PhotoUpload(models.Model):
+    """
+    Загрузка фото по частям (api/v1/photo-uploads/). Части дописываются во временный
+    файл uploads.temp_path(upload), offset - сколько байт уже принято.
+    """
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='photo_uploads')
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    offset = models.PositiveBigIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    class Meta: unique_together = ('from_user', 'to_user')
+    def __str__(self): return f'{self.filename} ({self.offset}/{self.size})'
 
 
 # --- МЭТЧИ И СООБЩЕНИЯ ---
@@ -140,12 +178,17 @@ class Match(models.Model):
     user1 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='matches_user1')
     user2 = models.ForeignKey(User, on_delete=models.CASCADE, related_name='matches_user2')
     created_at = models.DateTimeField(auto_now_add=True)
+    # Сводка по последнему сообщению для списка мэтчей; ведется chat.insert_messages
+    last_message_id = models.BigIntegerField(null=True, blank=True, editable=False)
+    last_message_text = models.CharField(max_length=100, blank=True, default='', db_default='', editable=False)
+    last_message_at = models.DateTimeField(null=True, blank=True, editable=False)
 
     class Meta:
         constraints = [
             models.UniqueConstraint(fields=['user1', 'user2'], name='unique_match'),
             CheckConstraint(check=~Q(user1=F('user2')), name='users_cannot_be_the_same'),
         ]
+        # Список мэтчей читается по MatchMembership (membership_user_activity_idx), не по user1/user2
 
     def __str__(self): return f"Match between {self.user1.email} and {self.user2.email}"
 
@@ -155,61 +198,190 @@ class Message(models.Model):
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Ключ идемпотентности от клиента: повтор отправки не создает второе сообщение
+    client_id = models.UUIDField(null=True, blank=True, editable=False)
 
-    class Meta: ordering = ['timestamp']
+    class Meta:
+        ordering = ['timestamp']
+        indexes = [models.Index(fields=['match', 'timestamp', 'id'], name='message_match_timestamp_idx')]
+        constraints = [models.UniqueConstraint(fields=['match', 'client_id'], name='unique_message_client_id')]
+
+
+class MatchMembership(models.Model):
+    """
+    Симметричная сторона мэтча: по строке на каждого участника.
+    Список мэтчей пользователя и проверка "есть ли мэтч с X" читаются
+    одним индексом по user вместо OR по user1/user2.
+    """
+    # Индекс по user дают membership_user_activity_idx и unique_match_membership
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='match_memberships', db_index=False)
+    match = models.ForeignKey(Match, on_delete=models.CASCADE, related_name='memberships')
+    other_user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    # Квитанция о прочтении: id последнего прочитанного сообщения, а не строка на каждое сообщение
+    last_read_message_id = models.BigIntegerField(null=True, blank=True)
+    # Для сортировки списка мэтчей: время последнего сообщения, а до него - время мэтча
+    last_activity_at = models.DateTimeField()
+    unread_count = models.PositiveIntegerField(default=0, db_default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'other_user'], name='unique_match_membership'),
+            models.UniqueConstraint(fields=['match', 'user'], name='unique_match_member'),
+        ]
+        indexes = [models.Index(fields=['user', '-last_activity_at'], name='membership_user_activity_idx')]
+
+    def __str__(self): return f'{self.user_id} <-> {self.other_user_id} (match {self.match_id})'
+
+    @classmethod
+    def for_match(cls, match):
+        """Две строки членства для мэтча, созданного через ORM."""
+        return [
+            cls(user_id=match.user1_id, match=match, other_user_id=match.user2_id,
+                created_at=match.created_at, last_activity_at=match.created_at),
+            cls(user_id=match.user2_id, match=match, other_user_id=match.user1_id,
+                created_at=match.created_at, last_activity_at=match.created_at),
+        ]
+
+
+# --- ВЗАИМОДЕЙСТВИЯ (ЛАЙКИ И ДИЗЛАЙКИ) ---
+class InteractionQuerySet(models.QuerySet):
+    def likes(self):
+        return self.filter(reaction=Interaction.LIKE)
+
+    def dislikes(self):
+        return self.filter(reaction=Interaction.DISLIKE)
+
+    def record(self, from_user_id, to_user_id, reaction):
+        """
+        Записывает реакцию одним INSERT ... ON CONFLICT DO UPDATE.
+        Повторный свайп того же пользователя просто меняет reaction и created_at.
+        """
+        interaction = self.model(from_user_id=from_user_id, to_user_id=to_user_id, reaction=reaction)
+        self.bulk_create(
+            [interaction],
+            update_conflicts=True,
+            unique_fields=['from_user', 'to_user'],
+            update_fields=['reaction', 'created_at'],
+        )
+        return interaction
 
 
-# --- ВЗАИМОДЕЙСТВИЯ (ВОЗВРАЩЕНА) ---
 class Interaction(models.Model):
-    REACTION_CHOICES = (('like', 'Like'), ('dislike', 'Dislike'))
+    LIKE = 'like'
+    DISLIKE = 'dislike'
+    REACTION_CHOICES = ((LIKE, 'Like'), (DISLIKE, 'Dislike'))
     from_user = models.ForeignKey(User, related_name='interactions_from', on_delete=models.CASCADE)
     to_user = models.ForeignKey(User, related_name='interactions_to', on_delete=models.CASCADE)
     reaction = models.CharField(max_length=10, choices=REACTION_CHOICES)
     created_at = models.DateTimeField(auto_now_add=True)
 
-    class Meta: unique_together = ('from_user', 'to_user')
+    objects = InteractionQuerySet.as_manager()
+
+    class Meta:
+        unique_together = ('from_user', 'to_user')
+        indexes = [
+            # "Кто меня лайкнул" и счетчик полученных лайков
+            models.Index(fields=['to_user', 'from_user'], condition=Q(reaction='like'),
+                         name='interaction_like_to_idx'),
+            # История свайпов пользователя по времени
+            models.Index(fields=['from_user', '-created_at'], name='interaction_from_created_idx'),
+        ]
 
     def __str__(self): return f'{self.from_user.username} -> {self.to_user.username}: {self.reaction}'
 
 
+class ReactionManager(models.Manager):
+    """Менеджер прокси-моделей Like/Dislike: видит только взаимодействия со своей реакцией."""
+
+    def __init__(self, reaction):
+        super().__init__()
+        self.reaction = reaction
+
+    def get_queryset(self):
+        return InteractionQuerySet(self.model, using=self._db).filter(reaction=self.reaction)
+
+
+class ReadOnlyReactionMixin:
+    def save(self, *args, **kwargs):
+        raise TypeError(f'{type(self).__name__} только для чтения, используйте Interaction.objects.record()')
+
+
+# Like и Dislike оставлены для совместимости: это представления над Interaction только для чтения
+class Like(ReadOnlyReactionMixin, Interaction):
+    objects = ReactionManager(Interaction.LIKE)
+
+    class Meta: proxy = True
+
+
+class Dislike(ReadOnlyReactionMixin, Interaction):
+    objects = ReactionManager(Interaction.DISLIKE)
+
+    class Meta: proxy = True
+
+
+# --- СТАТИСТИКА ПОЛЬЗОВАТЕЛЯ ---
+class UserStats(models.Model):
+    """
+    Денормализованные счетчики для профиля. Обновляются F-выражениями в сервисе
+    свайпов (connect_u_app/stats.py) и пересобираются командой rebuild_user_stats.
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='stats')
+    likes_given = models.IntegerField(default=0)
+    likes_received = models.IntegerField(default=0)
+    dislikes_given = models.IntegerField(default=0)
+    matches_count = models.IntegerField(default=0)
+
+    def __str__(self): return f'Stats for {self.user_id}'
+
+
+# --- ЗАРАНЕЕ ПОСЧИТАННЫЕ КАНДИДАТЫ ---
+class CandidateSlate(models.Model):
+    """
+    Лучшие кандидаты пользователя по убыванию оценки, одной строкой-массивом.
+    Пишется командой precompute_candidates, читается лентой и буфером следующей
+    карточки (recommendations.precomputed_candidate_ids).
+    """
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='slate')
+    candidate_ids = ArrayField(models.BigIntegerField(), default=list)
+    # Время начала прогона: свайпы и правки профиля позже него попадут в следующий пересчет
+    computed_at = models.DateTimeField()
+
+    def __str__(self): return f'Slate for {self.user_id}'
+
+
 # --- СИГНАЛЫ ---
 
 @receiver(post_save, sender=User)
 def create_or_update_user_profile(sender, instance, created, **kwargs):
-    if created: UserProfile.objects.create(user=instance, full_name=instance.username.split('@')[0])
-    if hasattr(instance, 'profile'): instance.profile.save()
+    if created:
+        UserProfile.objects.create(user=instance, full_name=instance.username.split('@')[0])
+        UserStats.objects.create(user=instance)
+    # Профиль при сохранении User не пересохраняем: иначе каждый вход (last_login) менял бы
+    # updated_at, ETag, версию карточки и поисковый вектор. Поля User, видные в профиле,
+    # отслеживает signals.touch_profile_on_user_change
+
+
+@receiver(post_save, sender=Match)
+def create_match_memberships(sender, instance, created, **kwargs):
+    # Сервис свайпов пишет членство сам в том же запросе; это для мэтчей из админки и shell
+    if created:
+        MatchMembership.objects.bulk_create(MatchMembership.for_match(instance), ignore_conflicts=True)
+
+
+@receiver(post_save, sender=Photo)
+def schedule_photo_processing(sender, instance, created, **kwargs):
+    if created and instance.status == Photo.PROCESSING:
+        transaction.on_commit(lambda: images.process_photo(instance.pk))
 
 
 @receiver(post_save, sender=Photo)
 def ensure_single_main_photo(sender, instance, created, **kwargs):
     if instance.is_main:
-        Photo.objects.filter(user=instance.user).exclude(pk=instance.pk).update(is_main=False)
-        profile = instance.user.profile
-        if profile.avatar != instance.image:
-            profile.avatar = instance.image
-            profile.save()
-
-
-# НОВОЕ: Сигналы для синхронизации Like/Dislike с Interaction
-@receiver(post_save, sender=Like)
-def sync_like_to_interaction(sender, instance, created, **kwargs):
-    Interaction.objects.update_or_create(
-        from_user=instance.from_user,
-        to_user=instance.to_user,
-        defaults={'reaction': 'like', 'created_at': instance.created_at}
-    )
-
-
-@receiver(post_save, sender=Dislike)
-def sync_dislike_to_interaction(sender, instance, created, **kwargs):
-    Interaction.objects.update_or_create(
-        from_user=instance.from_user,
-        to_user=instance.to_user,
-        defaults={'reaction': 'dislike', 'created_at': instance.created_at}
-    )
-
-
-@receiver(post_delete, sender=Like)
-@receiver(post_delete, sender=Dislike)
-def delete_interaction(sender, instance, **kwargs):
-    Interaction.objects.filter(from_user=instance.from_user, to_user=instance.to_user).delete()
+        # Снимаем флаг только с действительно главных фото, а аватар ставим UPDATE без save() профиля
+        Photo.objects.filter(user_id=instance.user_id, is_main=True).exclude(pk=instance.pk).update(is_main=False)
+        if UserProfile.objects.filter(user_id=instance.user_id).exclude(avatar=instance.image.name).update(
+            avatar=instance.image.name, avatar_variants=instance.variants, updated_at=timezone.now()
+        ):
+            # update() не шлет post_save профиля и не трогает auto_now: карточку и updated_at обновляем сами
+            fragments.bump_versions([instance.user_id])
@@ -0,0 +1,89 @@
+# connect_u_app/notifications.py
+"""
+Уведомления пользователю в реальном времени.
+
+Каждый открытый сайт (и мобильный клиент) держит один сокет ws/notifications/,
+NotificationConsumer подписывает его на группу user_<id>. Сюда отправляются
+новые мэтчи, сообщения из чатов и готовность обработанных фото - одним потоком
+с полем type, вместо опроса страницы мэтчей и MatchViewSet.
+
+Недоступный слой каналов не должен ломать свайп или обработку фото: ошибки
+отправки только пишутся в лог.
+"""
+import logging
+
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+logger = logging.getLogger(__name__)
+
+MATCH = 'match'
+MESSAGE = 'message'
+PHOTO = 'photo'
+
+MESSAGE_PREVIEW_LENGTH = 100
+
+
+def user_group(user_id):
+    return f'user_{user_id}'
+
+
+def _event(kind, data):
+    return {'type': 'notification', 'kind': kind, 'data': data}
+
+
+def notify(user_id, kind, data):
+    """Отправка из синхронного кода (вьюхи, сервисы, колбэки пула)."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        async_to_sync(layer.group_send)(user_group(user_id), _event(kind, data))
+    except Exception:
+        logger.exception('Could not notify user %s about %s', user_id, kind)
+
+
+async def anotify(user_id, kind, data):
+    """Отправка из консьюмеров."""
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    try:
+        await layer.group_send(user_group(user_id), _event(kind, data))
+    except Exception:
+        logger.exception('Could not notify user %s about %s', user_id, kind)
+
+
+def user_card(profile):
+    from .thumbnails import avatar_thumbnail_url
+
+    return {'user_id': profile.user_id, 'name': profile.full_name, 'avatar_url': avatar_thumbnail_url(profile, 96)}
+
+
+def notify_matches(matches):
+    """
+    matches - тройки (match_id, user1_id, user2_id). Каждый участник получает
+    карточку собеседника; профили всех участников читаются одним запросом.
+    """
+    from .models import UserProfile
+
+    if not matches:
+        return
+    user_ids = {user_id for _, user1_id, user2_id in matches for user_id in (user1_id, user2_id)}
+    cards = {profile.user_id: user_card(profile) for profile in UserProfile.objects.filter(user_id__in=user_ids)}
+
+    for match_id, user1_id, user2_id in matches:
+        for user_id, other_id in ((user1_id, user2_id), (user2_id, user1_id)):
+            card = cards.get(other_id, {'user_id': other_id, 'name': '', 'avatar_url': ''})
+            notify(user_id, MATCH, {'match_id': match_id, **card})
+
+
+def message_data(match_id, message_id, content, sender_id, sender_name, sender_avatar_url):
+    return {
+        'match_id': match_id,
+        'message_id': message_id,
+        'sender_id': sender_id,
+        'sender_name': sender_name,
+        'sender_avatar_url': sender_avatar_url,
+        'preview': content[:MESSAGE_PREVIEW_LENGTH],
+    }
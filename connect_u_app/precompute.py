@@ -0,0 +1,264 @@
+# connect_u_app/precompute.py
+"""
+Офлайн-расчет лучших кандидатов для ленты (manage.py precompute_candidates).
+
+Процесс Django один раз читает всех возможных кандидатов в массивы NumPy
+(id, маска интересов, пол, возраст, давность визита) и передает их воркерам
+пула при старте. Пользователи для пересчета делятся на пачки: для пачки
+процесс Django читает историю свайпов, а воркер без ORM оценивает для каждого
+пользователя всех кандидатов сразу и возвращает CANDIDATE_SLATE_SIZE лучших.
+Результат пишется в CandidateSlate через bulk_create ... ON CONFLICT.
+
+Оценка - взвешенная сумма (SLATE_WEIGHTS):
+- interests: коэффициент Жаккара масок интересов (compatibility.py);
+- gender: доля лайков пользователя, доставшихся этому полу (со сглаживанием);
+- age: близость к среднему возрасту тех, кого пользователь лайкал (без лайков -
+  к своему возрасту);
+- recency: насколько давно кандидат заходил на сайт;
+- collaborative: шанс взаимного лайка по модели collaborative.py, если она
+  обучена. Каждый воркер открывает файлы модели через mmap сам, страницы общие.
+Явных настроек пола и возраста у пользователя нет, поэтому предпочтения
+выводятся из его лайков. Уже оцененные кандидаты и сам пользователь исключаются.
+
+Пересчет инкрементальный: берутся пользователи без слейта, со слейтом старше
+max_age, со свайпами или правкой профиля после computed_at.
+
+Модели здесь импортируются внутри функций: модуль загружается в процессах пула,
+где Django не инициализирован.
+"""
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+
+from . import collaborative
+from .compatibility import INTEREST_MASK_BYTES, jaccard_scores, mask_matrix
+
+logger = logging.getLogger(__name__)
+
+CANDIDATE_SLATE_SIZE = getattr(settings, 'CANDIDATE_SLATE_SIZE', 200)
+SLATE_WEIGHTS = getattr(settings, 'SLATE_WEIGHTS', {
+    'interests': 0.5, 'gender': 0.2, 'age': 0.15, 'recency': 0.15, 'collaborative': 0.5,
+})
+AGE_SPREAD = 5  # лет: на таком расстоянии от предпочтительного возраста оценка падает до 1/e
+RECENCY_DAYS = 14  # дней без визита, за которые оценка давности падает до 1/e
+
+GENDERS = ('M', 'F')
+
+# Кандидаты и коллаборативная модель в процессе воркера (заполняются инициализатором пула)
+_candidates = None
+_model = None
+
+
+# --- ВОРКЕР (ПРОЦЕСС ПУЛА) ---
+
+def init_worker(candidates, model_path=None):
+    global _candidates, _model
+    _candidates = candidates
+    _model = None
+    if model_path:
+        try:
+            _model = collaborative.load(model_path)
+            # Строки модели для кандидатов один раз на воркер, а не на каждого пользователя
+            _candidates['model_rows'] = _model.rows(candidates['ids'])
+        except (OSError, ValueError):
+            # Битая или недописанная модель не должна останавливать пересчет: считаем без нее
+            logger.exception('Could not load recommender model from %s, scoring without it', model_path)
+            _model = None
+            _candidates.pop('model_rows', None)
+
+
+def score_user(candidates, mask, age, swiped, liked, user_id=None, model=None):
+    """
+    Оценки всех кандидатов для одного пользователя. swiped - индексы кандидатов,
+    которых он уже оценил (они и сам пользователь получают -inf), liked - индексы лайкнутых,
+    model - collaborative.Model или None.
+    """
+    weights = SLATE_WEIGHTS
+    scores = weights['interests'] * jaccard_scores(mask, candidates['masks'])
+
+    # Пол: доля лайков, сглаживание (k + 1) / (n + 2) - без лайков оба пола по 0.5
+    liked_genders = candidates['genders'][liked]
+    for code in range(len(GENDERS)):
+        share = (np.count_nonzero(liked_genders == code) + 1) / (len(liked) + 2)
+        scores += weights['gender'] * share * (candidates['genders'] == code)
+
+    liked_ages = candidates['ages'][liked]
+    liked_ages = liked_ages[~np.isnan(liked_ages)]
+    preferred = liked_ages.mean() if len(liked_ages) else age
+    if not np.isnan(preferred):
+        closeness = np.exp(-((candidates['ages'] - preferred) / AGE_SPREAD) ** 2)
+        # Без даты рождения - середина шкалы, чтобы не выпадать совсем и не обгонять подходящих
+        scores += weights['age'] * np.nan_to_num(closeness, nan=0.5)
+
+    scores += weights['recency'] * np.exp(-candidates['idle_days'] / RECENCY_DAYS)
+    if model is not None:
+        match = model.match_scores(user_id, rows=candidates['model_rows'])
+        scores += weights.get('collaborative', 0) * collaborative.scaled(match)
+    scores[swiped] = -np.inf
+    return scores
+
+
+def top_ids(candidates, scores, limit):
+    eligible = np.count_nonzero(scores > -np.inf)
+    limit = min(limit, eligible)
+    if limit <= 0:
+        return []
+    top = np.argpartition(-scores, limit - 1)[:limit]
+    top = top[np.argsort(-scores[top], kind='stable')]
+    return candidates['ids'][top].tolist()
+
+
+def compute_chunk(users, swipes, limit):
+    """
+    users - кортежи (user_id, маска, возраст или nan); swipes - {user_id: (ID оцененных, ID лайкнутых)}.
+    Возвращает пары (user_id, ID лучших кандидатов).
+    """
+    candidates = _candidates
+    ids = candidates['ids']
+    results = []
+    for user_id, mask, age in users:
+        swiped_ids, liked_ids = swipes.get(user_id, ((), ()))
+        swiped = _positions(ids, [user_id, *swiped_ids])
+        liked = _positions(ids, liked_ids)
+        scores = score_user(candidates, mask, age, swiped, liked, user_id, _model)
+        results.append((user_id, top_ids(candidates, scores, limit)))
+    return results
+
+
+def _positions(sorted_ids, values):
+    """Индексы values в отсортированном массиве ID; отсутствующие пропускаются."""
+    values = np.asarray(values, dtype=np.int64)
+    positions = np.searchsorted(sorted_ids, values)
+    found = positions < len(sorted_ids)
+    positions, values = positions[found], values[found]
+    return positions[sorted_ids[positions] == values]
+
+
+# --- ПРОЦЕСС DJANGO ---
+
+def load_candidates(now):
+    """Все, кого можно показать в ленте, в виде массивов, отсортированных по id."""
+    from django.db.models.functions import Coalesce
+
+    from .models import User
+
+    rows = list(User.objects.filter(
+        is_active=True,
+        is_superuser=False,
+        profile__searchable=True,
+    ).order_by('pk').values_list(
+        'pk', 'profile__interest_mask', 'gender', 'birth_date', Coalesce('last_login', 'date_joined'),
+    ))
+    ages = [_age(birth_date, now) for _, _, _, birth_date, _ in rows]
+    return {
+        'ids': np.array([row[0] for row in rows], dtype=np.int64),
+        'masks': mask_matrix([row[1] or bytes(INTEREST_MASK_BYTES) for row in rows]),
+        'genders': np.array([GENDERS.index(row[2]) if row[2] in GENDERS else -1 for row in rows], dtype=np.int8),
+        'ages': np.array(ages, dtype=np.float32),
+        'idle_days': np.array([(now - row[4]).total_seconds() / 86400 for row in rows], dtype=np.float32),
+    }
+
+
+def _age(birth_date, now):
+    if birth_date is None:
+        return np.nan
+    today = now.date()
+    return today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
+
+
+def users_to_update(now, max_age, full=False):
+    """ID пользователей, чей слейт нужно пересчитать."""
+    from django.db.models import Exists, F, OuterRef, Q
+
+    from .models import Interaction, User
+
+    users = User.objects.filter(is_active=True, is_superuser=False)
+    if not full:
+        new_swipes = Interaction.objects.filter(from_user=OuterRef('pk'), created_at__gt=OuterRef('slate__computed_at'))
+        users = users.filter(
+            Q(slate__isnull=True)
+            | Q(slate__computed_at__lt=now - max_age)
+            | Q(profile__updated_at__gt=F('slate__computed_at'))
+            | Exists(new_swipes)
+        )
+    return list(users.order_by('pk').values_list('pk', flat=True))
+
+
+def load_chunk(user_ids, now):
+    """Входные данные воркера для пачки пользователей: маски, возраст и история свайпов."""
+    from .models import Interaction, User
+
+    users = [
+        (user_id, bytes(mask or b''), _age(birth_date, now))
+        for user_id, mask, birth_date in User.objects.filter(pk__in=user_ids).values_list(
+            'pk', 'profile__interest_mask', 'birth_date',
+        )
+    ]
+    swipes = {}
+    for from_user_id, to_user_id, reaction in Interaction.objects.filter(from_user_id__in=user_ids).values_list(
+        'from_user_id', 'to_user_id', 'reaction',
+    ):
+        swiped, liked = swipes.setdefault(from_user_id, ([], []))
+        swiped.append(to_user_id)
+        if reaction == Interaction.LIKE:
+            liked.append(to_user_id)
+    return users, swipes
+
+
+def save_slates(results, computed_at):
+    from .models import CandidateSlate
+
+    slates = [CandidateSlate(user_id=user_id, candidate_ids=ids, computed_at=computed_at) for user_id, ids in results]
+    CandidateSlate.objects.bulk_create(
+        slates,
+        update_conflicts=True,
+        unique_fields=['user'],
+        update_fields=['candidate_ids', 'computed_at'],
+        batch_size=1000,
+    )
+    return len(slates)
+
+
+def precompute(workers=2, chunk_size=500, limit=CANDIDATE_SLATE_SIZE, max_age=timedelta(days=1), full=False,
+               progress=None):
+    """Пересчитывает слейты. Возвращает (пересчитано пользователей, всего кандидатов)."""
+    from django.utils import timezone
+
+    # Время начала прогона: все, что изменится во время расчета, попадет в следующий
+    now = timezone.now()
+    user_ids = users_to_update(now, max_age, full=full)
+    if not user_ids:
+        return 0, 0
+    candidates = load_candidates(now)
+    chunks = (load_chunk(user_ids[start:start + chunk_size], now) for start in range(0, len(user_ids), chunk_size))
+
+    saved = 0
+    model_path = collaborative.current_path()
+    if workers <= 0:
+        init_worker(candidates, model_path)
+        for users, swipes in chunks:
+            saved += save_slates(compute_chunk(users, swipes, limit), now)
+            if progress:
+                progress(saved, len(user_ids))
+        return saved, len(candidates['ids'])
+
+    # spawn, как и у пула фотографий: форк процесса с открытыми соединениями к БД небезопасен
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=init_worker, initargs=(candidates, model_path)) as executor:
+        # Держим в работе не больше двух пачек на воркер, чтобы не читать всю историю свайпов заранее
+        pending = []
+        for users, swipes in chunks:
+            pending.append(executor.submit(compute_chunk, users, swipes, limit))
+            if len(pending) >= workers * 2:
+                saved += save_slates(pending.pop(0).result(), now)
+                if progress:
+                    progress(saved, len(user_ids))
+        for future in pending:
+            saved += save_slates(future.result(), now)
+            if progress:
+                progress(saved, len(user_ids))
+    return saved, len(candidates['ids'])
@@ -0,0 +1,88 @@
+# connect_u_app/presence.py
+"""
+Кто сейчас онлайн.
+
+Статус живет в кэше (Redis в проде, locmem в разработке и тестах), а не в базе:
+ключ presence:<user_id> хранит открытые сокеты пользователя, у каждого свой
+срок PRESENCE_TTL секунд. Каждый сокет продлевает свой срок heartbeat-кадром
+раз в PRESENCE_HEARTBEAT секунд и, если запись успела истечь, добавляет ее
+заново, так что после истечения статуса остальные сокеты не теряются. Если
+процесс Daphne упал и disconnect не случился, сокет сам выпадет по сроку.
+"""
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+PRESENCE_TTL = getattr(settings, 'PRESENCE_TTL', 60)
+PRESENCE_HEARTBEAT = getattr(settings, 'PRESENCE_HEARTBEAT', 25)
+PRESENCE_LOCK_TIMEOUT = getattr(settings, 'PRESENCE_LOCK_TIMEOUT', 2)
+
+
+def _key(user_id):
+    return f'presence:{user_id}'
+
+
+def _alive(sockets):
+    now = time.time()
+    return {socket_id: expires for socket_id, expires in (sockets or {}).items() if expires > now}
+
+
+@contextmanager
+def _lock(user_id):
+    # Набор сокетов читается и пишется целиком, поэтому сокеты одного пользователя
+    # меняют его по очереди; зависшая блокировка истекает сама
+    key = f'{_key(user_id)}:lock'
+    deadline = time.monotonic() + PRESENCE_LOCK_TIMEOUT
+    while not (locked := cache.add(key, 1, PRESENCE_LOCK_TIMEOUT)) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    try:
+        yield
+    finally:
+        if locked:
+            cache.delete(key)
+
+
+def _update(user_id, socket_id, alive):
+    """Добавляет (продлевает) или убирает сокет. Возвращает (был онлайн, онлайн сейчас)."""
+    key = _key(user_id)
+    with _lock(user_id):
+        sockets = _alive(cache.get(key))
+        was_online = bool(sockets)
+        if alive:
+            sockets[socket_id] = time.time() + PRESENCE_TTL
+        else:
+            sockets.pop(socket_id, None)
+        if sockets:
+            cache.set(key, sockets, PRESENCE_TTL)
+        else:
+            cache.delete(key)
+    return was_online, bool(sockets)
+
+
+def connect(user_id, socket_id):
+    """Открыт еще один сокет. True - пользователь только что стал онлайн."""
+    was_online, _ = _update(user_id, socket_id, alive=True)
+    return not was_online
+
+
+def heartbeat(user_id, socket_id):
+    """Продлевает сокет. True - статус успел истечь и пользователь снова онлайн."""
+    return connect(user_id, socket_id)
+
+
+def disconnect(user_id, socket_id):
+    """Закрыт сокет. True - это был последний, пользователь офлайн."""
+    _, online = _update(user_id, socket_id, alive=False)
+    return not online
+
+
+def is_online(user_id):
+    return bool(_alive(cache.get(_key(user_id))))
+
+
+def online_ids(user_ids):
+    """Кто из user_ids онлайн, одним запросом к кэшу."""
+    values = cache.get_many([_key(user_id) for user_id in user_ids])
+    return {user_id for user_id in user_ids if _alive(values.get(_key(user_id)))}
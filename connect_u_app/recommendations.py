@@ -0,0 +1,234 @@
+# connect_u_app/recommendations.py
+
+import random
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from . import collaborative
+from .bloom import BloomFilter
+from .compatibility import top_candidates
+from .models import CandidateSlate, User, UserProfile, Interaction
+
+# Фильтр Блума "уже оценены": емкость по умолчанию, доля ложных срабатываний и время жизни в кэше
+SEEN_FILTER_CAPACITY = getattr(settings, 'SEEN_FILTER_CAPACITY', 2000)
+SEEN_FILTER_FP_RATE = getattr(settings, 'SEEN_FILTER_FP_RATE', 0.01)
+SEEN_TTL = getattr(settings, 'SEEN_FILTER_TTL', 60 * 60 * 24)
+NEXT_BUFFER_SIZE = getattr(settings, 'NEXT_BUFFER_SIZE', 20)
+NEXT_BUFFER_TTL = getattr(settings, 'NEXT_BUFFER_TTL', 60 * 10)
+# Сколько случайных кандидатов оценивается по интересам, чтобы выбрать лучших для колоды или буфера
+RANK_POOL_SIZE = getattr(settings, 'RANK_POOL_SIZE', 5000)
+# Старше - слейт из precompute_candidates не читается, кандидаты выбираются живым запросом
+SLATE_MAX_AGE = getattr(settings, 'SLATE_MAX_AGE', 60 * 60 * 48)
+# Вес оценки коллаборативной модели (collaborative.py) рядом с общими интересами (Жаккар, 0..1)
+COLLABORATIVE_WEIGHT = getattr(settings, 'COLLABORATIVE_WEIGHT', 0.5)
+
+
+def candidate_queryset(user, filters=None, exclude_swiped=True):
+    """
+    Базовый набор кандидатов для ленты: активные, не суперюзеры, доступные для поиска,
+    без самого пользователя и без тех, с кем уже было взаимодействие.
+    exclude_swiped=False - без anti-join по Interaction: оцененных отсеивает фильтр get_seen.
+    """
+    candidates = User.objects.filter(
+        is_active=True,
+        is_superuser=False,
+        profile__searchable=True,
+    ).exclude(pk=user.pk)
+    if exclude_swiped:
+        already_seen = Interaction.objects.filter(from_user=user, to_user=OuterRef('pk'))
+        candidates = candidates.filter(~Exists(already_seen))
+
+    if filters:
+        candidates = apply_feed_filters(candidates, filters)
+    return candidates
+
+
+def apply_feed_filters(queryset, filters):
+    """Применяет к набору пользователей фильтры из UserFilterForm (cleaned_data)."""
+    gender = filters.get('gender')
+    min_age = filters.get('min_age')
+    max_age = filters.get('max_age')
+    city = filters.get('city')
+
+    if gender:
+        queryset = queryset.filter(gender=gender)
+
+    if city:
+        queryset = queryset.filter(profile__city__icontains=city)
+
+    today = date.today()
+    if min_age:
+        max_birth_date = today.replace(year=today.year - min_age)
+        queryset = queryset.filter(birth_date__lte=max_birth_date)
+
+    if max_age:
+        min_birth_date = today.replace(year=today.year - (max_age + 1))
+        queryset = queryset.filter(birth_date__gte=min_birth_date)
+
+    return queryset
+
+
+def sample_candidate_ids(queryset, limit, fields=('pk',)):
+    """
+    Возвращает до `limit` случайных ID из набора без ORDER BY RANDOM().
+
+    Берем случайную точку в [0, 1) и читаем ID по индексу на User.random_key
+    начиная с нее, а если не хватило — добираем с начала диапазона.
+    С несколькими fields возвращаются кортежи значений, а не ID.
+    """
+    pivot = random.random()
+    flat = len(fields) == 1
+    ids = list(queryset.filter(random_key__gte=pivot).order_by('random_key').values_list(*fields, flat=flat)[:limit])
+    if len(ids) < limit:
+        ids += queryset.filter(random_key__lt=pivot).order_by('random_key').values_list(
+            *fields, flat=flat)[:limit - len(ids)]
+    return ids
+
+
+def ranked_candidate_ids(user, limit, filters=None, pool_size=RANK_POOL_SIZE):
+    """
+    До `limit` ID кандидатов ленты, сначала те, у кого больше общих интересов с
+    user и выше шанс взаимного лайка по коллаборативной модели. Оценивается
+    случайная выборка из pool_size кандидатов одним запросом вместе с масками
+    интересов, без JOIN по M2M (compatibility.py).
+
+    Уже оцененные отсеиваются фильтром get_seen в памяти, а не anti-join на
+    каждого кандидата выборки. Если после этого кандидатов не хватает (почти все
+    из выборки уже оценены), выборка повторяется с точным anti-join.
+    """
+    mask = UserProfile.objects.filter(user_id=user.pk).values_list('interest_mask', flat=True).first() or b''
+    fields = ('pk', 'profile__interest_mask')
+    size = max(pool_size, limit)
+    pool = sample_candidate_ids(candidate_queryset(user, filters, exclude_swiped=False), size, fields=fields)
+    sampled = len(pool)
+    if pool:
+        swiped = get_seen(user.pk).contains_many([candidate_id for candidate_id, _ in pool])
+        pool = [row for row, is_swiped in zip(pool, swiped) if not is_swiped]
+    if len(pool) < limit and sampled == size:
+        pool = sample_candidate_ids(candidate_queryset(user, filters), size, fields=fields)
+    # Выборка идет по random_key по порядку: перемешиваем, чтобы равные по оценке не шли всегда одинаково
+    random.shuffle(pool)
+    boost = COLLABORATIVE_WEIGHT * collaborative.match_scores(user.pk, [candidate_id for candidate_id, _ in pool])
+    return top_candidates(mask, pool, limit, boost=boost)
+
+
+def precomputed_candidate_ids(user, limit=None):
+    """
+    Кандидаты из CandidateSlate (manage.py precompute_candidates) без тех, кого
+    user оценил после расчета. None - слейта нет, он устарел или уже исчерпан:
+    тогда кандидаты выбираются живым запросом.
+    """
+    ids = CandidateSlate.objects.filter(
+        user_id=user.pk,
+        computed_at__gte=timezone.now() - timedelta(seconds=SLATE_MAX_AGE),
+    ).values_list('candidate_ids', flat=True).first()
+    if ids is None:
+        return None
+
+    # Свайпы после расчета отсеивает фильтр get_seen, без запроса к Interaction
+    swiped = get_seen(user.pk).contains_many(ids)
+    ids = [candidate_id for candidate_id, is_swiped in zip(ids, swiped) if not is_swiped]
+    if not ids:
+        return None
+    return ids[:limit] if limit else ids
+
+
+# --- УЖЕ ПРОСМОТРЕННЫЕ ---
+# Все, кого пользователь оценил, - фильтр Блума в кэше (bloom.py): несколько КБ
+# вместо растущего множества ID. Обновляется при каждом свайпе, а при промахе кэша
+# собирается заново из Interaction. Ложное срабатывание (около SEEN_FILTER_FP_RATE)
+# только пропускает кандидата.
+# Чтение и запись фильтра в кэше не атомарны: пересборка, идущая одновременно со
+# свайпом, может затереть его отметку. Поэтому фильтр только отсеивает основную
+# массу кандидатов, а итоговые ID (страница ленты, следующая карточка) еще раз
+# проверяются по Interaction в том же запросе, которым загружаются.
+
+def _seen_key(user_id):
+    return f'seen:{user_id}'
+
+
+def build_seen(user_id):
+    """Собирает фильтр из Interaction; емкость - с запасом вдвое от текущего числа свайпов."""
+    ids = list(Interaction.objects.filter(from_user_id=user_id).values_list('to_user_id', flat=True))
+    seen = BloomFilter(max(SEEN_FILTER_CAPACITY, 2 * len(ids)), SEEN_FILTER_FP_RATE)
+    seen.add_many(ids)
+    cache.set(_seen_key(user_id), seen.state(), SEEN_TTL)
+    return seen
+
+
+def get_seen(user_id):
+    """Фильтр оцененных пользователем: проверка `id in seen` или seen.contains_many(ids)."""
+    state = cache.get(_seen_key(user_id))
+    return BloomFilter.from_state(state) if state is not None else build_seen(user_id)
+
+
+def mark_seen(user_id, target_id):
+    """Запоминает лайк/дизлайк, чтобы кэшированные колоды и буферы его пропускали."""
+    mark_seen_many(user_id, [target_id])
+
+
+def mark_seen_many(user_id, target_ids):
+    if not target_ids:
+        return
+    key = _seen_key(user_id)
+    state = cache.get(key)
+    if state is None:
+        return  # свайп уже в Interaction, фильтр соберется с ним при следующем чтении
+    seen = BloomFilter.from_state(state)
+    if seen.count + len(target_ids) > seen.capacity:
+        # Переполненный фильтр дает больше ложных срабатываний: пересоберем с большей емкостью
+        cache.delete(key)
+        return
+    seen.add_many(target_ids)
+    cache.set(key, seen.state(), SEEN_TTL)
+
+
+# --- СЛЕДУЮЩАЯ КАРТОЧКА ---
+
+def _buffer_key(user_id):
+    return f'next:{user_id}'
+
+
+def next_candidate(user):
+    """
+    Возвращает следующего кандидата для карточки лайк/дизлайк.
+
+    Держим в кэше буфер из NEXT_BUFFER_SIZE заранее выбранных ID, поэтому обычный
+    свайп стоит одного запроса по первичному ключу. Буфер пополняется раз в
+    NEXT_BUFFER_SIZE свайпов из заранее посчитанного слейта, а без него -
+    выборкой кандидатов (random_key, оцененные отсеиваются фильтром get_seen)
+    с ранжированием по интересам.
+    """
+    buffer = cache.get(_buffer_key(user.id)) or []
+    seen = get_seen(user.id)
+    refilled = False
+
+    while True:
+        if not buffer:
+            if refilled:
+                break
+            buffer = precomputed_candidate_ids(user, NEXT_BUFFER_SIZE) or ranked_candidate_ids(user, NEXT_BUFFER_SIZE)
+            refilled = True
+            continue
+
+        candidate_id = buffer.pop(0)
+        if candidate_id in seen:
+            continue
+
+        candidate = User.objects.filter(
+            pk=candidate_id,
+            is_active=True,
+            profile__searchable=True,
+        ).exclude(
+            Exists(Interaction.objects.filter(from_user=user, to_user=OuterRef('pk')))
+        ).select_related('profile').first()
+        if candidate is not None:
+            cache.set(_buffer_key(user.id), buffer, NEXT_BUFFER_TTL)
+            return candidate
+
+    cache.delete(_buffer_key(user.id))
+    return None
@@ -0,0 +1,189 @@
+# connect_u_app/search.py
+"""
+Поиск пользователей.
+
+У каждого профиля есть поле search_vector (tsvector) с весами: имя - A, город и
+интересы - B, био - C; скрытый город (show_city) не индексируется. Вектор
+пересчитывается из сигналов (signals.py) и командой rebuild_search_vectors. Основной поиск - websearch-запрос по GIN-индексу с
+ранжированием; если он ничего не нашел (опечатка в имени), включается нечеткий
+поиск по триграммам имени. Страницы листаются подписанным курсором (score, id).
+"""
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVector, TrigramSimilarity
+from django.core import signing
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Case, F, FloatField, OuterRef, Q, Subquery, TextField, Value, When
+from django.db.models.functions import Cast, Coalesce, Upper
+
+from .models import UserProfile
+
+SEARCH_CONFIG = getattr(settings, 'SEARCH_CONFIG', 'russian')
+SEARCH_PAGE_SIZE = getattr(settings, 'SEARCH_PAGE_SIZE', 20)
+SEARCH_SUGGEST_LIMIT = getattr(settings, 'SEARCH_SUGGEST_LIMIT', 8)
+SEARCH_SUGGEST_TIMEOUT_MS = getattr(settings, 'SEARCH_SUGGEST_TIMEOUT_MS', 150)
+SEARCH_MIN_QUERY_LENGTH = 2
+TRIGRAM_THRESHOLD = 0.3
+
+FULLTEXT = 'fts'
+FUZZY = 'trgm'
+_CURSOR_SALT = 'connect_u_app.search'
+
+
+# --- ПОДДЕРЖКА search_vector ---
+
+def _interest_names():
+    # Все интересы профиля одной строкой, чтобы их можно было положить в tsvector
+    through = UserProfile.interests.through
+    names = through.objects.filter(userprofile_id=OuterRef('pk')).values('userprofile_id').annotate(
+        names=StringAgg('interest__name', delimiter=' ')
+    ).values('names')
+    return Coalesce(Subquery(names), Value(''), output_field=TextField())
+
+
+def search_vector_expression():
+    return (
+        SearchVector('full_name', weight='A', config=SEARCH_CONFIG)
+        # Скрытый город не индексируется: иначе по нему можно найти того, кто его скрыл
+        + SearchVector(Case(When(show_city=True, then='city'), default=Value('')), weight='B', config=SEARCH_CONFIG)
+        + SearchVector(_interest_names(), weight='B', config=SEARCH_CONFIG)
+        + SearchVector('bio', weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(profile_ids):
+    """Пересчитывает search_vector одним UPDATE. Через .update(), поэтому сигналы не срабатывают."""
+    if not profile_ids:
+        return 0
+    return UserProfile.objects.filter(pk__in=profile_ids).update(search_vector=search_vector_expression())
+
+
+# --- ПОИСК ---
+
+@dataclass
+class SearchPage:
+    """Страница результатов поиска."""
+    object_list: list
+    next_cursor: str = None
+    fuzzy: bool = False  # результаты нечеткого поиска по имени
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+
+def searchable_profiles(user):
+    """Профили, которые можно показывать в поиске: разрешен поиск, активный пользователь, не сам user."""
+    return UserProfile.objects.filter(
+        searchable=True,
+        user__is_active=True,
+        user__is_superuser=False,
+    ).exclude(user=user).select_related('user')
+
+
+def _fulltext(queryset, query):
+    search_query = SearchQuery(query, search_type='websearch', config=SEARCH_CONFIG)
+    return queryset.filter(search_vector=search_query).annotate(
+        score=Cast(SearchRank(F('search_vector'), search_query), FloatField())
+    )
+
+
+def _fuzzy(queryset, query):
+    # Оператор % по UPPER(full_name) использует триграммный индекс profile_full_name_trgm.
+    # Запрос переводим в верхний регистр в базе, чтобы правила локали совпали с индексом
+    query = Upper(Value(query))
+    return queryset.annotate(name_upper=Upper('full_name')).filter(
+        name_upper__trigram_similar=query
+    ).annotate(score=Cast(TrigramSimilarity(Upper('full_name'), query), FloatField()))
+
+
+# score приводится к double precision: real после округления в Python не сравнился бы на равенство
+def _encode_cursor(mode, score, pk):
+    return signing.dumps([mode, score, pk], salt=_CURSOR_SALT, compress=True)
+
+
+def _decode_cursor(cursor):
+    # Подделанный или устаревший курсор просто начинает поиск сначала
+    try:
+        mode, score, pk = signing.loads(cursor, salt=_CURSOR_SALT)
+        if mode not in (FULLTEXT, FUZZY):
+            return None
+        return mode, float(score), int(pk)
+    except (signing.BadSignature, TypeError, ValueError):
+        return None
+
+
+def _read_page(queryset, after, page_size):
+    if after is not None:
+        score, pk = after
+        queryset = queryset.filter(Q(score__lt=score) | Q(score=score, pk__lt=pk))
+    rows = list(queryset.order_by('-score', '-pk')[:page_size + 1])
+    return rows[:page_size], len(rows) > page_size
+
+
+def search_profiles(user, query, cursor=None, page_size=SEARCH_PAGE_SIZE):
+    """Ранжированный поиск с keyset-пагинацией и нечетким запасным вариантом."""
+    query = (query or '').strip()
+    if len(query) < SEARCH_MIN_QUERY_LENGTH:
+        return SearchPage(object_list=[])
+
+    decoded = _decode_cursor(cursor) if cursor else None
+    mode, after = (decoded[0], decoded[1:]) if decoded else (FULLTEXT, None)
+    base = searchable_profiles(user)
+
+    if mode == FULLTEXT:
+        profiles, has_more = _read_page(_fulltext(base, query), after, page_size)
+        # Полнотекстовый поиск пуст с первой страницы - скорее всего опечатка в имени
+        if not profiles and after is None:
+            mode = FUZZY
+    if mode == FUZZY:
+        with transaction.atomic():
+            with connection.cursor() as db_cursor:
+                db_cursor.execute('SET LOCAL pg_trgm.similarity_threshold = %s', [TRIGRAM_THRESHOLD])
+            profiles, has_more = _read_page(_fuzzy(base, query), after, page_size)
+
+    next_cursor = None
+    if has_more:
+        last = profiles[-1]
+        next_cursor = _encode_cursor(mode, last.score, last.pk)
+    return SearchPage(object_list=profiles, next_cursor=next_cursor, fuzzy=mode == FUZZY)
+
+
+def _prefix_query(query):
+    # "анна моск" -> "анна:* & моск:*"; в сырой tsquery попадают только буквы и цифры
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    return SearchQuery(' & '.join(f'{word}:*' for word in words), search_type='raw', config=SEARCH_CONFIG)
+
+
+def suggest(user, query, limit=SEARCH_SUGGEST_LIMIT):
+    """
+    Подсказки для строки поиска (HTMX typeahead). Запрос ограничен
+    statement_timeout: если база не уложилась в бюджет, подсказок просто нет.
+    """
+    query = (query or '').strip()
+    search_query = _prefix_query(query) if len(query) >= SEARCH_MIN_QUERY_LENGTH else None
+    if search_query is None:
+        return []
+
+    profiles = searchable_profiles(user).filter(search_vector=search_query).annotate(
+        score=SearchRank(F('search_vector'), search_query)
+    ).order_by('-score', '-pk').only('pk', 'full_name', 'city', 'show_city', 'avatar', 'avatar_variants', 'user__id')[:limit]
+
+    try:
+        with transaction.atomic():
+            with connection.cursor() as db_cursor:
+                db_cursor.execute('SET LOCAL statement_timeout = %s', [SEARCH_SUGGEST_TIMEOUT_MS])
+            return list(profiles)
+    except DatabaseError:
+        return []
@@ -1,6 +1,10 @@
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from rest_framework import serializers
-from .models import UserProfile, Interest  # <--- ИЗМЕНЕНИЕ: импортируем UserProfile
+from .models import UserProfile, Interest, Photo, PhotoUpload, Interaction, Match, Message  # <--- ИЗМЕНЕНИЕ: импортируем UserProfile
+from .swipes import SWIPE_BATCH_MAX
+from .images import variant_urls
+from .thumbnails import avatar_sources
 
 User = get_user_model()
 
@@ -16,12 +20,25 @@ class UserSerializerForProfile(serializers.ModelSerializer):
         fields = ['id', 'username', 'email', 'gender', 'age']
 
 
+class AvatarSrcsetField(serializers.Field):
+    """Аватар профиля: src и srcset по форматам (jpeg, webp) из превью thumbnails.py."""
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, profile):
+        return avatar_sources(profile) or {'src': profile.get_avatar_url, 'srcset': {}}
+
+
 class ProfileSerializer(serializers.ModelSerializer):
     """
     Сериализатор для модели UserProfile.
     """
     user = UserSerializerForProfile(read_only=True)
     avatar_url = serializers.CharField(source='get_avatar_url', read_only=True)
+    avatar = AvatarSrcsetField()
 
     # ИЗМЕНЕНИЕ: Правильно обрабатываем ManyToMany поле 'interests'
     # StringRelatedField будет использовать __str__ метод модели Interest (т.е. вернет названия интересов)
@@ -37,4 +54,112 @@ class ProfileSerializer(serializers.ModelSerializer):
             'status',
             'interests',  # <--- ИЗМЕНЕНИЕ: используем реальное имя поля
             'avatar_url',
-        ]
\ No newline at end of file
+            'avatar',
+        ]
+
+    def __init__(self, *args, fields=None, **kwargs):
+        # fields - только эти поля в ответе (?fields= в ProfileViewSet)
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
+
+class UserSerializer(serializers.ModelSerializer):
+    """Публичные данные пользователя для API."""
+
+    class Meta:
+        model = User
+        fields = ['id', 'username', 'gender', 'age']
+
+
+class UserProfileSerializer(serializers.ModelSerializer):
+    """Сериализатор собственного профиля (редактирование через API)."""
+
+    class Meta:
+        model = UserProfile
+        fields = ['id', 'full_name', 'city', 'bio', 'status', 'interests', 'show_age', 'show_city', 'searchable']
+
+
+class PhotoSerializer(serializers.ModelSerializer):
+    variants = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Photo
+        fields = ['id', 'image', 'is_main', 'uploaded_at', 'status', 'variants']
+        read_only_fields = ['uploaded_at', 'status']
+
+    def get_fields(self):
+        fields = super().get_fields()
+        # Файл задается только при создании: замена через PUT/PATCH прошла бы мимо
+        # обработки images.py и могла стать необработанным аватаром
+        if self.instance is not None:
+            fields['image'].read_only = True
+        return fields
+
+    def update(self, instance, validated_data):
+        # instance загружен до изменения, а обработка в фоне (images.finish_photo) могла
+        # за это время записать готовые файлы: полный save() вернул бы status='processing'
+        # и исходный файл. Перечитываем результат обработки под блокировкой строки и пишем
+        # только измененные поля
+        with transaction.atomic():
+            fresh = Photo.objects.select_for_update().only('image', 'status', 'variants').get(pk=instance.pk)
+            instance.image, instance.status, instance.variants = fresh.image, fresh.status, fresh.variants
+            for attr, value in validated_data.items():
+                setattr(instance, attr, value)
+            instance.save(update_fields=list(validated_data))
+        return instance
+
+    def get_variants(self, obj):
+        return variant_urls(obj.variants)
+
+
+class PhotoUploadSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = PhotoUpload
+        fields = ['id', 'filename', 'size', 'offset', 'created_at']
+        read_only_fields = ['id', 'offset', 'created_at']
+
+
+class InteractionSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Interaction
+        fields = ['id', 'to_user', 'reaction', 'created_at']
+        read_only_fields = ['created_at']
+
+
+class MatchSerializer(serializers.ModelSerializer):
+    user1 = UserSerializer(read_only=True)
+    user2 = UserSerializer(read_only=True)
+    # Из строки членства текущего пользователя (аннотации MatchViewSet)
+    unread_count = serializers.IntegerField(read_only=True, default=0)
+    last_activity_at = serializers.DateTimeField(read_only=True, default=None)
+
+    class Meta:
+        model = Match
+        fields = [
+            'id', 'user1', 'user2', 'created_at',
+            'last_message_id', 'last_message_text', 'last_message_at', 'unread_count', 'last_activity_at',
+        ]
+
+
+class MessageSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = Message
+        fields = ['id', 'client_id', 'sender', 'content', 'timestamp']
+
+
+class SwipeSerializer(serializers.Serializer):
+    """Входные данные для свайпа через API."""
+    to_user_id = serializers.IntegerField()
+    reaction = serializers.ChoiceField(choices=Interaction.REACTION_CHOICES)
+
+
+class SwipeBatchItemSerializer(SwipeSerializer):
+    client_ts = serializers.DateTimeField(required=False)
+
+
+class SwipeBatchSerializer(serializers.Serializer):
+    """Пачка свайпов от мобильного клиента."""
+    swipes = SwipeBatchItemSerializer(many=True, allow_empty=False, max_length=SWIPE_BATCH_MAX)
+    cursor = serializers.CharField(required=False, allow_blank=True)
@@ -1,8 +1,10 @@
 # /app/connect_u_app/signals.py
 
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, m2m_changed, pre_delete, post_delete
 from django.dispatch import receiver
-from .models import User, UserProfile
+from django.utils import timezone
+from .models import User, UserProfile, Interest
+from . import compatibility, fragments, search
 
 @receiver(post_save, sender=User)
 def create_user_profile(sender, instance, created, **kwargs):
@@ -15,3 +17,86 @@ def create_user_profile(sender, instance, created, **kwargs):
         UserProfile.objects.get_or_create(user=instance)
     else:
         print(f"--- Флаг created=False. Профиль не создаем. ---")
+
+
+# --- ПОИСКОВЫЙ ИНДЕКС ПРОФИЛЕЙ ---
+
+SEARCH_FIELDS = {'full_name', 'city', 'bio', 'show_city'}
+
+
+@receiver(post_save, sender=UserProfile)
+def update_profile_search_vector(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.update_search_vectors([instance.pk])
+
+
+def interests_changed(profile_ids):
+    # От интересов зависят поисковый вектор, маска для ранжирования и карточка анкеты
+    if not profile_ids:
+        return
+    search.update_search_vectors(profile_ids)
+    compatibility.update_interest_masks(profile_ids)
+    fragments.bump_versions(UserProfile.objects.filter(pk__in=profile_ids).values_list('user_id', flat=True))
+
+
+@receiver(m2m_changed, sender=UserProfile.interests.through)
+def update_search_vector_on_interests(sender, instance, action, reverse, pk_set, **kwargs):
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            search.update_search_vectors([instance.pk])
+            compatibility.update_interest_masks([instance.pk])
+            fragments.bump_versions([instance.user_id])
+        return
+
+    # Со стороны интереса: instance - Interest, pk_set - ID профилей
+    if action == 'pre_clear':
+        instance._search_profile_ids = list(instance.userprofile_set.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        interests_changed(list(pk_set))
+    elif action == 'post_clear':
+        interests_changed(getattr(instance, '_search_profile_ids', []))
+
+
+@receiver(post_save, sender=Interest)
+def update_search_vector_on_interest_rename(sender, instance, created, **kwargs):
+    if not created:
+        interests_changed(list(instance.userprofile_set.values_list('pk', flat=True)))
+
+
+@receiver(pre_delete, sender=Interest)
+def remember_interest_profiles(sender, instance, **kwargs):
+    instance._search_profile_ids = list(instance.userprofile_set.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Interest)
+def update_search_vector_on_interest_delete(sender, instance, **kwargs):
+    interests_changed(getattr(instance, '_search_profile_ids', []))
+
+
+# --- ВЕРСИИ КАРТОЧЕК (connect_u_app/fragments.py) ---
+
+# Поля профиля, которые видны в карточке; возраст берется из User, см. touch_profile_on_user_change
+CARD_FIELDS = {'full_name', 'city', 'avatar', 'show_age', 'show_city'}
+
+
+@receiver(post_save, sender=UserProfile)
+def bump_card_version(sender, instance, update_fields=None, **kwargs):
+    if update_fields is not None and not CARD_FIELDS & set(update_fields):
+        return
+    fragments.bump_versions([instance.user_id])
+
+
+# --- ВРЕМЯ ИЗМЕНЕНИЯ ПРОФИЛЯ (UserProfile.updated_at) ---
+
+# Поля User во вложенном user ответа /api/v1/profiles/ (ETag) и признаки для precompute_candidates
+PROFILE_USER_FIELDS = {'username', 'email', 'gender', 'birth_date'}
+
+
+@receiver(post_save, sender=User)
+def touch_profile_on_user_change(sender, instance, created, update_fields=None, **kwargs):
+    if created or (update_fields is not None and not PROFILE_USER_FIELDS & set(update_fields)):
+        return
+    UserProfile.objects.filter(user=instance).update(updated_at=timezone.now())
+    # Возраст в карточке считается по birth_date
+    fragments.bump_versions([instance.pk])
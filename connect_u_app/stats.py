@@ -0,0 +1,66 @@
+# connect_u_app/stats.py
+"""
+Поддержка денормализованных счетчиков UserStats на пути записи свайпов.
+Вызывается внутри транзакции сервиса свайпов, поэтому счетчики меняются
+атомарно вместе с самой реакцией и мэтчем.
+"""
+from collections import defaultdict
+
+from django.db.models import F
+
+from .models import Interaction, UserStats
+
+
+def reaction_deltas(previous, reaction):
+    """Изменение (лайков, дизлайков) при смене реакции previous -> reaction."""
+    likes = (reaction == Interaction.LIKE) - (previous == Interaction.LIKE)
+    dislikes = (reaction == Interaction.DISLIKE) - (previous == Interaction.DISLIKE)
+    return likes, dislikes
+
+
+def _lock(user_ids):
+    """
+    Блокирует строки UserStats по возрастанию pk до любых UPDATE. Advisory-блокировка
+    покрывает только пару, а встречные свайпы X->Y, Y->Z, Z->X иначе берут блокировки
+    строк по кругу и упираются в deadlock.
+    """
+    user_ids = sorted(set(user_ids))
+    if user_ids:
+        list(UserStats.objects.filter(pk__in=user_ids).order_by('pk').select_for_update().values_list('pk', flat=True))
+
+
+def _increment(user_ids, **deltas):
+    deltas = {name: F(name) + delta for name, delta in deltas.items() if delta}
+    if user_ids and deltas:
+        UserStats.objects.filter(pk__in=user_ids).update(**deltas)
+
+
+def apply_swipe(from_user_id, to_user_id, previous, reaction, match_created):
+    likes, dislikes = reaction_deltas(previous, reaction)
+    if likes or dislikes or match_created:
+        _lock([from_user_id, to_user_id])
+    _increment([from_user_id], likes_given=likes, dislikes_given=dislikes, matches_count=int(match_created))
+    _increment([to_user_id], likes_received=likes, matches_count=int(match_created))
+
+
+def apply_swipe_batch(from_user_id, changes, partner_ids):
+    """
+    changes - тройки (to_user_id, previous, reaction), partner_ids - с кем появились
+    новые мэтчи. Получатели группируются по величине изменения, чтобы обойтись
+    несколькими UPDATE на всю пачку.
+    """
+    total_likes = total_dislikes = 0
+    received = defaultdict(list)
+    for to_user_id, previous, reaction in changes:
+        likes, dislikes = reaction_deltas(previous, reaction)
+        total_likes += likes
+        total_dislikes += dislikes
+        if likes:
+            received[likes].append(to_user_id)
+
+    _lock([from_user_id, *(to_user_id for to_user_id, _, _ in changes), *partner_ids])
+    _increment([from_user_id], likes_given=total_likes, dislikes_given=total_dislikes,
+               matches_count=len(partner_ids))
+    for likes, user_ids in received.items():
+        _increment(user_ids, likes_received=likes)
+    _increment(partner_ids, matches_count=1)
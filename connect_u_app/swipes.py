@@ -0,0 +1,215 @@
+# connect_u_app/swipes.py
+"""
+Сервис свайпов.
+
+Реакция, проверка взаимного лайка и создание мэтча (вместе с обеими строками
+MatchMembership) выполняются в одной транзакции за два обращения к базе: advisory-блокировка пары пользователей и один запрос с CTE.
+Блокировка нужна, чтобы два одновременных встречных лайка не разминулись:
+второй запрос начинается после коммита первого и видит его реакцию.
+Об уже закоммиченном мэтче оба участника узнают через notifications.py.
+"""
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.db import connection, transaction
+
+from .models import User, Interaction, Match, MatchMembership
+from . import notifications, recommendations, stats
+
+SWIPE_BATCH_MAX = getattr(settings, 'SWIPE_BATCH_MAX', 100)
+
+PAIR_LOCK_SQL = 'SELECT pg_advisory_xact_lock(hashtextextended(%s, 0))'
+
+# Ключи сортируются, чтобы два пакета с пересекающимися парами не попали в deadlock
+PAIR_LOCK_MANY_SQL = """
+SELECT pg_advisory_xact_lock(hashtextextended(key, 0))
+FROM (SELECT unnest(%s::text[]) AS key ORDER BY 1) AS keys
+"""
+
+SWIPE_SQL = """
+WITH target AS (
+    SELECT id FROM {user} WHERE id = %(to_user)s AND id <> %(from_user)s AND is_active
+),
+previous AS (
+    SELECT reaction FROM {interaction} WHERE from_user_id = %(from_user)s AND to_user_id = %(to_user)s
+),
+upserted AS (
+    INSERT INTO {interaction} (from_user_id, to_user_id, reaction, created_at)
+    SELECT %(from_user)s, id, %(reaction)s, now() FROM target
+    ON CONFLICT (from_user_id, to_user_id) DO UPDATE
+    SET reaction = EXCLUDED.reaction, created_at = EXCLUDED.created_at
+    RETURNING to_user_id
+),
+reciprocal AS (
+    SELECT 1 FROM {interaction} AS i
+    JOIN upserted AS u ON i.from_user_id = u.to_user_id
+    WHERE i.to_user_id = %(from_user)s AND i.reaction = 'like' AND %(reaction)s = 'like'
+),
+existing_match AS (
+    SELECT id FROM {match}
+    WHERE user1_id = LEAST(%(from_user)s, %(to_user)s)
+      AND user2_id = GREATEST(%(from_user)s, %(to_user)s)
+      AND EXISTS (SELECT 1 FROM reciprocal)
+),
+new_match AS (
+    INSERT INTO {match} (user1_id, user2_id, created_at)
+    SELECT LEAST(%(from_user)s, %(to_user)s), GREATEST(%(from_user)s, %(to_user)s), now()
+    FROM reciprocal
+    WHERE NOT EXISTS (SELECT 1 FROM existing_match)
+    ON CONFLICT (user1_id, user2_id) DO NOTHING
+    RETURNING id, user1_id, user2_id, created_at
+),
+memberships AS (
+    INSERT INTO {membership} (user_id, match_id, other_user_id, created_at, last_activity_at)
+    SELECT user1_id, id, user2_id, created_at, created_at FROM new_match
+    UNION ALL
+    SELECT user2_id, id, user1_id, created_at, created_at FROM new_match
+    ON CONFLICT DO NOTHING
+)
+SELECT
+    EXISTS (SELECT 1 FROM upserted),
+    EXISTS (SELECT 1 FROM reciprocal),
+    COALESCE((SELECT id FROM new_match), (SELECT id FROM existing_match)),
+    EXISTS (SELECT 1 FROM new_match),
+    (SELECT reaction FROM previous)
+""".format(
+    user=User._meta.db_table,
+    interaction=Interaction._meta.db_table,
+    match=Match._meta.db_table,
+    membership=MatchMembership._meta.db_table,
+)
+
+
+SWIPE_BATCH_SQL = """
+WITH incoming AS (
+    SELECT t.to_user_id, t.reaction
+    FROM unnest(%(to_users)s::bigint[], %(reactions)s::text[]) AS t(to_user_id, reaction)
+    JOIN {user} AS u ON u.id = t.to_user_id AND u.is_active
+    WHERE t.to_user_id <> %(from_user)s
+),
+previous AS (
+    SELECT to_user_id, reaction FROM {interaction}
+    WHERE from_user_id = %(from_user)s AND to_user_id = ANY(%(to_users)s::bigint[])
+),
+upserted AS (
+    INSERT INTO {interaction} (from_user_id, to_user_id, reaction, created_at)
+    SELECT %(from_user)s, to_user_id, reaction, now() FROM incoming
+    ON CONFLICT (from_user_id, to_user_id) DO UPDATE
+    SET reaction = EXCLUDED.reaction, created_at = EXCLUDED.created_at
+    RETURNING to_user_id, reaction
+),
+reciprocal AS (
+    SELECT u.to_user_id FROM upserted AS u
+    JOIN {interaction} AS i
+      ON i.from_user_id = u.to_user_id AND i.to_user_id = %(from_user)s AND i.reaction = 'like'
+    WHERE u.reaction = 'like'
+),
+new_matches AS (
+    INSERT INTO {match} (user1_id, user2_id, created_at)
+    SELECT LEAST(%(from_user)s, to_user_id), GREATEST(%(from_user)s, to_user_id), now() FROM reciprocal
+    ON CONFLICT (user1_id, user2_id) DO NOTHING
+    RETURNING id, user1_id, user2_id, created_at, user1_id + user2_id - %(from_user)s AS partner_id
+),
+memberships AS (
+    INSERT INTO {membership} (user_id, match_id, other_user_id, created_at, last_activity_at)
+    SELECT user1_id, id, user2_id, created_at, created_at FROM new_matches
+    UNION ALL
+    SELECT user2_id, id, user1_id, created_at, created_at FROM new_matches
+    ON CONFLICT DO NOTHING
+)
+SELECT 'swipe', u.to_user_id, u.reaction, p.reaction
+FROM upserted AS u LEFT JOIN previous AS p ON p.to_user_id = u.to_user_id
+UNION ALL
+SELECT 'match', id, NULL, partner_id::text FROM new_matches
+""".format(
+    user=User._meta.db_table,
+    interaction=Interaction._meta.db_table,
+    match=Match._meta.db_table,
+    membership=MatchMembership._meta.db_table,
+)
+
+
+@dataclass
+class SwipeResult:
+    recorded: bool  # False, если пользователя нет, он неактивен или это сам свайпающий
+    is_match: bool = False
+    match_id: int = None
+    match_created: bool = False
+
+
+def pair_lock_key(user_a_id, user_b_id):
+    low, high = sorted((user_a_id, user_b_id))
+    return f'swipe:{low}:{high}'
+
+
+def swipe(from_user_id, to_user_id, reaction):
+    """Записывает реакцию и, если лайк взаимный, создает мэтч."""
+    params = {'from_user': from_user_id, 'to_user': to_user_id, 'reaction': reaction}
+
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PAIR_LOCK_SQL, [pair_lock_key(from_user_id, to_user_id)])
+        cursor.execute(SWIPE_SQL, params)
+        recorded, is_match, match_id, match_created, previous = cursor.fetchone()
+        if recorded:
+            stats.apply_swipe(from_user_id, to_user_id, previous, reaction, match_created)
+
+    if recorded:
+        recommendations.mark_seen(from_user_id, to_user_id)
+    if match_created:
+        notifications.notify_matches([(match_id, from_user_id, to_user_id)])
+    return SwipeResult(recorded=recorded, is_match=is_match, match_id=match_id, match_created=match_created)
+
+
+@dataclass
+class SwipeBatchResult:
+    recorded_ids: list = field(default_factory=list)  # кому реакция записана
+    new_match_ids: list = field(default_factory=list)
+
+
+def swipe_batch(from_user_id, items):
+    """
+    Применяет пачку свайпов одной транзакцией: bulk upsert в Interaction и
+    создание всех новых мэтчей одним set-based запросом.
+
+    items - словари с to_user_id, reaction и необязательным client_ts. Если один и
+    тот же пользователь встречается несколько раз, побеждает последний по client_ts.
+    """
+    latest = {}
+    for order, item in enumerate(items):
+        to_user_id = item['to_user_id']
+        if to_user_id == from_user_id:
+            continue
+        sort_key = (item.get('client_ts') is not None, item.get('client_ts'), order)
+        if to_user_id not in latest or sort_key >= latest[to_user_id][0]:
+            latest[to_user_id] = (sort_key, item['reaction'])
+
+    if not latest:
+        return SwipeBatchResult()
+
+    to_users = list(latest)
+    params = {
+        'from_user': from_user_id,
+        'to_users': to_users,
+        'reactions': [latest[to_user_id][1] for to_user_id in to_users],
+    }
+
+    result = SwipeBatchResult()
+    changes = []
+    partner_ids = []
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(PAIR_LOCK_MANY_SQL, [[pair_lock_key(from_user_id, to_user_id) for to_user_id in to_users]])
+        cursor.execute(SWIPE_BATCH_SQL, params)
+        for kind, value, reaction, extra in cursor.fetchall():
+            if kind == 'swipe':
+                result.recorded_ids.append(value)
+                changes.append((value, extra, reaction))
+            else:
+                result.new_match_ids.append(value)
+                partner_ids.append(int(extra))
+        stats.apply_swipe_batch(from_user_id, changes, partner_ids)
+
+    recommendations.mark_seen_many(from_user_id, result.recorded_ids)
+    notifications.notify_matches([
+        (match_id, from_user_id, partner_id) for match_id, partner_id in zip(result.new_match_ids, partner_ids)
+    ])
+    return result
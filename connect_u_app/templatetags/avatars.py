@@ -0,0 +1,38 @@
+# connect_u_app/templatetags/avatars.py
+
+from django import template
+from django.utils.html import format_html
+
+from ..thumbnails import avatar_sources, avatar_thumbnail_url
+
+register = template.Library()
+
+
+@register.simple_tag
+def avatar_picture(profile, sizes='100vw', css_class='', alt='', loading='lazy'):
+    """
+    <picture> с WebP/JPEG srcset для аватара профиля.
+    sizes - ширина картинки на странице, например "120px": по ней браузер выбирает рендишен.
+    """
+    if profile is None:
+        return ''
+    alt = alt or profile.full_name
+    sources = avatar_sources(profile)
+    if sources is None:
+        return format_html('<img src="{}" class="{}" alt="{}" loading="{}">',
+                           profile.get_avatar_url, css_class, alt, loading)
+
+    return format_html(
+        '<picture>'
+        '<source type="image/webp" srcset="{}" sizes="{}">'
+        '<img src="{}" srcset="{}" sizes="{}" class="{}" alt="{}" loading="{}" decoding="async">'
+        '</picture>',
+        sources['srcset']['webp'], sizes,
+        sources['src'], sources['srcset']['jpeg'], sizes, css_class, alt, loading,
+    )
+
+
+@register.simple_tag
+def avatar_url(profile, width=96):
+    """URL одного JPEG-превью (для мест без srcset)."""
+    return avatar_thumbnail_url(profile, width) if profile is not None else ''
@@ -1,3 +1,905 @@
-from django.test import TestCase
+import io
+import os
+import random
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from asgiref.sync import async_to_sync
+from django.db import OperationalError, connection
+from django.db.models.functions import Upper
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from .models import (
+    CandidateSlate, Interaction, Interest, Match, MatchMembership, Message, Photo, User, UserProfile, UserStats,
+)
+from .bloom import BloomFilter
+from . import (
+    api, api_views, chat, collaborative, deck, fragments, images, precompute, presence, recommendations, search, swipes,
+    thumbnails, uploads,
+)
+
+
+def make_users(count, prefix='user'):
+    """Пользователи без сигналов (bulk_create): профили и счетчики создаются явно, где нужны."""
+    users = User.objects.bulk_create(
+        User(username=f'{prefix}{index}', email=f'{prefix}{index}@example.com', gender='MF'[index % 2])
+        for index in range(count)
+    )
+    UserStats.objects.bulk_create(UserStats(user=user) for user in users)
+    return users
+
+
+# --- СВАЙПЫ ---
+
+class ConcurrentMutualLikeTests(TransactionTestCase):
+    """Встречные лайки из разных соединений одновременно: ровно один мэтч на пару."""
+    PAIRS = 1000
+    THREADS = 16
+
+    def test_concurrent_mutual_likes_create_one_match_per_pair(self):
+        users = make_users(self.PAIRS * 2)
+        pairs = [(users[index].pk, users[index + 1].pk) for index in range(0, len(users), 2)]
+        # Каждый лайк пары - в свой поток, в случайном порядке
+        likes = [(a, b) for a, b in pairs] + [(b, a) for a, b in pairs]
+        random.Random(0).shuffle(likes)
+        chunks = [likes[index::self.THREADS] for index in range(self.THREADS)]
+        start = threading.Barrier(self.THREADS)
+
+        def run(chunk):
+            start.wait()
+            try:
+                return [swipes.swipe(from_id, to_id, Interaction.LIKE) for from_id, to_id in chunk]
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.THREADS) as executor:
+            results = [result for chunk in executor.map(run, chunks) for result in chunk]
+
+        self.assertTrue(all(result.recorded for result in results))
+        self.assertEqual(sum(result.match_created for result in results), self.PAIRS)
+        self.assertEqual(Match.objects.count(), self.PAIRS)
+        self.assertEqual(
+            set(Match.objects.values_list('user1_id', 'user2_id')),
+            {(min(a, b), max(a, b)) for a, b in pairs},
+        )
+        self.assertEqual(MatchMembership.objects.count(), self.PAIRS * 2)
+        for match_id, user1_id, user2_id in Match.objects.values_list('id', 'user1_id', 'user2_id'):
+            members = set(MatchMembership.objects.filter(match_id=match_id).values_list('user_id', 'other_user_id'))
+            self.assertEqual(members, {(user1_id, user2_id), (user2_id, user1_id)})
+        self.assertEqual(set(UserStats.objects.values_list('matches_count', flat=True)), {1})
+
+
+class SwipeStatsDeadlockTests(TransactionTestCase):
+    """Свайпы по кругу X->Y->Z->X и пачки с пересекающимися получателями не блокируют друг друга."""
+    USERS = 12
+    ROUNDS = 40
+
+    def test_ring_of_swipes_keeps_counters_consistent(self):
+        users = [user.pk for user in make_users(self.USERS)]
+        start = threading.Barrier(self.USERS)
+
+        def run(index):
+            from_id = users[index]
+            targets = [users[(index + step) % self.USERS] for step in (1, 2, 3)]
+            start.wait()
+            try:
+                for round_number in range(self.ROUNDS):
+                    reaction = (Interaction.LIKE, Interaction.DISLIKE)[round_number % 2]
+                    swipes.swipe(from_id, targets[0], reaction)
+                    swipes.swipe_batch(from_id, [{'to_user_id': to_id, 'reaction': reaction} for to_id in targets[1:]])
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(self.USERS) as executor:
+            list(executor.map(run, range(self.USERS)))
+
+        for stats in UserStats.objects.all():
+            given = Interaction.objects.filter(from_user_id=stats.user_id)
+            self.assertEqual(stats.likes_given, given.filter(reaction=Interaction.LIKE).count())
+            self.assertEqual(stats.dislikes_given, given.filter(reaction=Interaction.DISLIKE).count())
+            self.assertEqual(stats.likes_received, Interaction.objects.filter(
+                to_user_id=stats.user_id, reaction=Interaction.LIKE).count())
+
+
+class InteractionApiTests(TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.user, self.other = make_users(2)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_interactions_are_written_only_through_swipe(self):
+        response = self.client.post('/api/v1/interactions/', {'to_user': self.other.pk, 'reaction': 'like'})
+        self.assertEqual(response.status_code, 405)
+        self.assertFalse(Interaction.objects.exists())
+
+        response = self.client.post('/api/v1/interactions/swipe/', {'to_user_id': self.other.pk, 'reaction': 'like'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.get('/api/v1/interactions/').json()[0]['to_user'], self.other.pk)
+
+
+# --- ИНДЕКСЫ (миграция 0007) ---
+
+class HotPathIndexTests(TestCase):
+    """
+    Горячие запросы приложения обходятся без Seq Scan (EXPLAIN) на 100 тысячах
+    анкет: запросы берутся у самих функций и вьюх (CaptureQueriesContext), а не
+    пишутся в тесте заново. У одного активного пользователя - длинная история
+    свайпов, много мэтчей и фото и длинный чат.
+    """
+    USERS = 100000
+    SWIPES_PER_USER = 5
+    ACTIVE_SWIPES = 3000
+    ACTIVE_MATCHES = 100
+    ACTIVE_CHAT_MESSAGES = 5000
+    ACTIVE_PHOTOS = 500
+    EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(0)
+        users = make_users(cls.USERS)
+        ids = [user.pk for user in users]
+        active, others = ids[0], ids[1:]
+        # Латиница: в тестовой базе с локалью C UPPER() и pg_trgm не обрабатывают кириллицу.
+        # Случайные буквы, а не слоги: у настоящих имен триграммы разнообразны, и индекс избирателен
+        letters = 'abcdefghijklmnopqrstuvwxyz'
+        profiles = UserProfile.objects.bulk_create(
+            (
+                UserProfile(
+                    user=user,
+                    full_name=''.join(rng.choices(letters, k=8)),
+                    city=''.join(rng.choices(letters, k=8)),
+                    searchable=rng.random() < 0.9,
+                )
+                for user in users
+            ),
+            batch_size=10000,
+        )
+        swipes_by_user = {from_id: rng.sample(others, cls.SWIPES_PER_USER) for from_id in others}
+        swipes_by_user[active] = rng.sample(others, cls.ACTIVE_SWIPES)
+        Interaction.objects.bulk_create(
+            (
+                Interaction(from_user_id=from_id, to_user_id=to_id, reaction=rng.choice(('like', 'dislike')))
+                for from_id, to_ids in swipes_by_user.items()
+                for to_id in to_ids if to_id != from_id
+            ),
+            batch_size=10000,
+        )
+        # У остальных - по паре мэтчей с соседями
+        paired = others[cls.ACTIVE_MATCHES:]
+        matches = Match.objects.bulk_create(
+            [Match(user1_id=active, user2_id=user_id) for user_id in others[:cls.ACTIVE_MATCHES]]
+            + [Match(user1_id=first, user2_id=second) for first, second in zip(paired, paired[1:])],
+            batch_size=10000,
+        )
+        MatchMembership.objects.bulk_create(
+            (membership for match in matches for membership in MatchMembership.for_match(match)),
+            batch_size=10000,
+        )
+        Message.objects.bulk_create(
+            [Message(match=matches[0], sender_id=active, content='privet') for _ in range(cls.ACTIVE_CHAT_MESSAGES)]
+            + [Message(match=match, sender_id=match.user1_id, content='privet') for match in matches[1:]],
+            batch_size=10000,
+        )
+        Photo.objects.bulk_create(
+            [Photo(user_id=user_id, image=f'photos/{user_id}.jpg') for user_id in others]
+            + [Photo(user_id=active, image=f'photos/{active}-{index}.jpg') for index in range(cls.ACTIVE_PHOTOS)],
+            batch_size=10000,
+        )
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+        cls.user = users[0]
+        cls.match = matches[0]
+        cls.profile = next(profile for profile in profiles[1:] if profile.searchable)
+        cls.not_swiped = next(user_id for user_id in reversed(others) if user_id not in set(swipes_by_user[active]))
+
+    def setUp(self):
+        cache.clear()
+
+    def plans(self, call, table=None):
+        """EXPLAIN всех запросов, которые сделал call(); с table - только запросов к этой таблице."""
+        with CaptureQueriesContext(connection) as queries:
+            call()
+        plans = []
+        with connection.cursor() as cursor:
+            for query in queries:
+                sql = query['sql']
+                if not sql.lstrip().upper().startswith(self.EXPLAINABLE):
+                    continue
+                if table is not None and f'"{table._meta.db_table}"' not in sql:
+                    continue
+                cursor.execute(f'EXPLAIN {sql}')
+                plans.append('\n'.join(row[0] for row in cursor.fetchall()))
+        self.assertTrue(plans, 'no queries to explain')
+        return plans
+
+    def assertNoSeqScan(self, call, table=None, index_name=None):
+        plans = self.plans(call, table)
+        for plan in plans:
+            self.assertNotIn('Seq Scan', plan, plan)
+        if index_name is not None:
+            self.assertIn(index_name, '\n'.join(plans))
+
+    def test_feed_sampler_uses_partial_random_key_index(self):
+        # Точка выборки - в середине диапазона. У самого края (random_key >= 0.95) под
+        # LIMIT попадает весь хвост, и хеш-соединение с профилями там действительно дешевле
+        queryset = recommendations.candidate_queryset(self.user, exclude_swiped=False)
+        with mock.patch.object(recommendations.random, 'random', return_value=0.5):
+            self.assertNoSeqScan(
+                lambda: recommendations.sample_candidate_ids(queryset, recommendations.RANK_POOL_SIZE,
+                                                             fields=('pk', 'profile__interest_mask')),
+                index_name='user_feed_random_key_idx',
+            )
+
+    def test_feed_city_filter_has_no_seq_scan(self):
+        city = self.profile.city[2:7]
+        queryset = recommendations.candidate_queryset(self.user, {'city': city}, exclude_swiped=False)
+        with mock.patch.object(recommendations.random, 'random', return_value=0.5):
+            self.assertNoSeqScan(lambda: recommendations.sample_candidate_ids(queryset, deck.DECK_SIZE))
+
+    def test_swipe_uses_partial_like_index(self):
+        self.assertNoSeqScan(lambda: swipes.swipe(self.user.pk, self.not_swiped, Interaction.LIKE),
+                             index_name='interaction_like_to_idx')
+
+    def test_seen_filter_build_has_no_seq_scan(self):
+        self.assertNoSeqScan(lambda: recommendations.build_seen(self.user.pk), table=Interaction)
+
+    def test_match_list_uses_membership_index(self):
+        from rest_framework.test import APIClient
+
+        self.client.force_login(self.user)
+        self.assertNoSeqScan(lambda: self.client.get('/matches/'), table=MatchMembership,
+                             index_name='membership_user_activity_idx')
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertNoSeqScan(lambda: client.get('/api/v1/matches/'), table=MatchMembership,
+                             index_name='membership_user_activity_idx')
+
+    def test_chat_history_uses_match_timestamp_index(self):
+        self.assertNoSeqScan(lambda: chat.message_history(self.match), index_name='message_match_timestamp_idx')
+
+    def test_user_photos_use_user_uploaded_index(self):
+        self.client.force_login(self.user)
+        self.assertNoSeqScan(lambda: self.client.get('/gallery/'), table=Photo, index_name='photo_user_uploaded_idx')
+
+    def test_profile_api_uses_partial_searchable_index(self):
+        from rest_framework.test import APIClient
+
+        client = APIClient()
+        client.force_authenticate(self.user)
+        self.assertNoSeqScan(lambda: client.get('/api/v1/profiles/'), table=UserProfile,
+                             index_name='profile_searchable_user_idx')
+
+    def test_fuzzy_search_uses_trigram_index(self):
+        page = None
+
+        def search_profiles():
+            nonlocal page
+            page = search.search_profiles(self.user, typo)
+
+        # Опечатка в последней букве: полнотекстовый поиск пуст, находит нечеткий
+        typo = self.profile.full_name[:-1] + ('a' if self.profile.full_name[-1] != 'a' else 'b')
+        self.assertNoSeqScan(search_profiles, table=UserProfile, index_name='profile_full_name_trgm')
+        self.assertTrue(page.fuzzy)
+        self.assertIn(self.profile, page.object_list)
+
+
+# --- ПОИСК ---
+
+class HiddenCitySearchTests(TestCase):
+    def setUp(self):
+        self.viewer, self.hidden, self.shown = make_users(3)
+        for user, show_city in ((self.viewer, True), (self.hidden, False), (self.shown, True)):
+            UserProfile.objects.create(user=user, full_name=user.username, city='Tomsk', show_city=show_city)
+
+    def found(self, query):
+        return {profile.user_id for profile in search.search_profiles(self.viewer, query)}
+
+    def test_hidden_city_is_not_searchable(self):
+        self.assertEqual(self.found('Tomsk'), {self.shown.pk})
+        self.assertEqual({profile.user_id for profile in search.suggest(self.viewer, 'Toms')}, {self.shown.pk})
+
+    def test_toggling_show_city_reindexes_profile(self):
+        profile = self.hidden.profile
+        profile.show_city = True
+        profile.save(update_fields=['show_city'])
+        self.assertEqual(self.found('Tomsk'), {self.hidden.pk, self.shown.pk})
+
+
+# --- ЧИСЛО ЗАПРОСОВ ---
+
+class QueryCountMixin:
+    """Сколько запросов делает страница на малых данных; на больших их должно быть столько же."""
+
+    def count_queries(self, request):
+        with CaptureQueriesContext(connection) as queries:
+            response = request()
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+
+# --- API ПРОФИЛЕЙ ---
+
+class ProfileApiTests(TestCase):
+    """Курсорная пагинация, ?fields= и условные запросы (ETag, Last-Modified) /api/v1/profiles/."""
+
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        self.viewer, *self.users = make_users(6)
+        hidden = self.users.pop()
+        UserProfile.objects.bulk_create(
+            [UserProfile(user=user, full_name=user.username, city='Kazan') for user in [self.viewer, *self.users]]
+            + [UserProfile(user=hidden, full_name=hidden.username, searchable=False)]
+        )
+        self.interest = Interest.objects.create(name='chess')
+        UserProfile.objects.get(user=self.users[0]).interests.add(self.interest)
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def profile_url(self, user):
+        return f'/api/v1/profiles/{UserProfile.objects.get(user=user).pk}/'
+
+    def test_cursor_pages(self):
+        response = self.client.get('/api/v1/profiles/', {'limit': 2})
+        self.assertEqual(set(response.data), {'next', 'previous', 'results'})
+        self.assertIsNone(response.data['previous'])
+
+        user_ids = []
+        while True:
+            self.assertLessEqual(len(response.data['results']), 2)
+            user_ids += [profile['user']['id'] for profile in response.data['results']]
+            if response.data['next'] is None:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(user_ids, sorted(user.pk for user in [self.viewer, *self.users]))
+
+    def test_limit_is_capped(self):
+        with mock.patch.object(api_views.ProfileCursorPagination, 'max_page_size', 3):
+            response = self.client.get('/api/v1/profiles/', {'limit': 100})
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_fields_trim_response_and_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/v1/profiles/', {'fields': 'city,full_name'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(set(response.data['results'][0]), {'full_name', 'city'})
+        # Колонки пользователя не выбираются (JOIN остается только ради is_active), интересы не грузятся
+        self.assertEqual(len(queries), 1)
+        self.assertNotIn(f'"{User._meta.db_table}"."email"', queries[0]['sql'])
+
+        with self.assertNumQueries(2):
+            response = self.client.get('/api/v1/profiles/', {'fields': 'user,interests'})
+        self.assertEqual(set(response.data['results'][0]), {'user', 'interests'})
+
+    def test_unknown_fields_are_rejected(self):
+        response = self.client.get('/api/v1/profiles/', {'fields': 'full_name,password'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('fields', response.data)
+
+    def test_not_modified(self):
+        response = self.client.get('/api/v1/profiles/')
+        with self.assertNumQueries(1):
+            cached = self.client.get('/api/v1/profiles/', HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+
+        url = self.profile_url(self.users[0])
+        response = self.client.get(url)
+        self.assertEqual(response.data['interests'], ['chess'])
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, 304)
+        with self.assertNumQueries(1):
+            cached = self.client.get(url, HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(cached.status_code, 304)
+
+    def test_etag_changes_with_interests_and_user_fields(self):
+        url = self.profile_url(self.users[0])
+        etag = self.client.get(url)['ETag']
+
+        UserProfile.objects.get(user=self.users[0]).interests.add(Interest.objects.create(name='tennis'))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['interests'], ['chess', 'tennis'])
+        etag = response['ETag']
+
+        user = self.users[0]
+        user.birth_date = date(1990, 5, 17)
+        user.save(update_fields=['birth_date'])
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertIsNotNone(response.data['user']['age'])
+
+
+# --- ПРЕДРАСЧЕТ КАНДИДАТОВ ---
+
+class PrecomputeQueueTests(TestCase):
+    """В пересчет слейтов попадают изменения анкеты, но не вход в систему."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='slate', email='slate@example.com', password='secret')
+        CandidateSlate.objects.create(user=self.user, computed_at=timezone.now())
+
+    def queued(self):
+        return self.user.pk in precompute.users_to_update(timezone.now(), timedelta(days=1))
+
+    def test_login_does_not_queue_user(self):
+        updated_at = UserProfile.objects.get(user=self.user).updated_at
+        self.assertTrue(self.client.login(email='slate@example.com', password='secret'))
+
+        self.assertEqual(UserProfile.objects.get(user=self.user).updated_at, updated_at)
+        self.assertFalse(self.queued())
+
+    def test_birth_date_change_queues_user(self):
+        self.user.birth_date = date(1990, 5, 17)
+        self.user.save(update_fields=['birth_date'])
+        self.assertTrue(self.queued())
+
+
+class PrecomputeModelTests(TestCase):
+    """Слейты считаются и без коллаборативной модели, и с битой моделью, и без ее веса в настройках."""
+
+    def setUp(self):
+        self.users = make_users(6)
+        UserProfile.objects.bulk_create(UserProfile(user=user, full_name=user.username) for user in self.users)
+        self.model_dir = tempfile.mkdtemp()
+        ids = np.array(sorted(user.pk for user in self.users), dtype=np.int64)
+        factors = np.random.default_rng(0).random((len(ids), 2), dtype=np.float32)
+        self.model_path = collaborative.save(
+            collaborative.Model(ids=ids, user_factors=factors, item_factors=factors), model_dir=self.model_dir,
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.model_dir, ignore_errors=True)
+
+    def run_precompute(self):
+        with mock.patch.object(collaborative, 'current_path', return_value=self.model_path):
+            saved, _ = precompute.precompute(workers=0, full=True)
+        self.assertEqual(saved, len(self.users))
+        self.assertEqual(CandidateSlate.objects.count(), len(self.users))
+
+    def test_broken_model_is_skipped(self):
+        with open(os.path.join(self.model_path, 'user_factors.npy'), 'wb') as broken:
+            broken.write(b'not a numpy file')
+        with self.assertLogs('connect_u_app.precompute', 'ERROR'):
+            self.run_precompute()
+
+    def test_weights_without_collaborative(self):
+        weights = {key: value for key, value in precompute.SLATE_WEIGHTS.items() if key != 'collaborative'}
+        with mock.patch.object(precompute, 'SLATE_WEIGHTS', weights):
+            self.run_precompute()
+
+
+# --- ЛЕНТА И КАРТОЧКИ ---
+
+class FeedQueryTests(QueryCountMixin, TestCase):
+    """
+    Лента, следующая карточка и ответы на лайк/дизлайк: число запросов не
+    растет ни с числом карточек на странице, ни с числом интересов в анкете.
+    Кэши перед каждым замером пустые, то есть считается худший случай.
+    """
+
+    def setUp(self):
+        self.user, = make_users(1, 'viewer')
+        UserProfile.objects.create(user=self.user, full_name='viewer')
+        self.interests = Interest.objects.bulk_create(Interest(name=f'interest{index}') for index in range(12))
+        self.client.force_login(self.user)
+
+    def add_candidates(self, count, interests, prefix):
+        users = make_users(count, prefix)
+        profiles = UserProfile.objects.bulk_create(UserProfile(user=user, full_name=user.username) for user in users)
+        for profile in profiles:
+            profile.interests.set(self.interests[:interests])
+        return users
+
+    def reset_caches(self):
+        cache.clear()
+        fragments.get_cache().clear()
+
+    def count_cold(self, request):
+        self.reset_caches()
+        return self.count_queries(request)
+
+    def assertColdQueries(self, expected, request):
+        self.reset_caches()
+        with self.assertNumQueries(expected):
+            self.assertEqual(request().status_code, 200)
+
+    def test_feed_page(self):
+        self.add_candidates(2, 1, 'few')
+        expected = self.count_cold(lambda: self.client.get('/'))
+
+        self.add_candidates(30, 12, 'many')
+        self.assertColdQueries(expected, lambda: self.client.get('/'))
+        self.assertEqual(len(self.client.get('/').context['page_obj']), deck.FEED_PAGE_SIZE)
+
+    def test_next_card(self):
+        self.add_candidates(1, 1, 'few')
+        expected = self.count_cold(lambda: self.client.get('/next/'))
+
+        self.add_candidates(30, 12, 'many')
+        self.assertColdQueries(expected, lambda: self.client.get('/next/'))
+
+    def test_like_and_dislike(self):
+        liked, disliked, _ = self.add_candidates(3, 1, 'few')
+        like = self.count_cold(lambda: self.client.post(f'/like/{liked.pk}/'))
+        dislike = self.count_cold(lambda: self.client.post(f'/dislike/{disliked.pk}/'))
+
+        liked, disliked, *_ = self.add_candidates(30, 12, 'many')
+        self.assertColdQueries(like, lambda: self.client.post(f'/like/{liked.pk}/'))
+        self.assertColdQueries(dislike, lambda: self.client.post(f'/dislike/{disliked.pk}/'))
+
+
+class StaleSeenFilterTests(TestCase):
+    """Свайп, который не попал в фильтр get_seen (гонка с пересборкой), не возвращает анкету в ленту."""
+
+    def setUp(self):
+        self.user, *self.candidates = make_users(4)
+        UserProfile.objects.bulk_create(UserProfile(user=user, full_name=user.username) for user in [self.user, *self.candidates])
+        cache.clear()
+        recommendations.build_seen(self.user.pk)
+        self.swiped = self.candidates[0]
+        Interaction.objects.create(from_user=self.user, to_user=self.swiped, reaction=Interaction.LIKE)
+        self.assertNotIn(self.swiped.pk, recommendations.get_seen(self.user.pk))
+
+    def test_feed_page_skips_swiped(self):
+        page = deck.get_page(self.user)
+        self.assertEqual({card.id for card in page}, {user.pk for user in self.candidates[1:]})
+
+    def test_feed_page_refills_after_swiped(self):
+        # Оцененный стоит первым в колоде: страница из одной карточки все равно не пустая
+        ids = [self.swiped.pk, *(user.pk for user in self.candidates[1:])]
+        with mock.patch.object(deck, 'get_deck', return_value={'ids': ids, 'token': 't'}):
+            shown, cursor = [], None
+            while True:
+                page = deck.get_page(self.user, cursor=cursor, page_size=1)
+                self.assertEqual(len(page), 1)
+                shown += [card.id for card in page]
+                if not page.has_next:
+                    break
+                cursor = page.next_cursor
+        self.assertEqual(shown, ids[1:])
+
+    def test_next_card_skips_swiped(self):
+        shown = set()
+        while (candidate := recommendations.next_candidate(self.user)) is not None:
+            shown.add(candidate.pk)
+            recommendations.mark_seen(self.user.pk, candidate.pk)
+        self.assertEqual(shown, {user.pk for user in self.candidates[1:]})
+
+    def test_add_many_matches_update(self):
+        ids = random.Random(0).sample(range(1, 10 ** 7), 3000)
+        one_by_one, vectorized = BloomFilter(5000, 0.01), BloomFilter(5000, 0.01)
+        one_by_one.update(ids)
+        vectorized.add_many(ids)
+        self.assertEqual(vectorized.bits, one_by_one.bits)
+        self.assertEqual(vectorized.count, len(ids))
+        self.assertTrue(vectorized.contains_many(ids).all())
+
+
+# --- ЧАТ ---
+
+class MatchListQueryTests(QueryCountMixin, TestCase):
+    """Список мэтчей: число запросов не зависит от числа мэтчей."""
+
+    def setUp(self):
+        self.user, *self.others = make_users(21)
+        UserProfile.objects.bulk_create(UserProfile(user=user, full_name=user.username) for user in [self.user, *self.others])
+        self.client.force_login(self.user)
+
+    def add_matches(self, partners):
+        for partner in partners:
+            match = Match.objects.create(user1=self.user, user2=partner)
+            chat.insert_messages([Message(match_id=match.pk, sender_id=partner.pk, content='hi', client_id=uuid.uuid4())])
+
+    def test_one_and_many_matches(self):
+        self.add_matches(self.others[:1])
+        matches_page = lambda: self.client.get('/matches/')
+        expected = self.count_queries(matches_page)
+
+        self.add_matches(self.others[1:])
+        with self.assertNumQueries(expected):
+            response = matches_page()
+        self.assertEqual(len(response.context['matches']), len(self.others))
+
+
+class ChatWriteTests(TestCase):
+    def setUp(self):
+        self.user, self.other = make_users(2)
+        self.match = Match.objects.create(user1=self.user, user2=self.other)
+
+    def messages(self, sender, *contents):
+        return [Message(match_id=self.match.pk, sender_id=sender.pk, content=text, client_id=uuid.uuid4()) for text in contents]
+
+    def unread(self, user):
+        return MatchMembership.objects.get(match=self.match, user=user).unread_count
+
+    def test_replayed_batch_is_written_once(self):
+        batch = self.messages(self.other, 'one', 'two', 'three')
+        self.assertEqual(len(chat.insert_messages(batch)), 3)
+        self.assertEqual(chat.insert_messages(batch), [])
+
+        self.assertEqual(Message.objects.filter(match=self.match).count(), 3)
+        self.assertEqual(self.unread(self.user), 3)
+        self.assertEqual(self.unread(self.other), 0)
+        self.match.refresh_from_db()
+        self.assertEqual(self.match.last_message_text, 'three')
+
+    def test_mark_read_resets_unread_count(self):
+        first, *_ = chat.insert_messages(self.messages(self.other, 'one', 'two', 'three'))
+        chat.insert_messages(self.messages(self.user, 'reply'))
+        self.assertEqual(self.unread(self.user), 3)
+
+        self.assertEqual(chat.mark_read(self.match.pk, self.user.pk, first), first)
+        self.assertEqual(self.unread(self.user), 2)
+        last = chat.mark_read(self.match.pk, self.user.pk)
+        self.assertEqual(self.unread(self.user), 0)
+        self.assertEqual(MatchMembership.objects.get(match=self.match, user=self.user).last_read_message_id, last)
+        # Повторная квитанция ничего не меняет
+        self.assertIsNone(chat.mark_read(self.match.pk, self.user.pk))
+
+
+
+class MessageBufferFailureTests(TransactionTestCase):
+    """
+    Пачка с неисправимым сообщением не блокирует остальные и не копится в буфере.
+    Таймеры буфера не запускаются: flush вызывается в тесте явно.
+    """
+
+    def setUp(self):
+        self.user, self.other = make_users(2)
+        self.match = Match.objects.create(user1=self.user, user2=self.other)
+
+    def message(self, content, match_id=None):
+        return Message(match_id=match_id or self.match.pk, sender_id=self.user.pk, content=content, client_id=uuid.uuid4())
+
+    def test_bad_messages_are_dropped_and_the_rest_written(self):
+        buffer = chat.MessageBuffer(interval=60, batch_size=100)
+        buffer._spawn = lambda coroutine: coroutine.close()
+        for message in (self.message('hello'), self.message('nul\x00byte'), self.message('gone', match_id=10 ** 9)):
+            buffer.add(message)
+        with self.assertLogs('connect_u_app.chat', 'ERROR'):
+            async_to_sync(buffer.flush)()
+
+        self.assertEqual(list(Message.objects.values_list('content', flat=True)), ['hello'])
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(buffer.attempts, {})
+
+    def test_retries_are_capped(self):
+        buffer = chat.MessageBuffer(interval=60, batch_size=100, max_attempts=3, retry_delay=0)
+        buffer._spawn = lambda coroutine: coroutine.close()
+        buffer.add(self.message('hello'))
+        with mock.patch.object(chat, 'insert_messages', side_effect=OperationalError('server closed the connection')), \
+                self.assertLogs('connect_u_app.chat', 'ERROR') as logs:
+            for _ in range(3):
+                async_to_sync(buffer.flush)()
+
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(buffer.attempts, {})
+        self.assertIn('after 3 failed attempts', logs.output[-1])
+        self.assertFalse(Message.objects.exists())
+
+    def test_resend_during_flush_is_rejected(self):
+        buffer = chat.MessageBuffer(interval=60, batch_size=100)
+        buffer._spawn = lambda coroutine: coroutine.close()
+        message = self.message('hello')
+        buffer.add(message)
+        resend = Message(match_id=message.match_id, sender_id=self.user.pk, content='hello', client_id=message.client_id)
+        accepted = []
+        insert_messages = chat.insert_messages
+
+        def insert_with_resend(messages):
+            # Повтор приходит, пока пачка пишется в базу
+            accepted.append(buffer.add(resend))
+            insert_messages(messages)
+
+        with mock.patch.object(chat, 'insert_messages', side_effect=insert_with_resend):
+            async_to_sync(buffer.flush)()
+
+        self.assertEqual(accepted, [False])
+        self.assertEqual(buffer.pending, {})
+        self.assertEqual(buffer.flushing, set())
+        self.assertEqual(Message.objects.count(), 1)
+
+
+class PresenceTests(TestCase):
+    """Статус онлайн считается по сокетам: истечение статуса не теряет остальные сокеты."""
+
+    def setUp(self):
+        cache.clear()
+
+    def expire(self, user_id):
+        # Все heartbeat пропущены дольше PRESENCE_TTL (например, ноутбук уснул)
+        cache.delete(presence._key(user_id))
+
+    def test_sockets_survive_expired_status(self):
+        self.assertTrue(presence.connect(1, 'a'))
+        self.assertFalse(presence.connect(1, 'b'))
+        self.expire(1)
+        self.assertFalse(presence.is_online(1))
+
+        self.assertTrue(presence.heartbeat(1, 'a'))
+        # Сокет b еще не прислал heartbeat, но закрытие a не делает пользователя офлайн
+        self.assertFalse(presence.heartbeat(1, 'b'))
+        self.assertFalse(presence.disconnect(1, 'a'))
+        self.assertTrue(presence.is_online(1))
+        self.assertTrue(presence.disconnect(1, 'b'))
+        self.assertFalse(presence.is_online(1))
+
+    def test_disconnect_of_expired_socket(self):
+        presence.connect(1, 'a')
+        presence.connect(1, 'b')
+        self.expire(1)
+        presence.heartbeat(1, 'a')
+        self.assertFalse(presence.disconnect(1, 'b'))
+        self.assertEqual(presence.online_ids([1, 2]), {1})
+
+    def test_socket_expires_on_its_own(self):
+        presence.connect(1, 'a')
+        presence.connect(1, 'b')
+        now = presence.time.time()
+        with mock.patch.object(presence.time, 'time', return_value=now + presence.PRESENCE_TTL / 2):
+            presence.heartbeat(1, 'a')
+        # Сокет b пропал без disconnect (упал процесс Daphne) и выпадает по своему сроку
+        with mock.patch.object(presence.time, 'time', return_value=now + presence.PRESENCE_TTL + 1):
+            self.assertTrue(presence.is_online(1))
+            self.assertTrue(presence.disconnect(1, 'a'))
+
+
+# --- ФОТО И АВАТАРЫ ---
+
+def image_file(name='photo.jpg', size=(1200, 900)):
+    buffer = io.BytesIO()
+    Image.new('RGB', size, (200, 120, 40)).save(buffer, format='JPEG')
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+
+class MediaTestMixin:
+    """MEDIA_ROOT и каталог загрузок по частям - во временных каталогах теста."""
+
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name)
+        override.enable()
+        self.addCleanup(override.disable)
+        # Каталог читается из настроек при импорте uploads, override_settings его не меняет
+        upload_dir = mock.patch.object(uploads, 'CHUNKED_UPLOAD_DIR', os.path.join(media.name, 'uploads_tmp'))
+        upload_dir.start()
+        self.addCleanup(upload_dir.stop)
+
+
+class AvatarSrcsetTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user, = make_users(1)
+        self.profile = UserProfile.objects.create(user=self.user)
+
+    def make_main_photo(self):
+        # Обработка - как в пуле, но синхронно: on_commit в TestCase не срабатывает
+        photo = Photo.objects.create(user=self.user, image=image_file(), is_main=True)
+        result = images.render_photo(str(settings.MEDIA_ROOT), photo.image.name,
+                                     images.PHOTO_MAX_SIZE, images.PHOTO_VARIANTS)
+        images.finish_photo(photo.pk, result)
+        return photo
+
+    def test_avatar_falls_back_while_photo_is_processing(self):
+        Photo.objects.create(user=self.user, image=image_file(), is_main=True)
+        self.profile.refresh_from_db()
+        self.assertIsNone(thumbnails.avatar_sources(self.profile))
+        self.assertEqual(thumbnails.avatar_thumbnail_url(self.profile, 96), self.profile.get_avatar_url)
+
+    def test_srcset_uses_processed_photo_variants_without_decoding(self):
+        photo = self.make_main_photo()
+        self.profile.refresh_from_db()
+        variants = Photo.objects.get(pk=photo.pk).variants
+        with mock.patch('PIL.Image.open', side_effect=AssertionError('image decoded during request')):
+            sources = thumbnails.avatar_sources(self.profile)
+            small = thumbnails.avatar_thumbnail_url(self.profile, 90)
+
+        widths = variants['widths']
+        self.assertEqual(widths, {'card': 512, 'tile': 256, 'avatar': 96})
+        self.assertIn(f"{variants['avatar']['webp']} 96w", sources['srcset']['webp'])
+        self.assertIn(f"{variants['card']['jpeg']} 512w", sources['srcset']['jpeg'])
+        self.assertTrue(sources['src'].endswith(variants['tile']['jpeg']))
+        self.assertTrue(small.endswith(variants['avatar']['jpeg']))
+
+    def test_avatar_changed_outside_photos_ignores_stale_variants(self):
+        self.make_main_photo()
+        UserProfile.objects.filter(pk=self.profile.pk).update(avatar='avatars/other.jpg')
+        self.profile.refresh_from_db()
+        self.assertIsNone(thumbnails.avatar_sources(self.profile))
+
+
+class PhotoApiTests(MediaTestMixin, TestCase):
+    def setUp(self):
+        from rest_framework.test import APIClient
+
+        super().setUp()
+        self.user, = make_users(1)
+        UserProfile.objects.create(user=self.user)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_image_cannot_be_replaced_after_upload(self):
+        photo = Photo.objects.create(user=self.user, image=image_file('first.jpg'))
+        response = self.client.patch(f'/api/v1/photos/{photo.pk}/', {'image': image_file('second.jpg'), 'is_main': True},
+                                     format='multipart')
+        self.assertEqual(response.status_code, 200)
+        photo.refresh_from_db()
+        self.assertIn('first', photo.image.name)
+        self.assertTrue(photo.is_main)
+
+
+    def test_update_keeps_processing_result(self):
+        photo = Photo.objects.create(user=self.user, image=image_file('first.jpg'))
+        original = photo.image.name
+        result = {'original': original, 'main': f'user_{self.user.pk}/first_main.jpg', 'widths': {}}
+        get_object = api.PhotoViewSet.get_object
+
+        def finish_after_load(view):
+            # Обработка завершается между загрузкой фото во view и его сохранением
+            loaded = get_object(view)
+            images.finish_photo(photo.pk, result)
+            return loaded
+
+        with mock.patch.object(api.PhotoViewSet, 'get_object', finish_after_load):
+            response = self.client.patch(f'/api/v1/photos/{photo.pk}/', {'is_main': True}, format='json')
+        self.assertEqual(response.status_code, 200)
+
+        photo.refresh_from_db()
+        self.assertEqual((photo.status, photo.image.name, photo.variants), (Photo.READY, result['main'], result))
+        self.assertTrue(photo.is_main)
+        self.assertEqual(UserProfile.objects.get(user=self.user).avatar.name, result['main'])
+
+
+class ChunkedUploadMemoryTests(MediaTestMixin, TestCase):
+    """Пиковая память загрузки по частям не зависит от размера файла."""
+    CHUNK = 4 * 1024 * 1024
+    PEAK_LIMIT = 1024 * 1024
+
+    def test_large_chunked_upload_has_bounded_peak_memory(self):
+        user, = make_users(1)
+        UserProfile.objects.create(user=user)
+        # PNG без сжатия из шума: около 18 МБ, несколько частей по CHUNK
+        source = tempfile.NamedTemporaryFile(suffix='.png')
+        self.addCleanup(source.close)
+        Image.frombytes('RGB', (3000, 2000), random.Random(0).randbytes(3000 * 2000 * 3)).save(
+            source, format='PNG', compress_level=0)
+        size = source.tell()
+        self.assertGreater(size, 4 * self.CHUNK)
+
+        upload = uploads.start_upload(user, 'large.png', size)
+        source.seek(0)
+        tracemalloc.start()
+        try:
+            for start in range(0, size, self.CHUNK):
+                end = min(start + self.CHUNK, size) - 1
+                # Тело части читается прямо из файла, как из request.stream
+                uploads.append_chunk(upload.pk, user, f'bytes {start}-{end}/{size}', source)
+            # Временный файл удаляется после коммита; обработку фото в пуле здесь не запускаем
+            with mock.patch.object(images, 'process_photo'), self.captureOnCommitCallbacks(execute=True):
+                photo = uploads.complete_upload(upload.pk, user)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+
+        self.assertEqual(photo.image.size, size)
+        self.assertFalse(os.path.exists(uploads.temp_path(upload)))
+        self.assertLess(peak, self.PEAK_LIMIT, f'peak {peak} bytes for a {size} byte upload')
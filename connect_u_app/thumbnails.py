@@ -0,0 +1,58 @@
+# connect_u_app/thumbnails.py
+"""
+Превью аватаров для srcset.
+
+Отдельных рендишенов здесь не делается: превью - это варианты главного фото
+(PHOTO_VARIANTS в JPEG и WebP), которые фоновая обработка уже пишет в
+Photo.variants (images.py). При смене аватара Photo.variants копируются в
+UserProfile.avatar_variants (models.ensure_single_main_photo, images.finish_photo),
+поэтому srcset строится без запросов к Photo и без декодирования картинок в
+запросе. Пока фото обрабатывается или если аватар загружен не через Photo,
+показывается обычный get_avatar_url.
+"""
+from django.core.files.storage import default_storage
+
+from .images import PHOTO_VARIANTS
+
+
+def _renditions(profile):
+    """[(ширина, {jpeg: имя, webp: имя})] по возрастанию ширины; пусто - превью нет."""
+    variants = profile.avatar_variants or {}
+    name = profile.avatar.name if profile.avatar else ''
+    # Варианты другого файла: аватар сменили мимо Photo (форма профиля) или фото еще обрабатывается
+    if not name or variants.get('main') != name:
+        return []
+    widths = variants.get('widths') or {}
+    renditions = [
+        (widths.get(key) or PHOTO_VARIANTS[key], files)
+        for key, files in variants.items()
+        if isinstance(files, dict) and key != 'widths' and (key in widths or key in PHOTO_VARIANTS)
+    ]
+    return sorted(renditions, key=lambda rendition: rendition[0])
+
+
+def avatar_sources(profile):
+    """
+    src и srcset (по форматам) для аватара профиля.
+    None, если превью нет - тогда показывается обычный get_avatar_url.
+    """
+    renditions = _renditions(profile)
+    if not renditions:
+        return None
+
+    srcset = {
+        key: ', '.join(f'{default_storage.url(files[key])} {width}w' for width, files in renditions if key in files)
+        for key in ('jpeg', 'webp')
+    }
+    # src для браузеров без srcset - средний JPEG
+    _, files = renditions[len(renditions) // 2]
+    return {'src': default_storage.url(files['jpeg']), 'srcset': srcset}
+
+
+def avatar_thumbnail_url(profile, width=96):
+    """URL наименьшего JPEG-превью не уже width (для мест без srcset: JS, события чата)."""
+    renditions = _renditions(profile)
+    if not renditions:
+        return profile.get_avatar_url
+    _, files = next((rendition for rendition in renditions if rendition[0] >= width), renditions[-1])
+    return default_storage.url(files['jpeg'])
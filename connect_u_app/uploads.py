@@ -0,0 +1,144 @@
+# connect_u_app/uploads.py
+"""
+Загрузка фото по частям с докачкой.
+
+Клиент создает PhotoUpload (имя и полный размер файла), затем шлет части через
+PUT с заголовком Content-Range. Каждая часть потоком дописывается во временный
+файл на диске, поэтому в памяти процесса никогда не лежит больше одного куска
+UPLOAD_READ_SIZE. После обрыва клиент узнает offset и продолжает с него. Когда
+файл принят целиком, его заголовок проверяется (формат, число пикселей), и из
+него создается Photo - дальше работает обычная фоновая обработка images.py.
+"""
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.utils import timezone
+
+from .images import check_image_header
+from .models import Photo, PhotoUpload
+
+CHUNKED_UPLOAD_DIR = str(getattr(settings, 'CHUNKED_UPLOAD_DIR', os.path.join(settings.BASE_DIR, 'uploads_tmp')))
+CHUNKED_UPLOAD_MAX_CHUNK = getattr(settings, 'CHUNKED_UPLOAD_MAX_CHUNK', 5 * 1024 * 1024)
+PHOTO_UPLOAD_MAX_SIZE = getattr(settings, 'PHOTO_UPLOAD_MAX_SIZE', 30 * 1024 * 1024)
+UPLOAD_READ_SIZE = 64 * 1024
+
+_CONTENT_RANGE_RE = re.compile(r'^bytes (\d+)-(\d+)/(\d+)$')
+
+
+class UploadError(Exception):
+    """Ошибка загрузки; offset - сколько байт сервер уже принял (для докачки)."""
+
+    def __init__(self, message, offset=None):
+        super().__init__(message)
+        self.offset = offset
+
+
+def temp_path(upload):
+    return os.path.join(CHUNKED_UPLOAD_DIR, f'{upload.pk}.part')
+
+
+def start_upload(user, filename, size):
+    if size <= 0 or size > PHOTO_UPLOAD_MAX_SIZE:
+        raise UploadError(f'Размер файла должен быть от 1 байта до {PHOTO_UPLOAD_MAX_SIZE // (1024 * 1024)} МБ.')
+    upload = PhotoUpload.objects.create(user=user, filename=os.path.basename(filename)[:255], size=size)
+    os.makedirs(CHUNKED_UPLOAD_DIR, exist_ok=True)
+    open(temp_path(upload), 'wb').close()
+    return upload
+
+
+def parse_content_range(header):
+    """'bytes 0-1048575/5000000' -> (start, end, total); end включительно."""
+    match = _CONTENT_RANGE_RE.match(header or '')
+    if not match:
+        raise UploadError('Нужен заголовок Content-Range: bytes <start>-<end>/<total>.')
+    start, end, total = map(int, match.groups())
+    if end < start:
+        raise UploadError('Неверный Content-Range.')
+    return start, end, total
+
+
+def append_chunk(upload_id, user, content_range, stream):
+    """
+    Дописывает часть из потока stream. Часть должна начинаться ровно с текущего
+    offset: повтор уже принятой части или пропуск отклоняются с актуальным offset.
+    """
+    start, end, total = parse_content_range(content_range)
+    length = end - start + 1
+    if length > CHUNKED_UPLOAD_MAX_CHUNK:
+        raise UploadError(f'Часть больше {CHUNKED_UPLOAD_MAX_CHUNK} байт.')
+
+    with transaction.atomic():
+        # Блокировка строки: две параллельные части одной загрузки не перемешаются
+        upload = PhotoUpload.objects.select_for_update().get(pk=upload_id, user=user)
+        if total != upload.size or end >= upload.size:
+            raise UploadError('Content-Range не совпадает с размером файла.', upload.offset)
+        if start != upload.offset:
+            raise UploadError('Часть начинается не с текущего offset.', upload.offset)
+
+        received = 0
+        with open(temp_path(upload), 'r+b') as part_file:
+            part_file.seek(start)
+            while received < length:
+                piece = stream.read(min(UPLOAD_READ_SIZE, length - received))
+                if not piece:
+                    break
+                part_file.write(piece)
+                received += len(piece)
+            if received != length:
+                # Оборванную часть отбрасываем целиком, клиент повторит ее с того же offset
+                part_file.truncate(upload.offset)
+                raise UploadError('Часть получена не полностью.', upload.offset)
+
+        upload.offset = end + 1
+        upload.save(update_fields=['offset'])
+    return upload
+
+
+@transaction.atomic
+def complete_upload(upload_id, user):
+    """Проверяет принятый файл и создает из него Photo."""
+    upload = PhotoUpload.objects.select_for_update().get(pk=upload_id, user=user)
+    if upload.offset != upload.size:
+        raise UploadError('Файл загружен не полностью.', upload.offset)
+
+    path = temp_path(upload)
+    with open(path, 'rb') as part_file:
+        try:
+            check_image_header(part_file)
+        except ValueError as exc:
+            raise UploadError(str(exc))
+        # Storage копирует файл кусками; проверка пикселей уже сделана выше
+        photo = Photo(user=user)
+        photo.image.save(upload.filename, File(part_file), save=False)
+        photo.save()
+
+    upload.delete()
+    transaction.on_commit(lambda: _remove(path))
+    return photo
+
+
+def cancel_upload(upload):
+    path = temp_path(upload)
+    upload.delete()
+    _remove(path)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def clear_stale_uploads(older_than=timedelta(days=1)):
+    """Удаляет брошенные загрузки и их временные файлы. Возвращает число удаленных."""
+    stale = PhotoUpload.objects.filter(created_at__lt=timezone.now() - older_than)
+    count = 0
+    for upload in stale:
+        cancel_upload(upload)
+        count += 1
+    return count
@@ -19,6 +19,7 @@ urlpatterns = [
     path('profile/<int:user_id>/', pages.profile_view, name='profile_view'),
 
     path('search/', pages.search_view, name='search'),
+    path('search/suggest/', pages.search_suggest_view, name='search_suggest'),
 
     path('accounts/login/', RedirectView.as_view(url='/login/', permanent=False)),
     path('accounts/logout/', RedirectView.as_view(url='/logout/', permanent=False)),
@@ -27,4 +28,5 @@ urlpatterns = [
     path('api/v1/auth/jwt/refresh/', TokenRefreshView.as_view(), name='token_refresh'),
     path('matches/', pages.match_list_view, name='match_list'),
     path('chat/<int:match_id>/', pages.chat_view, name='chat'),
+    path('chat/<int:match_id>/history/', pages.chat_history_view, name='chat_history'),
 ]
\ No newline at end of file
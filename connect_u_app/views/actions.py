@@ -1,34 +1,30 @@
-from django.shortcuts import redirect, get_object_or_404
-from django.contrib import messages
+from django.shortcuts import redirect
 from django.contrib.auth.decorators import login_required
 from django.urls import reverse
-from django.db.models import F, Q
-from django.http import HttpResponse
+from django.http import HttpResponse, Http404
 
-from ..models import User, Like, Dislike, Match  # <- Добавили Match
+from ..models import User, Interaction
+from .. import swipes
 
 
 @login_required
 def like_user_view(request, user_id):
     if request.method == 'POST':
         current_user = request.user
-        liked_user = get_object_or_404(User, id=user_id)
 
-        # Создаем лайк
-        Like.objects.get_or_create(from_user=current_user, to_user=liked_user)
+        # Создаем лайк и, если он взаимный, мэтч - одной транзакцией
+        result = swipes.swipe(current_user.id, user_id, Interaction.LIKE)
+        if not result.recorded:
+            raise Http404("Пользователь не найден.")
 
-        # Проверяем, случился ли мэтч
-        if Like.objects.filter(from_user=liked_user, to_user=current_user).exists():
-            user_a, user_b = sorted([current_user, liked_user], key=lambda u: u.id)
-            match, created = Match.objects.get_or_create(user1=user_a, user2=user_b)
-
-            # Если мэтч только что создан и это HTMX-запрос
-            if created and request.htmx:
-                # Создаем HTML-ответ с модальным окном
-                html = f"""
+        # Если мэтч только что создан и это HTMX-запрос
+        if result.match_created and request.htmx:
+            liked_user = User.objects.select_related('profile').get(id=user_id)
+            # Создаем HTML-ответ с модальным окном
+            html = f"""
                 <div id="match-modal-content" hx-swap-oob="innerHTML">
                     <div class="modal-body text-center">
-                        <img src="{liked_user.profile.get_avatar_url()}" class="rounded-circle mb-3" width="120" height="120" style="object-fit: cover;">
+                        <img src="{liked_user.profile.get_avatar_url}" class="rounded-circle mb-3" width="120" height="120" style="object-fit: cover;">
                         <h4>Это мэтч!</h4>
                         <p>Теперь вы с <strong>{liked_user.profile.full_name}</strong> можете общаться.</p>
                         <div class="d-grid gap-2">
@@ -38,10 +34,10 @@ def like_user_view(request, user_id):
                     </div>
                 </div>
                 """
-                # Отправляем событие, чтобы JS показал модальное окно
-                response = HttpResponse(html)
-                response['HX-Trigger'] = 'showMatchModal'
-                return response
+            # Отправляем событие, чтобы JS показал модальное окно
+            response = HttpResponse(html)
+            response['HX-Trigger'] = 'showMatchModal'
+            return response
 
         # Если это обычный HTMX-запрос без мэтча, возвращаем пустой ответ, чтобы карточка исчезла
         if request.htmx:
@@ -54,9 +50,9 @@ def like_user_view(request, user_id):
 @login_required
 def dislike_user_view(request, user_id):
     if request.method == 'POST':
-        current_user = request.user
-        disliked_user = get_object_or_404(User, id=user_id)
-        Dislike.objects.get_or_create(from_user=current_user, to_user=disliked_user)
+        result = swipes.swipe(request.user.id, user_id, Interaction.DISLIKE)
+        if not result.recorded:
+            raise Http404("Пользователь не найден.")
 
         # Если это HTMX-запрос, возвращаем пустой ответ
         if request.htmx:
@@ -1,41 +1,40 @@
-from django.shortcuts import render, get_object_or_404
+from django.shortcuts import render
+from django.http import Http404
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.http import require_POST
 from django.contrib import messages
-from django.db.models import Q
 
-from ..models import Like, Dislike, Match, User
+from ..models import Interaction, User
+from .. import cards, fragments, recommendations, swipes
 
 def get_next_recommendation(user):
-
-    liked_user_ids = Like.objects.filter(from_user=user).values_list('to_user_id', flat=True)
-    disliked_user_ids = Dislike.objects.filter(from_user=user).values_list('to_user_id', flat=True)
-    excluded_user_ids = set(liked_user_ids) | set(disliked_user_ids)
-    excluded_user_ids.add(user.id)
-    recommended_users = User.objects.exclude(id__in=excluded_user_ids)
-    return recommended_users.order_by('?').first()
+    # Кандидат берется из буфера в кэше, без NOT IN по всей истории и без ORDER BY RANDOM();
+    # карточка получает интересы одним запросом, а HTML - из кэша фрагментов
+    candidate = recommendations.next_candidate(user)
+    if candidate is None:
+        return None
+    card = next(iter(cards.build_cards([candidate])), None)
+    if card is not None:
+        fragments.render_cards([card], fragments.NEXT_CARD)
+    return card
 
 @login_required
 @require_POST
 def like_user_view(request, pk):
 
     from_user = request.user
-    to_user = get_object_or_404(User, pk=pk)
-    is_match = False
-
-    Like.objects.update_or_create(from_user=from_user, to_user=to_user)
-    Dislike.objects.filter(from_user=from_user, to_user=to_user).delete()
+    # Реакция, проверка взаимности и мэтч - одна транзакция в сервисе свайпов
+    result = swipes.swipe(from_user.id, pk, Interaction.LIKE)
+    if not result.recorded:
+        raise Http404("Пользователь не найден.")
 
-    reciprocal_like = Like.objects.filter(from_user=to_user, to_user=from_user).exists()
-    if reciprocal_like:
-        is_match = True
-        Match.objects.get_or_create(user1=min(from_user, to_user, key=lambda u: u.id),
-                                   user2=max(from_user, to_user, key=lambda u: u.id))
+    if result.is_match:
+        to_user = User.objects.select_related('profile').get(pk=pk)
         messages.success(request, f"Это мэтч! Теперь вы можете общаться с {to_user.profile.full_name}.")
 
     next_user = get_next_recommendation(from_user)
 
-    if is_match:
+    if result.is_match:
         context = {
             'matched_user': to_user,
             'next_user': next_user,
@@ -49,9 +48,9 @@ def like_user_view(request, pk):
 def dislike_user_view(request, pk):
 
     from_user = request.user
-    to_user = get_object_or_404(User, pk=pk)
-    Dislike.objects.update_or_create(from_user=from_user, to_user=to_user)
-    Like.objects.filter(from_user=from_user, to_user=to_user).delete()
+    result = swipes.swipe(from_user.id, pk, Interaction.DISLIKE)
+    if not result.recorded:
+        raise Http404("Пользователь не найден.")
 
     next_user = get_next_recommendation(from_user)
     return render(request, 'partials/user_card.html', {'recommended_user': next_user})
@@ -2,66 +2,34 @@ from django.http import HttpResponseForbidden
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from ..models import UserProfile, Interest, User, Like, Dislike, Photo, Match, Message
+from ..models import UserProfile, Interest, User, Photo, Match, MatchMembership, Message, UserStats
 from ..forms import UserEditForm, UserProfileEditForm, PhotoForm
-from django.core.paginator import Paginator
-from datetime import date
 from ..forms import UserFilterForm
+from .. import chat, deck, fragments, presence, search
 
 
 @login_required
 def index(request):
-    current_user = request.user
-
-    # Базовый набор пользователей: активные, не суперюзеры, доступные для поиска, и не сам текущий пользователь
-    base_users = User.objects.filter(
-        is_active=True,
-        is_superuser=False,
-        profile__searchable=True
-    ).exclude(pk=current_user.pk).select_related('profile')
-
-    # Исключаем тех, с кем уже было взаимодействие (лайк/дизлайк)
-    # Используем твою существующую логику с моделями Like и Dislike
-    liked_users_ids = list(Like.objects.filter(from_user=current_user).values_list('to_user_id', flat=True))
-    disliked_users_ids = list(Dislike.objects.filter(from_user=current_user).values_list('to_user_id', flat=True))
-    interacted_users_ids = set(liked_users_ids) | set(disliked_users_ids)
-
-    recommended_users = base_users.exclude(id__in=interacted_users_ids)
-
     # --- ЛОГИКА ФИЛЬТРАЦИИ ---
     filter_form = UserFilterForm(request.GET)
-
-    if filter_form.is_valid():
-        gender = filter_form.cleaned_data.get('gender')
-        min_age = filter_form.cleaned_data.get('min_age')
-        max_age = filter_form.cleaned_data.get('max_age')
-        city = filter_form.cleaned_data.get('city')
-
-        if gender:
-            recommended_users = recommended_users.filter(gender=gender)
-
-        if city:
-            recommended_users = recommended_users.filter(profile__city__icontains=city)
-
-        today = date.today()
-        if min_age:
-            max_birth_date = today.replace(year=today.year - min_age)
-            recommended_users = recommended_users.filter(birth_date__lte=max_birth_date)
-
-        if max_age:
-            min_birth_date = today.replace(year=today.year - (max_age + 1))
-            recommended_users = recommended_users.filter(birth_date__gte=min_birth_date)
+    filters = filter_form.cleaned_data if filter_form.is_valid() else {}
 
     # --- ПАГИНАЦИЯ ---
-    paginator = Paginator(recommended_users.order_by('?'), 9)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # Лента читается из заранее перемешанной колоды по курсору, без ORDER BY RANDOM() и COUNT
+    page_obj = deck.get_page(
+        request.user,
+        filters,
+        cursor=request.GET.get('cursor'),
+        reshuffle='reshuffle' in request.GET,
+    )
+    # Карточки одинаковы для всех зрителей: HTML берется из кэша фрагментов
+    fragments.render_cards(page_obj.object_list, fragments.FEED_CARD)
 
     # Сохраняем GET-параметры фильтров для корректной работы пагинации
     filter_params = request.GET.copy()
-    if 'page' in filter_params:
-        del filter_params['page']
+    for param in ('cursor', 'reshuffle'):
+        if param in filter_params:
+            del filter_params[param]
 
     context = {
         'page_obj': page_obj,
@@ -75,16 +43,14 @@ def index(request):
 def profile_own_view(request):
     profile = get_object_or_404(UserProfile, user=request.user)
 
-    # Считаем лайки, дизлайки и мэтчи для текущего пользователя
-    likes_given_count = Like.objects.filter(from_user=request.user).count()
-    dislikes_given_count = Dislike.objects.filter(from_user=request.user).count()
-    matches_count = Match.objects.filter(Q(user1=request.user) | Q(user2=request.user)).count()
+    # Лайки, дизлайки и мэтчи берем из денормализованных счетчиков одним чтением по PK
+    stats, _ = UserStats.objects.get_or_create(user=request.user)
 
     context = {
         'profile': profile,
-        'likes_given_count': likes_given_count,
-        'dislikes_given_count': dislikes_given_count,
-        'matches_count': matches_count,
+        'likes_given_count': stats.likes_given,
+        'dislikes_given_count': stats.dislikes_given,
+        'matches_count': stats.matches_count,
     }
     return render(request, 'account/profile_own.html', context)
 
@@ -139,7 +105,7 @@ def photo_gallery_view(request):
             photo = photo_form.save(commit=False)
             photo.user = request.user
             photo.save()
-            messages.success(request, 'Фото успешно загружено!')
+            messages.success(request, 'Фото загружено и обрабатывается.')
             return redirect('photo_gallery')
     else:
         photo_form = PhotoForm()
@@ -153,59 +119,93 @@ def photo_gallery_view(request):
 
 @login_required
 def search_view(request):
-    query = request.GET.get('q', '')
-    results = []
-
-    if query:
-        results = UserProfile.objects.filter(
-            full_name__icontains=query
-        ).exclude(user=request.user)
+    query = request.GET.get('q', '').strip()
+    results = search.search_profiles(request.user, query, cursor=request.GET.get('cursor'))
 
     context = {
         'query': query,
         'results': results
     }
+    # Кнопка "Показать еще" догружает только следующую порцию карточек
+    if request.htmx and request.GET.get('cursor'):
+        return render(request, 'partials/search_results.html', context)
     return render(request, 'search.html', context)
 
 
+@login_required
+def search_suggest_view(request):
+    query = request.GET.get('q', '')
+    context = {
+        'query': query,
+        'suggestions': search.suggest(request.user, query),
+    }
+    return render(request, 'partials/search_suggestions.html', context)
+
+
 @login_required
 def match_list_view(request):
-    matches_qs = Match.objects.filter(
-        Q(user1=request.user) | Q(user2=request.user)
-    ).select_related('user1__profile', 'user2__profile').order_by('-created_at')
-
-    matches_list = []
-    for match in matches_qs:
-        if request.user == match.user1:
-            match.other_user = match.user2
-        else:
-            match.other_user = match.user1
-        matches_list.append(match)
+    # Один запрос при любом числе мэтчей: строки членства уже знают собеседника,
+    # непрочитанные и время активности (индекс user, -last_activity_at), а сводка
+    # по последнему сообщению лежит в самом мэтче
+    memberships = MatchMembership.objects.filter(
+        user=request.user
+    ).select_related('match', 'other_user__profile').order_by('-last_activity_at')
 
     context = {
-        'matches': matches_list
+        'matches': memberships
     }
     return render(request, 'matches.html', context)
 
 
+def _chat_membership(user, match_id):
+    """Строка членства пользователя в мэтче и ответ с ошибкой, если доступа нет."""
+    membership = MatchMembership.objects.filter(
+        match_id=match_id, user=user
+    ).select_related('match', 'other_user__profile').first()
+
+    if membership is None:
+        get_object_or_404(Match, id=match_id)
+        return None, HttpResponseForbidden("У вас нет доступа к этому чату.")
+    return membership, None
+
+
+def _other_last_read(membership):
+    # До какого сообщения собеседник прочитал чат (отметка на своих сообщениях)
+    return MatchMembership.objects.filter(
+        match_id=membership.match_id, user_id=membership.other_user_id
+    ).values_list('last_read_message_id', flat=True).first()
+
+
 @login_required
 def chat_view(request, match_id):
-    match = get_object_or_404(Match, id=match_id)
+    membership, error = _chat_membership(request.user, match_id)
+    if error:
+        return error
 
-    if request.user != match.user1 and request.user != match.user2:
-        return HttpResponseForbidden("У вас нет доступа к этому чату.")
+    # Только последние сообщения; более старые догружаются при прокрутке вверх
+    context = {
+        'match': membership.match,
+        'other_user': membership.other_user,
+        'messages': chat.message_history(membership.match),
+        'last_read_id': _other_last_read(membership),
+        'presence_heartbeat': presence.PRESENCE_HEARTBEAT,
+    }
+    return render(request, 'chat.html', context)
 
-    # ВОТ ЭТА СТРОКА БЫЛА СЛОМАНА. ТЕПЕРЬ ОНА ИСПРАВЛЕНА.
-    other_user = match.user2 if request.user == match.user1 else match.user1
 
-    messages = match.messages.all().select_related('sender__profile')
+@login_required
+def chat_history_view(request, match_id):
+    """Порция более старых сообщений для HTMX (курсор before)."""
+    membership, error = _chat_membership(request.user, match_id)
+    if error:
+        return error
 
     context = {
-        'match': match,
-        'other_user': other_user,
-        'messages': messages
+        'match': membership.match,
+        'messages': chat.message_history(membership.match, before=request.GET.get('before')),
+        'last_read_id': _other_last_read(membership),
     }
-    return render(request, 'chat.html', context)
+    return render(request, 'partials/chat_messages.html', context)
 
 
 @login_required
@@ -220,10 +220,7 @@ def profile_view(request, user_id):
     profile = get_object_or_404(UserProfile, user=viewed_user)
 
     # Проверяем, есть ли уже мэтч между пользователями
-    is_match = Match.objects.filter(
-        (Q(user1=request.user) & Q(user2=viewed_user)) |
-        (Q(user1=viewed_user) & Q(user2=request.user))
-    ).exists()
+    is_match = MatchMembership.objects.filter(user=request.user, other_user=viewed_user).exists()
 
     context = {
         'profile': profile,